@@ -54,6 +54,7 @@ from .application import (
 from .routing import (
     Router,
     RouterMeta,
+    VirtualHostRouter,
     routerclass,
     get_routing_attributes,
     MiddlewareChain,
@@ -72,4 +73,5 @@ __all__ = [
     "Growler",
     "Application",
     "Router",
+    "VirtualHostRouter",
 ]
@@ -0,0 +1,288 @@
+#
+# growler/aio/executor.py
+#
+"""
+Executors for running blocking, synchronous middleware off of the
+event loop.
+
+A :class:`MiddlewareExecutor` wraps a standard library
+:mod:`concurrent.futures` executor, providing an awaitable
+:method:`MiddlewareExecutor.run` method and keeping simple metrics
+(pending calls, queue depth and wait times) of the work submitted.
+
+Routes are marked to be run in an executor upon registration:
+
+.. code:: python
+
+    app.get('/report', build_report, executor='thread')
+
+The name is looked up in the application's executors
+(see :method:`growler.Application.get_executor`).
+"""
+
+import time
+import asyncio
+from concurrent.futures import Future
+from functools import partial, update_wrapper
+from inspect import iscoroutinefunction
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def _timed_call(func, *args):
+    """
+    Calls func with args, returning the time at which the call
+    started along with the result.
+    Defined at module level so it may be pickled by process pools.
+    """
+    return time.time(), func(*args)
+
+
+class MiddlewareExecutor:
+    """
+    Base class of the executors used to offload work from the event
+    loop.
+    Subclasses set the `executor_class` attribute to the
+    :class:`concurrent.futures.Executor` type to construct.
+
+    The underlying executor is created upon first use.
+
+    Attributes:
+        max_workers (int): The number of workers of the pool
+        submitted (int): Total number of calls submitted
+        completed (int): Number of calls which finished without error
+        failed (int): Number of calls which raised an exception
+        pending (int): Number of submitted calls not yet finished
+        wait_time_total (float): Sum of seconds calls have spent
+            waiting in the queue before starting
+        wait_time_max (float): Longest time (seconds) a call has waited
+    """
+
+    executor_class = None
+
+    def __init__(self, max_workers=None, **executor_options):
+        """
+        Args:
+            max_workers (int or None): The maximum number of workers.
+                If None, a default based on cpu count is used.
+            **executor_options: Forwarded to the executor constructor
+        """
+        self.max_workers = max_workers or self.default_max_workers()
+        self.executor_options = executor_options
+        self._executor = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.pending = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @staticmethod
+    def default_max_workers():
+        from os import cpu_count
+        return min(32, (cpu_count() or 1) + 4)
+
+    @property
+    def executor(self):
+        """
+        The concurrent.futures executor, created on first access.
+        """
+        if self._executor is None:
+            self._executor = self.executor_class(max_workers=self.max_workers,
+                                                 **self.executor_options)
+        return self._executor
+
+    async def run(self, func, *args):
+        """
+        Run func(*args) in the executor, returning the result.
+
+        Args:
+            func (callable): The (blocking) function to call
+            *args: Positional arguments passed to func
+
+        Returns:
+            The value returned by func
+        """
+        submitted_at = time.time()
+        self.submitted += 1
+        self.pending += 1
+        future = self.executor.submit(_timed_call, func, *args)
+        try:
+            started_at, result = await asyncio.wrap_future(future)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        wait = max(0.0, started_at - submitted_at)
+        self.wait_time_total += wait
+        self.wait_time_max = max(self.wait_time_max, wait)
+        return result
+
+    @property
+    def queue_depth(self):
+        """
+        Number of calls submitted but waiting for a free worker.
+        """
+        return max(0, self.pending - self.max_workers)
+
+    @property
+    def mean_wait_time(self):
+        """
+        Average time (seconds) a completed call waited before starting.
+        """
+        return self.wait_time_total / self.completed if self.completed else 0.0
+
+    def stats(self):
+        """
+        Returns dict of the executor's metrics.
+        """
+        return {
+            'max_workers': self.max_workers,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'pending': self.pending,
+            'queue_depth': self.queue_depth,
+            'wait_time_mean': self.mean_wait_time,
+            'wait_time_max': self.wait_time_max,
+        }
+
+    def shutdown(self, wait=True):
+        """
+        Shuts down the underlying executor, if it has been created.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+class ThreadPoolMiddlewareExecutor(MiddlewareExecutor):
+    """
+    Runs calls in a bounded pool of threads; suited for blocking
+    libraries (file & database access, etc).
+    """
+    executor_class = ThreadPoolExecutor
+
+
+class ProcessPoolMiddlewareExecutor(MiddlewareExecutor):
+    """
+    Runs calls in a pool of processes; suited for CPU bound work.
+
+    The function and arguments must be picklable, so request and
+    response objects cannot be sent to these workers.
+    Use :method:`run` from within a handler instead:
+
+    >>> async def get_report(req, res):
+    >>>     pool = req.app.get_executor('process')
+    >>>     res.send_json(await pool.run(crunch_numbers, req.query))
+    """
+    executor_class = ProcessPoolExecutor
+
+    @staticmethod
+    def default_max_workers():
+        from os import cpu_count
+        return cpu_count() or 1
+
+
+EXECUTOR_TYPES = {
+    'thread': ThreadPoolMiddlewareExecutor,
+    'process': ProcessPoolMiddlewareExecutor,
+}
+
+
+class LoopResponse:
+    """
+    Proxy of a response, given to handlers running in executor threads.
+
+    asyncio transports are not thread-safe, so the methods sending data
+    (send_text, send_json, end, write_chunk, render, ...) are not run
+    by the worker: each call is passed to the event loop with
+    call_soon_threadsafe, and the worker waits for its result (or
+    exception). Other attributes are read and set on the response
+    directly.
+    """
+
+    SEND_METHODS = frozenset([
+        'end',
+        'end_chunks',
+        'json',
+        'redirect',
+        'render',
+        'send',
+        'send_continue_message',
+        'send_file',
+        'send_headers',
+        'send_html',
+        'send_json',
+        'send_prebuilt',
+        'send_text',
+        'write',
+        'write_chunk',
+        'write_eof',
+    ])
+
+    def __init__(self, res, loop):
+        object.__setattr__(self, '_res', res)
+        object.__setattr__(self, '_loop', loop)
+
+    def __getattr__(self, name):
+        value = getattr(self._res, name)
+        if name in self.SEND_METHODS and callable(value):
+            return partial(self._call_in_loop, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._res, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._res, name)
+
+    def _call_in_loop(self, func, *args, **kwargs):
+        future = Future()
+
+        def call():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        self._loop.call_soon_threadsafe(call)
+        return future.result()
+
+
+class ExecutorMiddleware:
+    """
+    Middleware wrapping a synchronous function, which is called in an
+    executor rather than on the event loop.
+
+    The function is given a :class:`LoopResponse` in place of the
+    response, so the data it sends is written by the event loop.
+
+    The executor may be a :class:`MiddlewareExecutor` object, or the
+    name of one of the application's executors (True selecting the
+    application's default); names are looked up upon each request via
+    ``req.app.get_executor``.
+    """
+
+    def __init__(self, func, executor=True):
+        if iscoroutinefunction(func):
+            raise TypeError("Coroutine %r should not be run in an executor" % func)
+        if executor == 'process':
+            raise TypeError("Request and response objects cannot be sent to "
+                            "a process pool; call the 'process' executor's "
+                            "run method from the handler instead")
+        update_wrapper(self, func)
+        self.func = func
+        self.executor = executor
+
+    def __call__(self, req, res):
+        executor = self.executor
+        if not isinstance(executor, MiddlewareExecutor):
+            executor = req.app.get_executor(executor)
+        proxy = LoopResponse(res, asyncio.get_running_loop())
+        return executor.run(self.func, req, proxy)
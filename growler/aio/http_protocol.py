@@ -12,6 +12,11 @@ try:
 except ImportError:
     from asyncio import ensure_future as create_task, Future  # type: ignore
 
+try:
+    from asyncio import eager_task_factory, get_running_loop
+except ImportError:
+    eager_task_factory = None
+
 from .protocol import GrowlerProtocol
 from growler.http.responder import GrowlerHTTPResponder
 from growler.http.response import HTTPResponse
@@ -154,12 +159,40 @@ class GrowlerHTTPProtocol(GrowlerProtocol):
         """
         Entry point for the application middleware chain for an asyncio
         event loop.
+
+        By default the whole chain is scheduled as a new task.
+        If the application has enabled the 'inline_middleware' option,
+        middleware is instead run directly from :method:`data_received`
+        and a task is only created for the remainder of the chain once
+        a middleware returns an awaitable.
         """
-        # Add the middleware processing to the event loop - this *should*
-        # change the call stack so any server errors do not link back to this
-        # function
-        coro = self.http_application.handle_client_request(req, res)
-        create_task(coro)
+        app = self.http_application
+
+        if not app.enabled('inline_middleware'):
+            # Add the middleware processing to the event loop - this *should*
+            # change the call stack so any server errors do not link back to
+            # this function
+            coro = app.handle_client_request(req, res)
+            create_task(coro)
+            return
+
+        pending = app.start_client_request(req, res)
+        if pending is not None:
+            self.create_eager_task(pending)
+
+    @staticmethod
+    def create_eager_task(coro):
+        """
+        Schedules the coroutine on the running loop.
+        Where supported (Python 3.12+) the task is started eagerly, so
+        a coroutine which finishes without suspending never touches
+        the loop's scheduler.
+        """
+        if eager_task_factory is None:
+            return create_task(coro)
+
+        loop = get_running_loop()
+        return eager_task_factory(loop, coro)
 
     def body_storage_pair(self):
         """
@@ -0,0 +1,204 @@
+#
+# growler/aio/limiter.py
+#
+"""
+Concurrency limits for routes and routers.
+
+A :class:`ConcurrencyLimiter` allows a fixed number of requests to be
+handled at once.
+Additional requests wait in a bounded queue, ordered by priority, and
+requests arriving when the queue is full are immediately answered
+with '503 - Service Unavailable'.
+
+Limits are defined upon registration:
+
+.. code:: python
+
+    api = Router(concurrency=32, max_queue=128)
+    api.get('/healthz', healthz, priority='critical')
+    api.get('/report', report, concurrency=2, max_queue=4, priority='bulk')
+"""
+
+import heapq
+from enum import IntEnum
+from itertools import count
+from asyncio import CancelledError, get_running_loop
+from functools import update_wrapper
+from inspect import isawaitable
+
+
+class Priority(IntEnum):
+    """
+    Standard priority classes of waiting requests; higher values are
+    scheduled first.
+    """
+    BULK = 0
+    NORMAL = 10
+    HIGH = 20
+    CRITICAL = 30
+
+    @classmethod
+    def get(cls, value):
+        """
+        Converts a name (case insensitive) or number to a priority
+        value, None mapping to NORMAL.
+        """
+        if value is None:
+            return cls.NORMAL
+        if isinstance(value, str):
+            return cls[value.upper()]
+        return int(value)
+
+
+class ConcurrencyLimiter:
+    """
+    A semaphore with a bounded, priority ordered, wait queue.
+
+    Attributes:
+        max_concurrent (int): Number of holders allowed at once
+        max_queue (int or None): Maximum number of waiters; None
+            allows an unbounded queue
+        active (int): Current number of holders
+        waiting (int): Current number of waiters
+        rejected (int): Number of acquisitions refused as the queue
+            was full
+    """
+
+    def __init__(self, max_concurrent, max_queue=None):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be positive")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._waiters = []
+        self._counter = count()
+
+    def try_acquire(self):
+        """
+        Takes a slot if one is free and nobody is waiting.
+
+        Returns:
+            bool: True if the slot was acquired
+        """
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            return True
+        return False
+
+    @property
+    def is_full(self):
+        """
+        True if no more requests may wait for a slot.
+        """
+        return self.max_queue is not None and self.waiting >= self.max_queue
+
+    async def acquire(self, priority=Priority.NORMAL):
+        """
+        Waits for a slot. Waiters of higher priority are woken first,
+        waiters of equal priority in order of arrival.
+        Callers should check :attr:`is_full` beforehand.
+        """
+        if self.try_acquire():
+            return
+
+        future = get_running_loop().create_future()
+        entry = (-priority, next(self._counter), future)
+        heapq.heappush(self._waiters, entry)
+        self.waiting += 1
+        try:
+            await future
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed to us as we were cancelled
+                self.release()
+            else:
+                self.waiting -= 1
+            raise
+
+    def release(self):
+        """
+        Frees a slot, handing it directly to the next waiter if there
+        is one.
+        """
+        while self._waiters:
+            *_, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.waiting -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        """
+        Returns dict of the limiter's metrics.
+        """
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+        }
+
+
+class LimitedMiddleware:
+    """
+    Middleware wrapper which holds a slot of a ConcurrencyLimiter while
+    the wrapped function runs.
+    If no slot is available and the limiter's queue is full, a 503
+    response is sent immediately.
+    """
+
+    retry_after = 1
+
+    def __init__(self, func, limiter, priority=None):
+        update_wrapper(self, func)
+        self.func = func
+        self.limiter = limiter
+        self.priority = Priority.get(priority)
+
+    def __call__(self, req, res):
+        limiter = self.limiter
+
+        if not limiter.try_acquire():
+            if limiter.is_full:
+                limiter.rejected += 1
+                self.send_overflow(req, res)
+                return None
+            return self._wait_and_call(req, res)
+
+        try:
+            ret_val = self.func(req, res)
+        except BaseException:
+            limiter.release()
+            raise
+
+        if isawaitable(ret_val):
+            return self._release_after(ret_val)
+
+        limiter.release()
+        return None
+
+    async def _wait_and_call(self, req, res):
+        await self.limiter.acquire(self.priority)
+        try:
+            ret_val = self.func(req, res)
+            if isawaitable(ret_val):
+                await ret_val
+        finally:
+            self.limiter.release()
+
+    async def _release_after(self, awaitable):
+        try:
+            await awaitable
+        finally:
+            self.limiter.release()
+
+    def send_overflow(self, req, res):
+        """
+        Sends the response to a request refused by the limiter.
+        """
+        res.headers['Retry-After'] = str(self.retry_after)
+        res.send_text("503 - Service Unavailable", 503)
@@ -0,0 +1,325 @@
+#
+# growler/aio/redis.py
+#
+"""
+A minimal asyncio client of the Redis wire protocol (RESP), written
+for growler's session backends and free of third party dependencies.
+
+Commands are not sent one at a time: every command issued during an
+iteration of the event loop is queued, and the queue is written to a
+pooled connection in a single pipelined batch, the replies read back
+in order. Many concurrent requests loading or saving sessions thus
+share a handful of round trips.
+
+.. code:: python
+
+    client = RedisClient('localhost', 6379, pool_size=4)
+    await client.execute('SET', 'key', 'value', 'EX', 60)
+    value = await client.execute('GET', 'key')
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """
+    An error reply sent by the server.
+    """
+
+
+def encode_command(*args):
+    """
+    Returns the RESP encoding of a command - an array of bulk strings.
+    Arguments which are not bytes are converted with str() and encoded
+    as utf-8.
+    """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, (bytes, bytearray, memoryview)):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n' % len(arg))
+        parts.append(bytes(arg))
+        parts.append(b'\r\n')
+    return b''.join(parts)
+
+
+async def read_reply(reader):
+    """
+    Reads one reply from the stream reader.
+
+    Bulk strings are returned as bytes, simple strings as str, integers
+    as int, arrays as lists, and nulls as None. Error replies are
+    *returned* as RedisError objects, so a failed command does not
+    prevent reading the replies pipelined after it.
+
+    Raises:
+        ConnectionError: If the connection is closed, or the reply is
+            malformed
+    """
+    line = await reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("Redis connection closed")
+
+    kind, value = line[:1], line[1:-2]
+    if kind == b'+':
+        return value.decode()
+    if kind == b'-':
+        return RedisError(value.decode())
+    if kind == b'_':
+        return None
+    if kind not in (b'$', b':', b'*'):
+        raise ConnectionError("Invalid Redis reply %r" % line)
+
+    number = _reply_number(line)
+    if kind == b':':
+        return number
+    if number < 0:
+        return None
+    if kind == b'$':
+        data = await reader.readexactly(number + 2)
+        return data[:-2]
+    return [await read_reply(reader) for _ in range(number)]
+
+
+def _reply_number(line):
+    try:
+        return int(line[1:-2])
+    except ValueError:
+        raise ConnectionError("Invalid Redis reply %r" % line) from None
+
+
+class RedisConnection:
+    """
+    A single connection to a Redis server.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port, *, db=0, password=None, ssl=None):
+        """
+        Connects to the server, authenticating and selecting the
+        database if required.
+
+        Raises:
+            RedisError: If the server refuses AUTH or SELECT
+        """
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl)
+        conn = cls(reader, writer)
+
+        setup = []
+        if password is not None:
+            setup.append(('AUTH', password))
+        if db:
+            setup.append(('SELECT', db))
+        if setup:
+            for reply in await conn.pipeline(setup):
+                if isinstance(reply, RedisError):
+                    conn.close()
+                    raise reply
+        return conn
+
+    async def pipeline(self, commands):
+        """
+        Sends all commands with a single write, then returns the list
+        of their replies.
+        """
+        self.writer.write(b''.join(encode_command(*cmd) for cmd in commands))
+        await self.writer.drain()
+        return [await read_reply(self.reader) for _ in commands]
+
+    @property
+    def closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisClient:
+    """
+    Pooled, pipelining Redis client.
+
+    Commands passed to :meth:`execute` are queued and sent as a batch
+    (of at most `max_batch` commands) once the current iteration of the
+    event loop is done. Each batch is written to a connection from a
+    pool of at most `pool_size` connections, which are opened upon
+    demand.
+
+    Commands of one batch are executed in order; separate batches may
+    run concurrently on different connections.
+
+    Attributes:
+        commands (int): Number of commands sent
+        batches (int): Number of pipelined round trips
+        connections (int): Number of connections opened
+        errors (int): Number of batches failed by connection errors
+    """
+
+    def __init__(self,
+                 host='localhost',
+                 port=6379,
+                 *,
+                 db=0,
+                 password=None,
+                 ssl=None,
+                 pool_size=4,
+                 max_batch=256):
+        """
+        Args:
+            host (str): The server's hostname
+            port (int): The server's port
+            db (int): Database number to select
+            password (str or None): Password to AUTH with
+            ssl: SSL context of the connections, if any
+            pool_size (int): Maximum number of open connections
+            max_batch (int): Maximum number of commands per round trip
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.ssl = ssl
+        self.pool_size = pool_size
+        self.max_batch = max_batch
+
+        self._queue = []
+        self._flush_scheduled = False
+        self._idle = []
+        self._semaphore = None
+        self._tasks = set()
+
+        self.commands = 0
+        self.batches = 0
+        self.connections = 0
+        self.errors = 0
+        self.log = logger.getChild("id=%x" % id(self))
+
+    async def execute(self, *args):
+        """
+        Queues the command to be sent with the next batch, and returns
+        its reply.
+
+        Raises:
+            RedisError: If the server replied with an error
+            ConnectionError: If the connection failed
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((args, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        self._flush_scheduled = False
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), self.max_batch):
+            task = asyncio.ensure_future(self._send(queue[start:start + self.max_batch]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        batch = [(args, future) for args, future in batch if not future.cancelled()]
+        if not batch:
+            return
+
+        try:
+            conn = await self._acquire()
+        except Exception as err:
+            self.errors += 1
+            self._fail(batch, err)
+            return
+
+        try:
+            replies = await conn.pipeline([args for args, _ in batch])
+        except Exception as err:
+            self.errors += 1
+            self.log.warning("Redis connection failed: %s", err)
+            conn.close()
+            self._fail(batch, err)
+            return
+        except BaseException:
+            # cancelled: unread replies would be taken for the next batch's
+            conn.close()
+            for _, future in batch:
+                future.cancel()
+            raise
+        finally:
+            self._release(conn)
+
+        self.commands += len(batch)
+        self.batches += 1
+        self._resolve(batch, replies)
+
+    @staticmethod
+    def _resolve(batch, replies):
+        for (_, future), reply in zip(batch, replies):
+            if future.done():
+                continue
+            if isinstance(reply, RedisError):
+                future.set_exception(reply)
+            else:
+                future.set_result(reply)
+
+    @staticmethod
+    def _fail(batch, err):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(err)
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+        await self._semaphore.acquire()
+
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.closed:
+                return conn
+
+        try:
+            conn = await RedisConnection.open(self.host, self.port,
+                                              db=self.db,
+                                              password=self.password,
+                                              ssl=self.ssl)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.connections += 1
+        return conn
+
+    def _release(self, conn):
+        if not conn.closed:
+            self._idle.append(conn)
+        self._semaphore.release()
+
+    async def close(self):
+        """
+        Waits for queued commands to be sent, then closes the pooled
+        connections.
+        """
+        if self._queue:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._idle:
+            self._idle.pop().close()
+
+    def stats(self):
+        """
+        Returns dict of the client's metrics.
+        """
+        return {
+            'commands': self.commands,
+            'batches': self.batches,
+            'connections': self.connections,
+            'idle_connections': len(self._idle),
+            'errors': self.errors,
+        }
@@ -86,6 +86,11 @@ class Application:
     function. There is no timeout variable yet, but I think I will
     put one in later, to ensure that the middleware is as responsive
     as the dev expects.
+
+    Enabling the 'inline_middleware' option (``app.enable(...)``) runs
+    the chain directly upon receiving the request headers, only
+    creating a task once a middleware returns an awaitable; see
+    :method:`start_client_request`.
     """
 
     error_recursion_max_depth = 10
@@ -159,6 +164,7 @@ class Application:
 
         self.events = Events()
         self.strict_router_check = False
+        self.executors = {}
 
         self._request_class = request_class
         self._response_class = response_class
@@ -179,7 +185,7 @@ class Application:
     # , but that would not allow the user to switch the root router (easily)
     #
 
-    def all(self, path="/", middleware=None):
+    def all(self, path="/", middleware=None, **options):
         """
         An alias of the default router's 'all' method. The middleware
         provided is called upon any HTTP request that matching the
@@ -189,10 +195,12 @@ class Application:
             path (str): The URL path on which the middleware is mounted
             middleware (callable): The middleware function called upon
                 a request matching the url
+            **options: Per-route options, see
+                :method:`growler.Router.route_middleware`
         """
-        return self.router.all(path, middleware)
+        return self.router.all(path, middleware, **options)
 
-    def get(self, path="/", middleware=None):
+    def get(self, path="/", middleware=None, **options):
         """
         An alias call for simple access to the default router. The
         middleware provided is called upon any HTTP 'GET' request which
@@ -202,10 +210,12 @@ class Application:
             path (str): The URL path on which the middleware is mounted
             middleware (callable): The middleware function called upon
                 a request matching the url
+            **options: Per-route options, see
+                :method:`growler.Router.route_middleware`
         """
-        return self.router.get(path, middleware)
+        return self.router.get(path, middleware, **options)
 
-    def post(self, path="/", middleware=None):
+    def post(self, path="/", middleware=None, **options):
         """
         An alias of the default router's 'post' method. The middleware
         provided is called upon a POST HTTP request matching the path.
@@ -214,10 +224,12 @@ class Application:
             path (str): The URL path on which the middleware is mounted
             middleware (callable): The middleware function called upon
                 a request matching the url
+            **options: Per-route options, see
+                :method:`growler.Router.route_middleware`
         """
-        return self.router.post(path, middleware)
+        return self.router.post(path, middleware, **options)
 
-    def put(self, path="/", middleware=None):
+    def put(self, path="/", middleware=None, **options):
         """
         An alias of the default router's 'put' method. The middleware
         provided is called upon a PUT HTTP request matching the path.
@@ -226,10 +238,12 @@ class Application:
             path (str): The URL path on which the middleware is mounted
             middleware (callable): The middleware function called upon
                 a request matching the url
+            **options: Per-route options, see
+                :method:`growler.Router.route_middleware`
         """
-        return self.router.put(path, middleware)
+        return self.router.put(path, middleware, **options)
 
-    def delete(self, path="/", middleware=None):
+    def delete(self, path="/", middleware=None, **options):
         """
         An alias of the default router's 'delete' method.
         The middleware provided is called upon a DELETE HTTP request
@@ -239,10 +253,13 @@ class Application:
             path (str): The URL path on which the middleware is mounted
             middleware (callable): The middleware function called upon
                 a request matching the url
+            **options: Per-route options, see
+                :method:`growler.Router.route_middleware`
         """
-        return self.router.delete(path, middleware)
+        return self.router.delete(path, middleware, **options)
 
-    def use(self, middleware=None, path='/', method_mask=HTTPMethod.ALL):
+    def use(self, middleware=None, path='/', method_mask=HTTPMethod.ALL,
+            *, provides=None, needs=None):
         """
         Use the middleware (a callable with parameters res, req, next)
         upon requests match the provided path.
@@ -265,6 +282,16 @@ class Application:
                 (e.g. `HTTPMethod.GET + HTTPMethod.POST`,
                       `HTTPMethod.ALL - HTTPMethod.DELETE`).
 
+            provides (Optional[str or iterable]): Names of what the
+                middleware provides to later middleware (e.g.
+                'session').
+
+            needs (Optional[str or iterable]): Names of what the
+                middleware requires from earlier middleware.
+                Consecutive middleware declaring `provides` or `needs`
+                are run concurrently where their dependencies allow
+                (see :class:`growler.routing.ConcurrentMiddleware`).
+
         Returns:
             Returns the provided middleware; a requirement for this method
             to be used as a decorator.
@@ -272,7 +299,8 @@ class Application:
 
         # catch decorator pattern
         if middleware is None:
-            return lambda mw: self.use(mw, path, method_mask)
+            return lambda mw: self.use(mw, path, method_mask,
+                                       provides=provides, needs=needs)
 
         if hasattr(middleware, '__growler_router'):
             router = getattr(middleware, '__growler_router')
@@ -284,12 +312,14 @@ class Application:
             self.add_router(path, router)
         elif hasattr(middleware, '__iter__'):
             for mw in middleware:
-                self.use(mw, path, method_mask)
+                self.use(mw, path, method_mask, provides=provides, needs=needs)
         else:
             self.log.info("Using %s on path %r", middleware, path)
             self.middleware.add(path=path,
                                 func=middleware,
-                                method_mask=method_mask)
+                                method_mask=method_mask,
+                                provides=provides,
+                                needs=needs)
         return middleware
 
     def add_router(self, path, router):
@@ -382,21 +412,61 @@ class Application:
                 methods for sending headers and data back to the client.
         """
 
+        pending = self.start_client_request(req, res)
+        if pending is not None:
+            await pending
+
+    def start_client_request(self, req, res):
+        """
+        Synchronous entry point for the request + response middleware
+        chain.
+        Middleware is called directly, in the caller's stack, until the
+        response has ended, the chain is exhausted, or a middleware
+        returns an awaitable object.
+        In the last case a coroutine which awaits that object and
+        finishes the chain is returned; the caller is responsible for
+        scheduling it.
+        If the chain completes without suspending, None is returned,
+        so a chain of purely synchronous middleware requires no task
+        to be created.
+
+        This is used by :class:`growler.aio.GrowlerHTTPProtocol` when
+        the 'inline_middleware' option is enabled, and by
+        :method:`handle_client_request`.
+
+        Args:
+            req (growler.HTTPRequest): The incoming request
+            res (growler.HTTPResponse): The outgoing response
+
+        Returns:
+            Optional[Coroutine]: The remainder of the middleware
+                chain, or None if the request has been handled.
+        """
+
         # TODO: Move to a "default" root middleware function
-        if req.headers.get("EXPECT") == "100-continue" and self.config.get("autohandle_expect", True):
+        if (req.headers.get("EXPECT") == "100-continue"
+                and self.config.get("autohandle_expect", True)
+                and not res.has_sent_continue):
             res.send_continue_message()
 
         # create a middleware generator
         mw_generator = self.middleware(req.method, req.path)
 
+        return self._step_middleware(req, res, mw_generator, iter(mw_generator))
+
+    def _step_middleware(self, req, res, mw_generator, mw_iter):
+        """
+        Calls middleware from mw_iter until the response has ended or
+        a middleware returns an awaitable.
+        Returns None when finished, otherwise a coroutine completing
+        the chain.
+        """
         # loop through middleware
-        for mw in mw_generator:
+        for mw in mw_iter:
 
             # try calling the function
             try:
                 ret_val = mw(req, res)
-                if inspect.isawaitable(ret_val):
-                    await ret_val
 
             # special exception - immediately stop the loop
             #  - do not check if res has sent
@@ -406,15 +476,58 @@ class Application:
             # on an unhandled exception - notify the generator of the error
             except Exception as error:
                 mw_generator.throw(error)
-                await self.handle_server_error(req, res, mw_generator, error)
-                return
+                return self.handle_server_error(req, res, mw_generator, error)
+
+            if not inspect.isawaitable(ret_val):
+                ret_val = self._pop_pending(res)
+
+            if inspect.isawaitable(ret_val):
+                return self._await_middleware(req, res, mw_generator, mw_iter, ret_val)
 
             if res.has_ended:
-                break
+                return None
 
         if not res.has_ended:
             self.handle_response_not_sent(req, res)
 
+        return None
+
+    async def _await_middleware(self, req, res, mw_generator, mw_iter, awaitable):
+        """
+        Awaits the value returned by a middleware function, then
+        continues along the middleware chain.
+        """
+        try:
+            await awaitable
+            pending = self._pop_pending(res)
+            if pending is not None:
+                await pending
+        except GrowlerStopIteration:
+            return
+        except Exception as error:
+            mw_generator.throw(error)
+            await self.handle_server_error(req, res, mw_generator, error)
+            return
+
+        if res.has_ended:
+            return
+
+        pending = self._step_middleware(req, res, mw_generator, mw_iter)
+        if pending is not None:
+            await pending
+
+    @staticmethod
+    def _pop_pending(res):
+        """
+        Returns (and clears) the awaitable still sending the response,
+        if any (see :attr:`growler.http.HTTPResponse.pending`).
+        """
+        pending = getattr(res, 'pending', None)
+        if pending is None or not inspect.isawaitable(pending):
+            return None
+        res.pending = None
+        return pending
+
     async def handle_server_error(self,
                                   req,
                                   res,
@@ -429,7 +542,8 @@ class Application:
         If an error occurs during this method,
 
         There is currently no way to do error recovery of the middleware
-        chain.
+        chain. If the response's headers have already been sent, the
+        connection is aborted instead.
 
         Args:
             req (growler.HTTPRequest): The incoming request, containing
@@ -454,6 +568,13 @@ class Application:
         if err_count >= self.error_recursion_max_depth:
             raise Exception("Too many exceptions:" + error)
 
+        # a response whose headers were already sent (e.g. a streamed
+        # one) cannot be replaced by an error page
+        if res.has_sent_headers and not res.has_ended:
+            self.log.error("Aborting response already started: %r", error)
+            res.abort()
+            return
+
         for mw in mw_generator:
             try:
                 if inspect.iscoroutinefunction(mw):
@@ -600,6 +721,41 @@ class Application:
         except KeyError:
             return None
 
+    def get_executor(self, name=True):
+        """
+        Returns the application's executor with the given name,
+        creating one upon first request of the standard names
+        'thread' and 'process'.
+        Custom executors may be added to the :attr:`executors` dict.
+
+        The size of created pools is taken from the 'executor_workers'
+        configuration option (default depends on cpu count).
+
+        Args:
+            name (str or bool): Name of the executor. If True or None,
+                the 'default_executor' configuration option is used,
+                falling back to 'thread'.
+
+        Returns:
+            growler.aio.executor.MiddlewareExecutor: The executor
+
+        Raises:
+            KeyError: If there is no executor with the name.
+        """
+        if name is True or name is None:
+            name = self.config.get('default_executor', 'thread')
+
+        try:
+            return self.executors[name]
+        except KeyError:
+            pass
+
+        from .aio.executor import EXECUTOR_TYPES
+        executor_type = EXECUTOR_TYPES[name]
+        executor = executor_type(self.config.get('executor_workers'))
+        self.executors[name] = executor
+        return executor
+
     #
     # dict-like access for application configuration options
     #
@@ -12,6 +12,7 @@ from pathlib import Path
 from itertools import chain
 from datetime import datetime
 from collections import OrderedDict
+from http.cookies import SimpleCookie
 from growler.http import HttpStatus
 from growler.utils.event_manager import Events
 from wsgiref.handlers import format_date_time as format_RFC_1123
@@ -34,6 +35,11 @@ class HTTPResponse:
     res.render("template_name", data) to automatically render a web view and
     send it to.
 
+    A helper which sends the response asynchronously (such as rendering
+    in an executor) sets `pending` to the awaitable sending it; the
+    middleware chain awaits it after the middleware which started it
+    returns, so synchronous middleware may use such helpers.
+
     Parameters
     ----------
     protocol : GrowlerHTTPProtocol
@@ -55,6 +61,9 @@ class HTTPResponse:
     message = ''
     EOL = ''
     phrase = None
+    body_encoder = None
+    pending = None
+    _cookies = None
 
     def __init__(self, protocol, EOL="\r\n"):
         self.protocol = protocol
@@ -63,6 +72,31 @@ class HTTPResponse:
         self.headers = Headers()
         self.events = Events()
 
+    @property
+    def cookies(self):
+        """
+        The cookies to send to the client, a SimpleCookie created upon
+        first access; only then is the Set-Cookie header installed.
+        """
+        if self._cookies is None:
+            self.cookies = SimpleCookie()
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, cookies):
+        self._cookies = cookies
+        self.headers['Set-Cookie'] = self._set_cookie_header
+
+    def _set_cookie_header(self):
+        """
+        Returns the value(s) of the Set-Cookie header, or None if no
+        cookies were set.
+        """
+        if not self._cookies:
+            return None
+        sep = self.EOL + 'Set-Cookie: '
+        return sep.join(morsel.OutputString() for morsel in self._cookies.values())
+
     def _set_default_headers(self):
         """
         Create some default headers that should be sent along with every HTTP
@@ -70,7 +104,9 @@ class HTTPResponse:
         """
         self.headers.setdefault('Date', self.get_current_time)
         self.headers.setdefault('Server', self.SERVER_INFO)
-        self.headers.setdefault('Content-Length', "%d" % len(self.message))
+        # a 304 describes the (unsent) body of a 200, not its own
+        if 'Transfer-Encoding' not in self.headers and self.status_code != 304:
+            self.headers.setdefault('Content-Length', "%d" % len(self.message))
         if self.app.enabled('x-powered-by'):
             self.headers.setdefault('X-Powered-By', 'Growler')
 
@@ -82,6 +118,7 @@ class HTTPResponse:
         self._set_default_headers()
         header_str = self.status_line + self.EOL + str(self.headers)
         self.stream.write(header_str.encode())
+        self.has_sent_headers = True
         self.events.sync_emit('after_headers')
 
     def write(self, msg=None):
@@ -89,6 +126,63 @@ class HTTPResponse:
         msg = msg.encode() if isinstance(msg, str) else msg
         self.stream.write(msg)
 
+    def write_chunk(self, data, flush=False):
+        """
+        Sends part of a streamed response body, using the chunked
+        transfer-encoding. The headers are sent before the first chunk.
+
+        If a body_encoder (such as a compressor) has been installed, the
+        data passes through it first, and encoders may buffer the data
+        until flushed.
+
+        Parameters
+        ----------
+        data : bytes or str
+            The body data to send
+        flush : bool, optional
+            Force the body_encoder to output all the data given so far,
+            e.g. to send the beginning of a page to the client early.
+        """
+        if not self.has_sent_headers:
+            self.headers['Transfer-Encoding'] = 'chunked'
+            self.message = b''
+            self.send_headers()
+
+        data = data.encode() if isinstance(data, str) else data
+        encoder = self.body_encoder
+        if encoder is not None:
+            data = encoder.compress(data)
+            if flush:
+                data += encoder.flush()
+        self._write_chunk_frame(data)
+
+    def end_chunks(self):
+        """
+        Finishes a response started with :meth:`write_chunk`, sending
+        any data buffered by the body_encoder and the terminating
+        zero-length chunk.
+        """
+        if not self.has_sent_headers:
+            self.write_chunk(b'')
+        if self.body_encoder is not None:
+            self._write_chunk_frame(self.body_encoder.finish())
+        self.stream.write(b"0\r\n\r\n")
+        self.write_eof()
+
+    def abort(self):
+        """
+        Closes the connection without completing the response; used
+        when an error occurs after the headers of a streamed response
+        were sent, as the client must not take the truncated body for
+        the complete one.
+        """
+        self.stream.abort()
+        self.has_ended = True
+
+    def _write_chunk_frame(self, data):
+        if data:
+            self.stream.write(b"%x\r\n%b\r\n" % (len(data), data))
+
     def write_eof(self):
         if self.stream.can_write_eof():
             self.stream.write_eof()
@@ -246,6 +340,37 @@ class HTTPResponse:
         self.write()
         self.write_eof()
 
+    def send_prebuilt(self, prebuilt):
+        """
+        Sends a response which was serialized ahead of time, with a
+        single write to the transport; only the Date header is added.
+
+        If headers were set on this response object, or 'headers' event
+        listeners (e.g. compression) are installed, the prebuilt headers
+        are merged under them, the listeners are called and the header
+        block is serialized again.
+
+        Parameters
+        ----------
+        prebuilt : PrebuiltResponse
+            The response to send
+        """
+        self.status_code = prebuilt.status_code
+        self.message = prebuilt.body
+        if self.headers.items() or self.events.has_listeners('headers'):
+            for key, value in prebuilt.headers.items():
+                self.headers.setdefault(key, value)
+            self.events.sync_emit('headers')
+            self._set_default_headers()
+            header_str = self.status_line + self.EOL + str(self.headers)
+            data = header_str.encode() + self.message
+        else:
+            data = prebuilt.serialize(self.app.enabled('x-powered-by'))
+        self.stream.write(data)
+        self.has_sent_headers = True
+        self.events.sync_emit('after_headers')
+        self.write_eof()
+
     def send_continue_message(self):
         """
         Sends the "100 CONTINUE" code to the client, usually in
@@ -324,6 +449,25 @@ class Headers:
         ci_key = key.casefold()
         del self._header_data[ci_key]
 
+    def __contains__(self, key):
+        return self.escape(key).casefold() in self._header_data
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under key, or default if not present.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        """
+        Returns list of (key, value) pairs, with keys in the case they
+        were first set.
+        """
+        return list(self._header_data.values())
+
     def setdefault(self, key, default=None):
         key = self.escape(key)
         ci_key = key.casefold()
@@ -399,9 +543,10 @@ class Headers:
                 value = _str_value(value())
             return value
 
-        s = self.EOL.join(("{key}: {value}".format(key=key,
-                                                   value=_str_value(value))
-                           for key, value in self._header_data.values()
+        # callables evaluating to None omit their header
+        values = ((key, _str_value(value)) for key, value in self._header_data.values())
+        s = self.EOL.join(("{key}: {value}".format(key=key, value=value)
+                           for key, value in values
                            if value is not None))
         return s + (self.EOL * 2)
 
@@ -415,3 +560,95 @@ class Headers:
 
     def __str__(self):
         return self.stringify()
+
+
+_date_cache = (None, b'')
+
+
+def current_date_bytes():
+    """
+    Returns the RFC 1123 formatted, encoded, current time; formatted at
+    most once per second.
+    """
+    global _date_cache
+    now = int(time.time())
+    second, value = _date_cache
+    if second != now:
+        value = format_RFC_1123(now).encode()
+        _date_cache = (now, value)
+    return value
+
+
+class PrebuiltResponse:
+    """
+    A constant response - status line, headers and body - serialized
+    once, upon construction.
+    Sending requires only joining the cached bytes with the current
+    Date header (see :meth:`HTTPResponse.send_prebuilt`).
+
+    Instances are middleware, so may be used directly as routes:
+
+    >>> app.get('/robots.txt', PrebuiltResponse("User-agent: *\nDisallow:"))
+    >>> app.get('/healthz', static_response='ok')
+
+    Parameters
+    ----------
+    body : bytes or str
+        The body of the response; str is encoded as utf-8
+    status : int, optional
+        The HTTP status code, defaults to 200 (OK)
+    content_type : str, optional
+        Value of the Content-Type header
+    headers : dict, optional
+        Additional headers to send
+    """
+
+    def __init__(self, body, status=200, content_type='text/plain', headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.body = bytes(body)
+        self.status_code = status
+
+        self.headers = Headers(headers or {})
+        self.headers.setdefault('Server', HTTPResponse.SERVER_INFO)
+        if content_type is not None:
+            self.headers.setdefault('Content-Type', content_type)
+        self.headers['Content-Length'] = "%d" % len(self.body)
+
+        status_line = "HTTP/1.1 %d %s\r\n" % (status, HttpStatus(status).phrase)
+        header_block = self.headers.stringify()[:-2]
+        self._head = (status_line + header_block).encode()
+        self._tail = b"\r\n" + self.body
+        self._powered_head = self._head + b"X-Powered-By: Growler\r\n"
+
+    @classmethod
+    def from_value(cls, value):
+        """
+        Builds a PrebuiltResponse from value, which may already be one,
+        a str or bytes (sent as text/plain), or a dict or list (sent as
+        application/json).
+        """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, (dict, list)):
+            return cls(json.dumps(value), content_type='application/json')
+        if isinstance(value, (str, bytes, bytearray)):
+            return cls(value)
+        raise TypeError("Cannot build a static response from %r" % type(value))
+
+    @property
+    def nbytes(self):
+        """
+        Number of bytes held by the serialized response.
+        """
+        return len(self._powered_head) + len(self._tail)
+
+    def serialize(self, powered_by=False):
+        """
+        Returns the complete response as bytes, with the current date.
+        """
+        head = self._powered_head if powered_by else self._head
+        return b''.join((head, b"Date: ", current_date_bytes(), b"\r\n", self._tail))
+
+    def __call__(self, req, res):
+        res.send_prebuilt(self)
@@ -11,7 +11,14 @@ others to extend growler middleware with their own packages.
 import growler
 
 from .auth import Auth
-from .static import Static
+from .cache import ResponseCache
+from .coalesce import RequestCoalescer
+from .compress import Compression
+from .etag import ETag
+from .static import (
+    Static,
+    AssetManifest,
+)
 from .logger import Logger
 from .renderer import (
     Renderer,
@@ -21,7 +28,14 @@ from .session import (
     Session,
     SessionStorage,
     DefaultSessionStorage,
+    BoundedSessionStore,
+    CookieSessionStorage,
+    SessionBackend,
+    BackendSessionStorage,
+    RedisSessionBackend,
 )
+from .template import TemplateEngine
+from .sessionlog import SessionLogStore
 from .cookieparser import CookieParser
 from .responsetime import ResponseTime
 
@@ -0,0 +1,301 @@
+#
+# growler/middleware/bundle.py
+#
+"""
+Packing a tree of static files into a single 'bundle' file, which is
+memory-mapped and served without opening or stat-ing any file upon
+requests.
+
+Bundles are built ahead of time:
+
+.. code:: bash
+
+    $ python -m growler.middleware.bundle public/ public.bundle --compress gzip
+
+and served with :class:`StaticBundle` (or :meth:`Static.from_bundle`):
+
+.. code:: python
+
+    app.use(Static.from_bundle('public.bundle'))
+
+Layout of a bundle: a fixed size header (magic, format version, offset
+and length of the index), the contents of every file (and compressed
+variants) back to back, then the index - a JSON object mapping each
+URL path to the offsets, sizes, ETag and type of its contents.
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import logging
+import mimetypes
+from hashlib import blake2b
+
+from .compress import Compression, negotiate, zstd
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GRWLBNDL'
+VERSION = 1
+HEADER = struct.Struct('<8sIQQ')
+
+
+class BundleEntry:
+    """
+    A file stored in a bundle.
+
+    Attributes:
+        offset (int): Position of the file's contents in the bundle
+        size (int): Length of the file's contents
+        etag (str): The file's (quoted) ETag, derived from the contents
+        mime (str or None): The file's content type
+        variants (dict): Compressed variants of the file, mapping
+            encoding to (offset, size)
+    """
+
+    __slots__ = ('offset', 'size', 'etag', 'mime', 'variants')
+
+    def __init__(self, offset, size, etag, mime, variants=None):
+        self.offset = offset
+        self.size = size
+        self.etag = etag
+        self.mime = mime
+        self.variants = variants or {}
+
+    def to_json(self):
+        return [self.offset, self.size, self.etag, self.mime, self.variants]
+
+
+class Bundle:
+    """
+    Read-only, memory-mapped, bundle file.
+    """
+
+    def __init__(self, filename):
+        """
+        Args:
+            filename (str or Path): The bundle file to map
+
+        Raises:
+            ValueError: If the file is not a bundle of a supported
+                version.
+        """
+        self.filename = str(filename)
+        with open(self.filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        try:
+            magic, version, index_offset, index_length = HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%r is not a growler bundle (version %d)"
+                             % (self.filename, VERSION))
+
+        raw_index = self._map[index_offset:index_offset + index_length]
+        self.index = {url: BundleEntry(*values)
+                      for url, values in json.loads(raw_index.decode()).items()}
+
+    def get(self, url):
+        """
+        Returns the BundleEntry stored at url, or None.
+        """
+        return self.index.get(url)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def view(self, offset, size):
+        """
+        Returns a memoryview of size bytes of the bundle, starting at
+        offset; no data is copied.
+        """
+        return self._view[offset:offset + size]
+
+    def close(self):
+        """
+        Unmaps the bundle. If slices are still in use (e.g. by
+        responses being sent), the map is released once they are
+        garbage collected instead.
+        """
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            pass
+
+
+class StaticBundle:
+    """
+    Middleware serving the files of a :class:`Bundle`, sending slices of
+    the memory map.
+    Compressed variants stored in the bundle are sent to clients
+    accepting them.
+
+    Attributes:
+        bundle (Bundle): The mapped bundle
+        hits (int): Number of files sent
+        misses (int): Number of requests not matching a file
+    """
+
+    def __init__(self, filename):
+        self.bundle = Bundle(filename)
+        self.hits = 0
+        self.misses = 0
+        self.log = logger.getChild("id=%x" % id(self))
+        self.log.info("Serving %d static files from bundle %r",
+                      len(self.bundle), self.bundle.filename)
+
+    def __call__(self, req, res):
+        entry = self.bundle.get(req.path)
+        if entry is None:
+            self.misses += 1
+            return
+        self.hits += 1
+
+        offset, size, etag = entry.offset, entry.size, entry.etag
+        if entry.variants:
+            res.headers['Vary'] = 'Accept-Encoding'
+            accept_encoding = req.headers.get('ACCEPT-ENCODING', None) or ''
+            encoding = negotiate(accept_encoding, tuple(entry.variants))
+            if encoding is not None:
+                offset, size = entry.variants[encoding]
+                etag = etag[:-1] + '-' + encoding + '"'
+                res.headers['Content-Encoding'] = encoding
+
+        res.headers['Etag'] = etag
+        if req.headers.get('IF-NONE-MATCH', None) == etag:
+            res.status_code = 304
+            res.end()
+            return
+
+        res.set_type(entry.mime)
+        res.message = self.bundle.view(offset, size)
+        res.status_code = 200
+        res.end()
+
+    def stats(self):
+        """
+        Returns dict of the middleware's metrics.
+        """
+        return {
+            'files': len(self.bundle),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def close(self):
+        self.bundle.close()
+
+
+def build_bundle(directory, output, *, encodings=(), min_size=256, levels=None):
+    """
+    Packs the files under directory into the bundle file output.
+
+    Args:
+        directory (str or Path): Root of the tree to pack; files are
+            stored at their URL path relative to it.
+        output (str or Path): The bundle file to write
+        encodings (iterable of str): Also store variants compressed
+            with these encodings ('gzip', 'zstd') of compressible files
+            at least min_size bytes long, when smaller.
+        min_size (int): Smallest file to compress
+        levels (dict or None): Compression level of each encoding
+
+    Returns:
+        int: The number of files packed
+    """
+    from .static import _compress_file_data
+
+    levels = dict({'gzip': 9, 'zstd': 19}, **(levels or {}))
+    encodings = [enc for enc in encodings if enc != 'zstd' or zstd is not None]
+    root = os.path.abspath(str(directory))
+    output = os.path.abspath(str(output))
+
+    index = {}
+    with open(output, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        offset = HEADER.size
+
+        def append(data):
+            nonlocal offset
+            start = offset
+            out.write(data)
+            offset += len(data)
+            return [start, len(data)]
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, root)
+            url_dir = '/' if rel_dir == '.' else '/' + rel_dir.replace(os.sep, '/') + '/'
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if path == output:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+
+                mime = mimetypes.guess_type(filename)[0]
+                etag = '"%s"' % blake2b(data, digest_size=8).hexdigest()
+                start, size = append(data)
+
+                variants = {}
+                if len(data) >= min_size and Compression.is_compressible(mime):
+                    for encoding in encodings:
+                        compressed = _compress_file_data(data, encoding, levels[encoding])
+                        if len(compressed) < len(data):
+                            variants[encoding] = append(compressed)
+
+                index[url_dir + filename] = BundleEntry(start, size, etag, mime, variants)
+
+        raw_index = json.dumps({url: e.to_json() for url, e in index.items()},
+                               separators=(',', ':')).encode()
+        index_offset = offset
+        out.write(raw_index)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, VERSION, index_offset, len(raw_index)))
+
+    return len(index)
+
+
+def main(argv=None):
+    """
+    Command line interface building a bundle.
+    """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(
+        prog="python -m growler.middleware.bundle",
+        description="Pack a directory of static files into a growler bundle",
+    )
+    parser.add_argument('directory', help="Root directory of the static files")
+    parser.add_argument('output', help="Bundle file to write")
+    parser.add_argument('--compress',
+                        default='',
+                        help="Comma separated encodings (gzip,zstd) of "
+                             "compressed variants to store")
+    parser.add_argument('--min-size',
+                        type=int,
+                        default=256,
+                        help="Smallest file (bytes) to compress")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error("'%s' is not a directory" % args.directory)
+
+    encodings = [enc.strip() for enc in args.compress.split(',') if enc.strip()]
+    count = build_bundle(args.directory, args.output,
+                         encodings=encodings,
+                         min_size=args.min_size)
+    print("Packed %d files into %s" % (count, args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
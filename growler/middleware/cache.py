@@ -0,0 +1,374 @@
+#
+# growler/middleware/cache.py
+#
+"""
+Middleware storing complete responses in memory, so repeated requests
+for the same resource are answered without running the handler.
+
+.. code:: python
+
+    app.use(ResponseCache(max_bytes=32 * 2**20, vary=['Accept']))
+
+    @app.get('/items')
+    def get_items(req, res):
+        res.set('Cache-Control', 'max-age=5, stale-while-revalidate=30')
+        res.send_json(load_items())
+"""
+
+import time
+import asyncio
+import logging
+from types import SimpleNamespace
+from weakref import WeakSet
+from collections import OrderedDict
+
+from growler.http import HTTPMethod
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    """
+    A serialized response: status, headers and body bytes.
+
+    Headers which are specific to one response (Date, Content-Length
+    and Set-Cookie) and headers with callable values are not stored.
+    """
+
+    __slots__ = (
+        'status',
+        'headers',
+        'body',
+        'size',
+        'created',
+        'ttl',
+        'stale_ttl',
+        'refreshing',
+    )
+
+    EXCLUDED_HEADERS = frozenset(('date', 'content-length', 'set-cookie'))
+
+    def __init__(self, status, headers, body, ttl=0, stale_ttl=0):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers)
+        self.created = time.monotonic()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refreshing = False
+
+    @classmethod
+    def from_response(cls, res, **kwargs):
+        """
+        Build from a response which has been sent.
+        """
+        body = res.message
+        if isinstance(body, str):
+            body = body.encode()
+        headers = [(key, value)
+                   for key, value in res.headers.items()
+                   if isinstance(value, str)
+                   and key.casefold() not in cls.EXCLUDED_HEADERS]
+        return cls(res.status_code, headers, bytes(body), **kwargs)
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created
+
+    def send(self, res):
+        """
+        Sends the stored response using res. Headers already set on
+        res take precedence over the stored headers.
+        """
+        for key, value in self.headers:
+            res.headers.setdefault(key, value)
+        res.status_code = self.status
+        res.message = self.body
+        res.end()
+
+
+def parse_cache_control(value):
+    """
+    Parses a Cache-Control header into a dict of lowercase directive
+    names to values (None for directives without a value).
+    """
+    directives = {}
+    for directive in value.split(','):
+        name, _, arg = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def parse_vary(value):
+    """
+    Returns the sorted tuple of (upper case) request header names
+    listed in a Vary header, or None for 'Vary: *'.
+    """
+    names = {name.strip().upper() for name in (value or '').split(',')}
+    names.discard('')
+    if '*' in names:
+        return None
+    return tuple(sorted(names))
+
+
+class ResponseCache:
+    """
+    Middleware caching responses of idempotent requests in memory.
+
+    Responses are keyed by method, path, query and the values of the
+    configured 'vary' request headers, and are stored as variants for
+    the values of the request headers named by the response's Vary
+    header (e.g. Accept-Encoding, when behind Compression). Responses
+    with 'Vary: *' are not stored.
+    Only responses with a cacheable status are stored, for as long as
+    the response's Cache-Control header allows (s-maxage or max-age;
+    no-store, no-cache and private responses are not stored), or for
+    `default_ttl` seconds if there is no such header.
+
+    Once an entry has expired, it may still be served for the
+    response's 'stale-while-revalidate' seconds, while a single
+    background request refreshes the entry.
+
+    Total size of stored responses is limited to `max_bytes`; least
+    recently used entries are evicted first.
+
+    Attributes:
+        hits (int): Number of fresh responses served
+        stale_hits (int): Number of stale responses served
+        misses (int): Number of requests passed on to the handler
+        evictions (int): Number of entries removed to stay in bounds
+        size (int): Total (approximate) bytes of stored responses
+    """
+
+    def __init__(self,
+                 max_bytes=64 * 2**20,
+                 *,
+                 default_ttl=0,
+                 stale_while_revalidate=0,
+                 vary=(),
+                 methods=HTTPMethod.GET | HTTPMethod.HEAD,
+                 statuses=(200, 203, 301, 404, 410),
+                 max_entry_size=None):
+        """
+        Args:
+            max_bytes (int): Memory bound of the stored responses
+            default_ttl (float): Seconds to store responses which do
+                not provide a Cache-Control max-age.
+            stale_while_revalidate (float): Seconds an expired response
+                may be served if not given by the Cache-Control header
+            vary (iterable of str): Request header names which are
+                part of the key
+            methods (HTTPMethod): Mask of request methods to cache
+            statuses (iterable of int): Status codes to cache
+            max_entry_size (int or None): Largest response to store,
+                defaults to an eighth of max_bytes
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_size = max_entry_size or max_bytes // 8
+        self.default_ttl = default_ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.vary = tuple(name.upper() for name in vary)
+        self.methods = methods
+        self.statuses = frozenset(statuses)
+
+        self.entries = OrderedDict()
+        # request headers each key's responses vary on, and the number
+        # of entries of the key
+        self._vary_names = {}
+        self.size = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._refresh_responses = WeakSet()
+        self.log = logger.getChild("id=%x" % id(self))
+
+    def cache_key(self, req):
+        """
+        Returns the key identifying the response to req.
+        """
+        query = tuple(sorted((k, tuple(v)) for k, v in req.query.items()))
+        varying = tuple(req.headers.get(name) for name in self.vary)
+        return (req.method, req.path, query, varying)
+
+    @staticmethod
+    def variant_key(key, names, req):
+        """
+        Returns the key of the entry of the response to req which
+        varies on the request headers names.
+        """
+        return (key, names, tuple(req.headers.get(name) for name in names))
+
+    def __call__(self, req, res):
+        if not (req.method & self.methods):
+            return
+
+        key = self.cache_key(req)
+
+        if res in self._refresh_responses:
+            self.capture(key, req, res)
+            return
+
+        names, _ = self._vary_names.get(key, ((), 0))
+        entry_key = self.variant_key(key, names, req)
+        entry = self.entries.get(entry_key)
+        if entry is not None:
+            age = entry.age
+            if age < entry.ttl:
+                self.hits += 1
+                self.entries.move_to_end(entry_key)
+                self.send_entry(entry, res, age)
+                return
+
+            if age < entry.ttl + entry.stale_ttl:
+                self.stale_hits += 1
+                self.entries.move_to_end(entry_key)
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    self.refresh(req, res, entry)
+                self.send_entry(entry, res, age)
+                return
+
+            self.remove(entry_key)
+
+        self.misses += 1
+        self.capture(key, req, res)
+
+    @staticmethod
+    def send_entry(entry, res, age):
+        res.headers['Age'] = "%d" % age
+        entry.send(res)
+
+    def capture(self, key, req, res):
+        """
+        Stores the response in the cache once it has been sent.
+        """
+        res.events.on('after_send', lambda: self.store(key, req, res))
+
+    def store(self, key, req, res):
+        """
+        Adds the (sent) response to the cache, if its status and
+        headers allow.
+        """
+        if res.status_code not in self.statuses:
+            return
+
+        # the chunks of streamed responses are not kept in res.message
+        if 'Transfer-Encoding' in res.headers:
+            return
+
+        cache_control = parse_cache_control(res.headers.get('Cache-Control') or '')
+        if {'no-store', 'no-cache', 'private'} & cache_control.keys():
+            return
+
+        try:
+            ttl = float(cache_control.get('s-maxage')
+                        or cache_control.get('max-age')
+                        or self.default_ttl)
+            stale_ttl = float(cache_control.get('stale-while-revalidate')
+                              or self.stale_while_revalidate)
+        except ValueError:
+            return
+
+        if ttl <= 0 and stale_ttl <= 0:
+            return
+
+        names = parse_vary(res.headers.get('Vary'))
+        if names is None:
+            return
+
+        entry = CachedResponse.from_response(res, ttl=ttl, stale_ttl=stale_ttl)
+        if entry.size > self.max_entry_size:
+            return
+
+        entry_key = self.variant_key(key, names, req)
+        self.remove(entry_key)
+        count = self._vary_names.get(key, (names, 0))[1]
+        self._vary_names[key] = (names, count + 1)
+        self.entries[entry_key] = entry
+        self.size += entry.size
+
+        while self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, entry_key):
+        """
+        Removes the entry stored under entry_key, if there is one.
+        """
+        entry = self.entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        key = entry_key[0]
+        names, count = self._vary_names[key]
+        if count > 1:
+            self._vary_names[key] = (names, count - 1)
+        else:
+            del self._vary_names[key]
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        self.entries.clear()
+        self._vary_names.clear()
+        self.size = 0
+
+    def refresh(self, req, res, entry):
+        """
+        Runs the request through the application again, in the
+        background, with a response which stores the result in the
+        cache instead of sending it to the client.
+        """
+        transport = _DiscardTransport()
+        protocol = SimpleNamespace(transport=transport,
+                                   http_application=req.app)
+        refresh_res = res.__class__(protocol)
+        self._refresh_responses.add(refresh_res)
+
+        def on_done(_):
+            entry.refreshing = False
+
+        task = asyncio.ensure_future(req.app.handle_client_request(req, refresh_res))
+        task.add_done_callback(on_done)
+        return task
+
+    def stats(self):
+        """
+        Returns dict of the cache's metrics.
+        """
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class _DiscardTransport:
+    """
+    Write transport of background refresh responses; the response is
+    captured by the cache, not sent anywhere.
+    """
+
+    def write(self, data):
+        pass
+
+    def can_write_eof(self):
+        return True
+
+    def write_eof(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
@@ -0,0 +1,191 @@
+#
+# growler/middleware/coalesce.py
+#
+"""
+Middleware merging concurrent identical requests, so the handler runs
+once and every waiting client receives a copy of its response.
+
+.. code:: python
+
+    app.use(RequestCoalescer())
+    app.use(ResponseCache())
+"""
+
+import time
+import asyncio
+import logging
+
+from growler.http import HTTPMethod
+from .cache import CachedResponse, parse_vary
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """
+    A request being handled, along with the futures of the requests
+    waiting on its response.
+    """
+
+    __slots__ = ('started', 'waiters', 'headers')
+
+    def __init__(self, headers):
+        self.started = time.monotonic()
+        self.waiters = []
+        self.headers = headers
+
+
+class RequestCoalescer:
+    """
+    Middleware performing 'single-flight' handling of idempotent
+    requests.
+
+    The first request with a given key (the 'leader') continues down
+    the middleware chain as usual.
+    Requests with the same key arriving before the leader's response is
+    sent (the 'followers') wait for it, and are answered with a copy of
+    its status, headers and body; headers the follower has already set
+    are kept.
+
+    Only complete responses with one of the `statuses` are shared;
+    followers of a leader answered otherwise (e.g. an error, or a
+    '304 - Not Modified' to its own conditional request), or of one
+    taking longer than `timeout` seconds, continue down the middleware
+    chain themselves. So do followers whose request headers named by
+    the response's Vary header differ from the leader's.
+
+    Requests carrying credentials (any of the `private_headers`) may
+    receive responses specific to their user, so are never merged.
+
+    Attributes:
+        leaders (int): Number of requests passed on to the handler
+        coalesced (int): Number of requests answered with a leader's
+            response
+        fallbacks (int): Number of followers which had to run the
+            handler themselves
+    """
+
+    def __init__(self,
+                 key=None,
+                 *,
+                 methods=HTTPMethod.GET | HTTPMethod.HEAD,
+                 timeout=30.0,
+                 statuses=(200, 203, 204, 300, 301, 308),
+                 vary=('Accept-Encoding', ),
+                 private_headers=('Authorization', 'Cookie')):
+        """
+        Args:
+            key (callable or None): Function returning the (hashable)
+                key of a request; requests with equal keys are merged.
+                Defaults to the method, path, query and the values of
+                the vary headers.
+            methods (HTTPMethod): Mask of request methods to merge
+            timeout (float): Seconds followers wait for the leader
+            statuses (iterable of int): Status codes of responses
+                shared with followers
+            vary (iterable of str): Request header names which are
+                part of the default key
+            private_headers (iterable of str): Request header names
+                whose presence prevents merging the request
+        """
+        if key is not None:
+            self.key = key
+        self.methods = methods
+        self.timeout = timeout
+        self.statuses = frozenset(statuses)
+        self.vary = tuple(name.upper() for name in vary)
+        self.private_headers = tuple(name.upper() for name in private_headers)
+
+        self.in_flight = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+        self.log = logger.getChild("id=%x" % id(self))
+
+    def key(self, req):
+        """
+        Default key: the request method, path, sorted query and the
+        values of the vary headers.
+        """
+        query = tuple(sorted((k, tuple(v)) for k, v in req.query.items()))
+        varying = tuple(req.headers.get(name) for name in self.vary)
+        return (req.method, req.path, query, varying)
+
+    def __call__(self, req, res):
+        if not (req.method & self.methods):
+            return None
+
+        if any(req.headers.get(name) for name in self.private_headers):
+            return None
+
+        key = self.key(req)
+        flight = self.in_flight.get(key)
+
+        # a leader which never answered must not block the key forever
+        if flight is not None and time.monotonic() - flight.started > self.timeout:
+            flight = None
+
+        if flight is None:
+            self.lead(key, req, res)
+            return None
+
+        waiter = asyncio.get_running_loop().create_future()
+        flight.waiters.append(waiter)
+        return self.follow(req, res, waiter, flight)
+
+    def lead(self, key, req, res):
+        """
+        Registers res as the leader of key, sharing its response with
+        the followers once sent.
+        """
+        self.leaders += 1
+        flight = self.in_flight[key] = _Flight(req.headers)
+
+        def on_send():
+            if self.in_flight.get(key) is flight:
+                del self.in_flight[key]
+            if not flight.waiters:
+                return
+            shared, names = None, parse_vary(res.headers.get('Vary'))
+            if (res.status_code in self.statuses
+                    and 'Transfer-Encoding' not in res.headers
+                    and names is not None):
+                shared = CachedResponse.from_response(res)
+            for waiter in flight.waiters:
+                if not waiter.done():
+                    waiter.set_result((shared, names))
+
+        res.events.on('after_send', on_send)
+
+    async def follow(self, req, res, waiter, flight):
+        """
+        Waits for the leader's response and sends a copy of it, or
+        returns without sending, if it was not shared in time or
+        varies on request headers differing from the leader's.
+        """
+        try:
+            shared, names = await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            shared = None
+
+        if shared is not None and any(req.headers.get(name) != flight.headers.get(name)
+                                      for name in names):
+            shared = None
+
+        if shared is None:
+            self.fallbacks += 1
+            return
+
+        self.coalesced += 1
+        shared.send(res)
+
+    def stats(self):
+        """
+        Returns dict of the coalescer's metrics.
+        """
+        return {
+            'in_flight': len(self.in_flight),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'fallbacks': self.fallbacks,
+        }
@@ -0,0 +1,329 @@
+#
+# growler/middleware/compress.py
+#
+"""
+Middleware compressing response bodies with an encoding accepted by
+the client (zstd, gzip or deflate).
+
+.. code:: python
+
+    app.use(Compression(min_size=512, adaptive=True))
+
+Complete responses (send_text, send_json, send_html, ...) are
+compressed in one pass, while responses streamed with
+:meth:`HTTPResponse.write_chunk` are compressed incrementally.
+"""
+
+import zlib
+import logging
+from asyncio import get_running_loop
+
+try:
+    from compression import zstd
+except ImportError:  # pragma: no cover
+    zstd = None
+
+logger = logging.getLogger(__name__)
+
+
+class ZlibEncoder:
+    """
+    Incremental gzip or deflate (zlib wrapped) body encoder.
+    """
+
+    WBITS = {
+        'gzip': 16 + zlib.MAX_WBITS,
+        'deflate': zlib.MAX_WBITS,
+    }
+
+    def __init__(self, encoding, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, self.WBITS[encoding])
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class ZstdEncoder:
+    """
+    Incremental zstd body encoder.
+    """
+
+    def __init__(self, encoding, level):
+        self._obj = zstd.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush(zstd.ZstdCompressor.FLUSH_FRAME)
+
+
+ENCODERS = {
+    'gzip': ZlibEncoder,
+    'deflate': ZlibEncoder,
+}
+
+if zstd is not None:
+    ENCODERS['zstd'] = ZstdEncoder
+
+
+def parse_accept_encoding(value):
+    """
+    Parses an Accept-Encoding header into a dict of lowercase coding
+    names to their q-value.
+    """
+    codings = {}
+    for item in value.split(','):
+        name, *params = item.split(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, val = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        codings[name] = q
+    return codings
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    Returns the first of encodings with the highest q-value in the
+    Accept-Encoding header, or None if the client accepts none of them.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class Compression:
+    """
+    Middleware compressing responses using the best encoding accepted
+    by the client.
+
+    Responses are left uncompressed if they already have a
+    Content-Encoding, have a content type which is already compressed
+    (images, video, archives, ...), are complete and smaller than
+    `min_size` bytes, or are not successful.
+
+    A strong ETag (e.g. from the ETag middleware) of a compressed
+    response is made weak, as the encoded bytes differ from the
+    identity representation it was computed for; so is that of a
+    '304 - Not Modified' response which may have been compressed.
+
+    With `adaptive` enabled, the event loop's scheduling lag is
+    sampled, and while it exceeds `lag_threshold` seconds responses are
+    compressed at the MIN_LEVELS instead, trading bandwidth for CPU
+    time.
+
+    Attributes:
+        compressed (int): Number of responses compressed
+        bytes_in (int): Size of complete responses before compression
+        bytes_out (int): Size of complete responses after compression
+        lag (float): Most recent event loop lag sample (seconds)
+    """
+
+    DEFAULT_LEVELS = {
+        'zstd': 3,
+        'gzip': 6,
+        'deflate': 6,
+    }
+
+    MIN_LEVELS = {
+        'zstd': 1,
+        'gzip': 1,
+        'deflate': 1,
+    }
+
+    COMPRESSED_TYPES = (
+        'image/',
+        'video/',
+        'audio/',
+        'font/woff',
+        'application/zip',
+        'application/gzip',
+        'application/x-gzip',
+        'application/zstd',
+        'application/x-bzip2',
+        'application/x-xz',
+        'application/x-7z-compressed',
+        'application/x-rar-compressed',
+        'application/octet-stream',
+        'application/pdf',
+    )
+
+    UNCOMPRESSED_TYPES = (
+        'image/svg+xml',
+        'image/x-icon',
+        'image/bmp',
+    )
+
+    def __init__(self,
+                 *,
+                 min_size=1024,
+                 encodings=('zstd', 'gzip', 'deflate'),
+                 levels=None,
+                 adaptive=False,
+                 lag_threshold=0.05,
+                 lag_interval=0.25):
+        """
+        Args:
+            min_size (int): Complete responses smaller than this (in
+                bytes) are not compressed
+            encodings (iterable of str): Supported encodings, in order
+                of preference; unavailable encodings are ignored
+            levels (dict or None): Compression level of each encoding,
+                overriding DEFAULT_LEVELS
+            adaptive (bool): Lower the compression level while the
+                event loop is saturated
+            lag_threshold (float): Loop lag (seconds) considered
+                saturated
+            lag_interval (float): Seconds between loop lag samples
+        """
+        self.min_size = min_size
+        self.encodings = tuple(e for e in encodings if e in ENCODERS)
+        self.levels = dict(self.DEFAULT_LEVELS, **(levels or {}))
+        self.adaptive = adaptive
+        self.lag_threshold = lag_threshold
+        self.lag_interval = lag_interval
+
+        self.lag = 0.0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        self._sampling = False
+        self._last_request = 0.0
+        self.log = logger.getChild("id=%x" % id(self))
+
+    def __call__(self, req, res):
+        encoding = self.negotiate(req.headers.get('ACCEPT-ENCODING') or '')
+        res.events.on('headers', lambda: self.on_headers(res, encoding))
+        if self.adaptive:
+            self.sample_lag()
+
+    def negotiate(self, accept_encoding):
+        """
+        Returns the preferred supported encoding acceptable to the
+        client, or None.
+        """
+        return negotiate(accept_encoding, self.encodings)
+
+    def level(self, encoding):
+        """
+        Returns the compression level to use for encoding, given the
+        current loop lag.
+        """
+        if self.adaptive and self.lag > self.lag_threshold:
+            return self.MIN_LEVELS[encoding]
+        return self.levels[encoding]
+
+    @classmethod
+    def is_compressible(cls, content_type):
+        """
+        Returns False if content_type is already compressed.
+        """
+        content_type = (content_type or '').lower()
+        if content_type.startswith(cls.UNCOMPRESSED_TYPES):
+            return True
+        return not content_type.startswith(cls.COMPRESSED_TYPES)
+
+    def on_headers(self, res, encoding):
+        headers = res.headers
+        self.add_vary(headers)
+
+        if (res.status_code == 304 and encoding is not None
+                and self.is_compressible(headers.get('Content-Type'))):
+            self.weaken_etag(headers)
+
+        if (encoding is None
+                or 'Content-Encoding' in headers
+                or not (200 <= res.status_code < 300)
+                or not self.is_compressible(headers.get('Content-Type'))):
+            return
+
+        encoder = ENCODERS[encoding](encoding, self.level(encoding))
+
+        if 'Transfer-Encoding' in headers:
+            res.body_encoder = encoder
+        else:
+            body = res.message
+            if isinstance(body, str):
+                body = body.encode()
+            if len(body) < self.min_size:
+                return
+            res.message = encoder.compress(body) + encoder.finish()
+            self.bytes_in += len(body)
+            self.bytes_out += len(res.message)
+            if 'Content-Length' in headers:
+                del headers['Content-Length']
+
+        headers['Content-Encoding'] = encoding
+        self.weaken_etag(headers)
+        self.compressed += 1
+
+    @staticmethod
+    def add_vary(headers):
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+            headers['Vary'] = vary + ', Accept-Encoding'
+
+    @staticmethod
+    def weaken_etag(headers):
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+
+    def sample_lag(self):
+        """
+        Starts sampling the event loop's lag, if not already doing so.
+        Sampling stops after a period without requests.
+        """
+        loop = get_running_loop()
+        self._last_request = loop.time()
+        if self._sampling:
+            return
+        self._sampling = True
+        expected = loop.time() + self.lag_interval
+        loop.call_later(self.lag_interval, self._on_sample, loop, expected)
+
+    def _on_sample(self, loop, expected):
+        now = loop.time()
+        self.lag = max(0.0, now - expected)
+        if now - self._last_request > 10 * self.lag_interval:
+            self._sampling = False
+            self.lag = 0.0
+            return
+        expected = now + self.lag_interval
+        loop.call_later(self.lag_interval, self._on_sample, loop, expected)
+
+    def stats(self):
+        """
+        Returns dict of the middleware's metrics.
+        """
+        return {
+            'compressed': self.compressed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'lag': self.lag,
+        }
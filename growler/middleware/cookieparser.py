@@ -3,21 +3,127 @@
 #
 #
 
+import re
 import json
 import logging
-from http.cookies import SimpleCookie
+from collections.abc import MutableMapping
 
 logger = logging.getLogger(__name__)
 
+# octal (\012) or single character (\") escapes of a quoted value
+_ESCAPE_RE = re.compile(r'\\(?:([0-3][0-7][0-7])|(.))', re.DOTALL)
+
+
+class Cookie(str):
+    """
+    The value of a request cookie. A str, with a `value` property
+    returning itself for compatibility with the Morsel objects of
+    http.cookies.SimpleCookie.
+    """
+
+    __slots__ = ()
+
+    @property
+    def value(self):
+        return str(self)
+
+
+def _unquote(value):
+    """
+    Returns the content of a double quoted cookie value, decoding its
+    backslash escapes as http.cookies does.
+    """
+    value = value[1:-1]
+    if '\\' not in value:
+        return value
+    return _ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 8)) if m.group(1) else m.group(2),
+                          value)
+
+
+def parse_cookie_header(header):
+    """
+    Returns a dict of the cookie names and values in a Cookie request
+    header. Unlike SimpleCookie, this is a plain split on ';' and '='.
+    Pairs without a name are ignored; if a name appears more than
+    once, the first (most specific) value is kept.
+    """
+    cookies = {}
+    for pair in header.split(';'):
+        name, eq, value = pair.partition('=')
+        name = name.strip()
+        if not eq or not name or name in cookies:
+            continue
+        value = value.strip()
+        if len(value) > 1 and value[0] == value[-1] == '"':
+            value = _unquote(value)
+        cookies[name] = Cookie(value)
+    return cookies
+
+
+class RequestCookies(MutableMapping):
+    """
+    Mapping of the cookies sent by the client, parsing the Cookie
+    header upon first access.
+    Cookies may be added or replaced (as with the SimpleCookie this
+    used to be), e.g. by middleware authenticating the request; values
+    are stored as :class:`Cookie` objects.
+    """
+
+    __slots__ = ('_header', '_cookies')
+
+    def __init__(self, header):
+        self._header = header
+        self._cookies = None
+
+    @property
+    def cookies(self):
+        """
+        The dict of cookie names to values, parsed upon first access.
+        """
+        if self._cookies is None:
+            self._cookies = parse_cookie_header(self._header) if self._header else {}
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, cookies):
+        self._cookies = {}
+        self.update(cookies)
+
+    def __getitem__(self, name):
+        return self.cookies[name]
+
+    def __setitem__(self, name, value):
+        # accept Morsels, as SimpleCookie did
+        value = getattr(value, 'value', value)
+        self.cookies[name] = Cookie(value)
+
+    def __delitem__(self, name):
+        del self.cookies[name]
+
+    def __iter__(self):
+        return iter(self.cookies)
+
+    def __len__(self):
+        return len(self.cookies)
+
+    def __contains__(self, name):
+        return name in self.cookies
+
+    def __repr__(self):
+        return "<RequestCookies %r>" % (self.cookies, )
+
 
 class CookieParser:
     """
-    Middleware which adds a 'cookies' attribute to requests, which is a
-    standard library http.cookies.SimpleCookie object, allowing dict like
-    access to session variables.
+    Middleware which adds a 'cookies' attribute to requests, a mapping
+    of cookie names to their (str) values, allowing dict like
+    access to session variables. The Cookie header is only parsed if
+    the cookies are used.
 
-    This adds a 'on_headerstrings' event to the response, so the cookies will
-    be serialized and sent back to the client.
+    Cookies are sent to the client by setting them in the response's
+    `cookies` attribute, a standard library http.cookies.SimpleCookie
+    object created upon first access (see
+    :attr:`growler.http.response.HTTPResponse.cookies`).
 
     If the request already has a cookie attribute, this does nothing.
     """
@@ -34,22 +140,10 @@ class CookieParser:
 
     def __call__(self, req, res):
         """
-        Parses cookies of the header request (using the 'cookie' header key)
-        and adds a callback to the 'on_headerstrings' response event.
+        Adds the (lazily parsed) cookies of the request's Cookie header.
         """
         # Do not clobber cookies
         if hasattr(req, 'cookies'):
             return
 
-        # Create an empty cookie state
-        req.cookies, res.cookies = SimpleCookie(), SimpleCookie()
-
-        # If the request had a cookie, load it!
-        req.cookies.load(req.headers.get('COOKIE', ''))
-
-        def _gen_cookie():
-            if res.cookies:
-                cookie_string = res.cookies.output(header='', sep=res.EOL)
-                return cookie_string
-
-        res.headers['Set-Cookie'] = _gen_cookie
+        req.cookies = RequestCookies(req.headers.get('COOKIE'))
@@ -0,0 +1,89 @@
+#
+# growler/middleware/etag.py
+#
+"""
+Middleware adding content-hash ETags to responses and answering
+matching conditional requests with '304 - Not Modified'.
+"""
+
+import logging
+from hashlib import blake2b
+
+from growler.http import HTTPMethod
+
+logger = logging.getLogger(__name__)
+
+
+class ETag:
+    """
+    Middleware computing an ETag header from the body of successful
+    GET and HEAD responses sent with a complete message (send_text,
+    send_json, send_html, send_file, ...).
+
+    If the request's If-None-Match header lists the computed tag (or
+    is '*'), the status is changed to 304 and the body (along with its
+    Content-Length) is dropped just before the headers are sent.
+
+    Responses which already have an ETag header (such as those of the
+    Static middleware), and streamed (chunked) responses, whose body is
+    not known when the headers are sent, are left untouched.
+    """
+
+    def __init__(self, *, weak=False, digest_size=8):
+        """
+        Args:
+            weak (bool): Send weak validators ('W/"..."'), signaling the
+                body is semantically, not byte-for-byte, equivalent.
+            digest_size (int): Size in bytes of the hash in the tag
+        """
+        self.weak = weak
+        self.digest_size = digest_size
+        self.log = logger.getChild("id=%x" % id(self))
+
+    def __call__(self, req, res):
+        if not (req.method & (HTTPMethod.GET | HTTPMethod.HEAD)):
+            return
+        res.events.on('headers', lambda: self.on_headers(req, res))
+
+    def calculate_etag(self, body):
+        """
+        Returns the (quoted) tag of the message body.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+        tag = '"%s"' % blake2b(body, digest_size=self.digest_size).hexdigest()
+        return 'W/' + tag if self.weak else tag
+
+    def on_headers(self, req, res):
+        if (not (200 <= res.status_code < 300)
+                or 'ETag' in res.headers
+                or 'Transfer-Encoding' in res.headers):
+            return
+
+        etag = self.calculate_etag(res.message)
+        res.headers['ETag'] = etag
+
+        if self.matches(req.headers.get('IF-NONE-MATCH'), etag):
+            res.status_code = 304
+            res.phrase = None
+            res.message = b''
+            if 'Content-Length' in res.headers:
+                del res.headers['Content-Length']
+
+    @staticmethod
+    def matches(if_none_match, etag):
+        """
+        Returns True if the If-None-Match header value lists etag,
+        using weak comparison.
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+
+        def opaque(tag):
+            tag = tag.strip()
+            return tag[2:] if tag.startswith('W/') else tag
+
+        etag = opaque(etag)
+        return any(opaque(tag) == etag for tag in if_none_match.split(','))
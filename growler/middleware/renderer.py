@@ -2,12 +2,85 @@
 # growler/middleware/renderer.py
 #
 
+import os
+import uuid
+import pickle
+import asyncio
 import logging
 from pathlib import Path
+from string import Formatter
+
+from growler.aio.executor import (
+    MiddlewareExecutor,
+    ProcessPoolMiddlewareExecutor,
+)
 
 log = logging.getLogger(__name__)
 
 
+class _Rendered:
+    """
+    The (already complete) awaitable returned by res.render when the
+    page was rendered and sent on the event loop.
+    """
+
+    __slots__ = ()
+
+    def __await__(self):
+        return iter(())
+
+
+RENDERED = _Rendered()
+
+
+# engines unpickled in this (worker) process, by key
+_worker_engines = {}
+
+
+def _load_worker_engine(key, state):
+    """
+    Returns the engine with the given key, unpickling it from state
+    (and preloading its templates) only upon its first use in this
+    process.
+    """
+    engine = _worker_engines.get(key)
+    if engine is None:
+        engine = pickle.loads(state)
+        engine.preload()
+        _worker_engines[key] = engine
+    return engine
+
+
+class _WorkerEngine:
+    """
+    Stand-in for an engine sent to process pool workers: it pickles to
+    a reference which resolves to the worker's copy of the engine, so
+    the engine is only unpickled (and its templates loaded) once per
+    worker.
+    """
+
+    __slots__ = ('key', 'state')
+
+    def __init__(self, engine):
+        self.key = uuid.uuid4().hex
+        self.state = pickle.dumps(engine)
+
+    def __reduce__(self):
+        return _load_worker_engine, (self.key, self.state)
+
+
+def _is_executor(executor):
+    """
+    True if an engine's executor attribute names or is an executor,
+    rather than None or False (rendering on the event loop).
+    """
+    return executor is True or isinstance(executor, (str, MiddlewareExecutor))
+
+
+def _render_source(engine, filename, obj):
+    return engine.render_source(filename, obj)
+
+
 class Renderer:
     """
     Renderer is a helper class designed to provide a common interface for
@@ -29,6 +102,11 @@ class Renderer:
 
     render_engine_map = dict()
 
+    # size (characters) of the chunks of streamed pages
+    chunk_size = 16 * 1024
+
+    HEAD_END = '</head>'
+
     def __init__(self, res):
         """
         Constructor
@@ -39,7 +117,7 @@ class Renderer:
         self.res = res
         self.engines = []
 
-    def __call__(self, template, obj=None):
+    def __call__(self, template, obj=None, stream=False):
         """
         Should be called via `res.render(...)`.
 
@@ -53,21 +131,103 @@ class Renderer:
                 own designated extension.
             obj (dict): A dictionary containing the 'local namespace' of the
                 rendering environment.
+            stream (bool): Send the page as it is rendered, in a chunked
+                response, rather than rendering it fully before sending.
+
+        Returns:
+            awaitable: Completes once the page has been sent. If the
+                engine renders in an executor, this is also set as the
+                response's `pending` awaitable, which the middleware
+                chain awaits if the handler does not.
 
         Raises:
             ValueError: If no template could be found with the provided name.
         """
         for engine in self.engines:
-            filename = engine.find_template_filename(template)
+            filename = engine.resolve(template)
             if filename:
                 if obj:
                     self.res.locals.update(obj)
-                html = engine.render_source(filename, self.res.locals)
-                self.res.send_html(html)
-                break
+                context = self.res.locals
+                if engine.globals:
+                    context = dict(engine.globals, **context)
+                if _is_executor(engine.executor):
+                    task = asyncio.ensure_future(
+                        self.render_in_executor(engine, filename, context, stream))
+                    self.res.pending = task
+                    return task
+                if stream:
+                    self.send_stream(engine.render_stream(filename, context))
+                else:
+                    html = engine.render_source(filename, context)
+                    self.res.send_html(html)
+                return RENDERED
         else:
             raise ValueError("Could not find a template with name '%s'" % template)
 
+    async def render_in_executor(self, engine, filename, context, stream=False):
+        """
+        Renders the template with the engine's executor, off of the
+        event loop, then sends the page.
+        """
+        executor = engine.executor
+        if not isinstance(executor, MiddlewareExecutor):
+            executor = self.res.app.get_executor(executor)
+
+        if isinstance(executor, ProcessPoolMiddlewareExecutor):
+            worker_engine = engine.worker_engine
+        else:
+            worker_engine = engine
+        html = await executor.run(_render_source, worker_engine, filename, context)
+
+        if self.res.has_ended:
+            log.warning("Response ended while rendering %s; not sent", filename)
+            return
+        if stream:
+            self.send_stream((html, ))
+        else:
+            self.res.send_html(html)
+
+    def send_stream(self, fragments):
+        """
+        Sends the html fragments as a chunked response.
+
+        Fragments are gathered into chunks of about chunk_size bytes,
+        except that everything up to the end of the document's head is
+        sent (and flushed through any compression) as soon as it has
+        been rendered, so the client may start fetching the stylesheets
+        and scripts it references while the rest of the page renders.
+
+        Args:
+            fragments (iterable of str): The rendered page
+        """
+        res = self.res
+        res.headers.setdefault('Content-Type', 'text/html')
+        buffer, size = [], 0
+        head_sent = False
+        tail = ''
+
+        for fragment in fragments:
+            if not fragment:
+                continue
+            buffer.append(fragment)
+            size += len(fragment)
+            if not head_sent:
+                window = tail + fragment
+                if self.HEAD_END in window.lower():
+                    res.write_chunk(''.join(buffer), flush=True)
+                    buffer, size = [], 0
+                    head_sent = True
+                    continue
+                tail = window[-len(self.HEAD_END):]
+            if size >= self.chunk_size:
+                res.write_chunk(''.join(buffer))
+                buffer, size = [], 0
+
+        if buffer:
+            res.write_chunk(''.join(buffer))
+        res.end_chunks()
+
     def add_engine(self, engine):
         """
         Add an engine to the engines
@@ -75,6 +235,91 @@ class Renderer:
         self.engines.append(engine)
 
 
+class TemplateCache:
+    """
+    Cache of an engine's templates, holding both the resolution of
+    template names to files and the compiled (pre-parsed) form of each
+    file, so rendering does no file I/O.
+
+    With `auto_reload` enabled (for development), each use of a cached
+    template stats the file, recompiling it if its modification time
+    changed, and names which did not resolve to a file are searched
+    again. With it disabled (for production), templates are read and
+    names resolved once.
+
+    Attributes:
+        hits (int): Number of cached templates used
+        compiles (int): Number of times a template was (re)compiled
+    """
+
+    def __init__(self, compile, *, auto_reload=True):
+        """
+        Args:
+            compile (callable): Called with a template filename, returns
+                its compiled form
+            auto_reload (bool): Check the templates for changes
+        """
+        self.compile = compile
+        self.auto_reload = auto_reload
+        self._names = {}
+        self._templates = {}
+        self.hits = 0
+        self.compiles = 0
+
+    def resolve(self, name, find):
+        """
+        Returns the filename of the template name, calling find(name)
+        to search for it upon first use.
+        """
+        try:
+            filename = self._names[name]
+        except KeyError:
+            filename = find(name)
+            if filename is not None or not self.auto_reload:
+                self._names[name] = filename
+            return filename
+
+        if filename is not None and self.auto_reload and not filename.is_file():
+            del self._names[name]
+            return self.resolve(name, find)
+        return filename
+
+    def get(self, filename):
+        """
+        Returns the compiled template of the file, compiling it upon
+        first use (or when modified, if auto_reload is set).
+        """
+        key = str(filename)
+        entry = self._templates.get(key)
+        mtime = os.stat(key).st_mtime_ns if self.auto_reload else None
+        if entry is not None and (mtime is None or entry[0] == mtime):
+            self.hits += 1
+            return entry[1]
+
+        template = self.compile(key)
+        self.compiles += 1
+        self._templates[key] = (mtime, template)
+        return template
+
+    def clear(self):
+        """
+        Empties the cache, so templates are resolved and read again.
+        """
+        self._names.clear()
+        self._templates.clear()
+
+    def stats(self):
+        """
+        Returns dict of the cache's metrics.
+        """
+        return {
+            'templates': len(self._templates),
+            'names': len(self._names),
+            'hits': self.hits,
+            'compiles': self.compiles,
+        }
+
+
 class RenderEngine:
     """
     Class used to render templates.
@@ -96,6 +341,10 @@ class RenderEngine:
     format, you can implement your own by overloading the
     find_template_filename method.
 
+    Engines which can pre-parse their templates implement the
+    compile_template method, and fetch the compiled form from the
+    engine's TemplateCache (the `templates` attribute) when rendering.
+
     It is **not** recommended to change the behavior of the __call__
     method, which may modify the res object in a manner all other
     RenderEngines are dependent.
@@ -103,15 +352,41 @@ class RenderEngine:
     Attributes:
         path (pathlib.Path): The directory containing the view files this
             renderer will find.
+        globals (dict): Values available to every template rendered by
+            this engine (e.g. a Static middleware's asset manifest),
+            overridden by the values of res.locals.
+        templates (TemplateCache): Cache of template names and
+            compiled templates, created upon first use
+        auto_reload (bool): Whether the templates cache checks the
+            template files for changes
+        executor: The executor rendering templates, if any
     """
 
-    def __init__(self, path):
+    globals = None
+    executor = None
+    auto_reload = True
+    _templates = None
+    _worker_engine = None
+
+    def __init__(self, path, globals=None, *, auto_reload=True, executor=None):
         """
         Constructor
 
         Args:
             path (str): Top level directory to search for template files - the
                 path must exist and the path must be a directory.
+            globals (dict): Values available to all templates
+            auto_reload (bool): Check template files for changes upon
+                each render; disable in production so templates are
+                only read once.
+            executor (str or MiddlewareExecutor or bool): Render
+                templates in this executor rather than on the event
+                loop. Names ('thread', 'process', or True for the
+                default) select one of the application's executors.
+                With a process pool, the engine and the rendered values
+                must be picklable; each worker loads the engine (a
+                snapshot of its state upon first use) and its templates
+                once.
 
         Raises:
             FileNotFoundError: If the provided path does not exists.
@@ -123,6 +398,53 @@ class RenderEngine:
             log.warning("path given to render engine is not a directory")
             raise NotADirectoryError("path '%s' is not a directory" % path)
 
+        self.globals = dict(globals or {})
+        self.auto_reload = auto_reload
+        self.executor = executor
+
+    @property
+    def templates(self):
+        """
+        The engine's TemplateCache, created upon first use (so engines
+        need not call this constructor).
+        """
+        if self._templates is None:
+            self._templates = TemplateCache(self.compile_template,
+                                            auto_reload=self.auto_reload)
+        return self._templates
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_worker_engine', None)
+        state.pop('_templates', None)
+        return state
+
+    @property
+    def worker_engine(self):
+        """
+        Picklable reference to this engine, sent to process workers.
+        """
+        if self._worker_engine is None:
+            self._worker_engine = _WorkerEngine(self)
+        return self._worker_engine
+
+    def preload(self):
+        """
+        Compiles every template file found in the engine's directory
+        (with one of the default_file_extensions, if any), so the first
+        renders need not read them. Does nothing for engines which do
+        not compile templates.
+        """
+        exts = tuple(getattr(self, 'default_file_extensions', ()))
+        for dirpath, _, filenames in os.walk(str(self.path)):
+            for filename in filenames:
+                if exts and not filename.endswith(exts):
+                    continue
+                try:
+                    self.templates.get(os.path.join(dirpath, filename))
+                except NotImplementedError:
+                    return
+
     def __call__(self, req, res):
         """
         The action of this middleware upon client request. The response is
@@ -138,6 +460,13 @@ class RenderEngine:
             res.locals = {}
         res.render.add_engine(self)
 
+    def resolve(self, template_name):
+        """
+        Returns the path of the template file, searched for (with
+        find_template_filename) upon the first use of the name.
+        """
+        return self.templates.resolve(template_name, self.find_template_filename)
+
     def find_template_filename(self, template_name):
         """
         Searches for a file matching the given template name.
@@ -182,6 +511,79 @@ class RenderEngine:
         """
         raise NotImplementedError()
 
+    def render_stream(self, filename, obj):
+        """
+        Render the template file found at filename, as an iterable of
+        text fragments. Engines able to produce the page incrementally
+        override this; by default the whole page is one fragment.
+
+        Args:
+            filename (str): Path to the template file
+            obj (dict): Dictionary of data to pass to templating engine
+
+        Returns:
+            iterable of str: The fragments of the rendered file
+        """
+        return (self.render_source(filename, obj), )
+
+    def compile_template(self, filename):
+        """
+        Returns the compiled form of the template file, which is kept
+        in the engine's TemplateCache.
+
+        Args:
+            filename (str): Path to the template file
+        """
+        raise NotImplementedError()
+
+
+class FormatTemplate:
+    """
+    A str.format template, pre-parsed into its literal text and
+    replacement fields, so rendering only looks up and formats the
+    values.
+    """
+
+    __slots__ = ('source', 'segments')
+
+    _formatter = Formatter()
+
+    def __init__(self, source):
+        self.source = source
+        self.segments = [
+            (literal,
+             field,
+             field is not None and field.isidentifier(),
+             conversion,
+             spec or '',
+             bool(spec) and '{' in spec)
+            for literal, field, spec, conversion in self._formatter.parse(source)
+        ]
+
+    def render(self, obj):
+        """
+        Returns the template formatted with the values of obj, equivalent
+        to source.format(**obj).
+        """
+        return ''.join(self.iter_render(obj))
+
+    def iter_render(self, obj):
+        """
+        Yields the literal text and formatted fields of the template.
+        """
+        formatter = self._formatter
+        for literal, field, simple, conversion, spec, nested in self.segments:
+            if literal:
+                yield literal
+            if field is None:
+                continue
+            value = obj[field] if simple else formatter.get_field(field, (), obj)[0]
+            if conversion:
+                value = formatter.convert_field(value, conversion)
+            if nested:
+                spec = spec.format(**obj)
+            yield format(value, spec)
+
 
 class StringRenderer(RenderEngine):
     """
@@ -191,6 +593,9 @@ class StringRenderer(RenderEngine):
     add the 'render' method to the middleware response object. When this
     method is called with a filename and dictionary, the file is read in as a
     string then .format is called with the contents of the dictionary.
+
+    Files are only read (and parsed) once, the parsed templates are kept
+    in the engine's TemplateCache.
     """
 
     default_file_extensions = [
@@ -198,11 +603,17 @@ class StringRenderer(RenderEngine):
     ]
 
     def render_source(self, filename, obj=None):
-        txt = self.file_text(str(self.path.joinpath(filename)))
+        template = self.templates.get(self.path.joinpath(filename))
         if obj is None:
-            return txt
+            return template.source
         else:
-            return txt.format(**obj)
+            return template.render(obj)
+
+    def render_stream(self, filename, obj):
+        return self.templates.get(self.path.joinpath(filename)).iter_render(obj)
+
+    def compile_template(self, filename):
+        return FormatTemplate(self.file_text(filename))
 
     def file_text(self, filename):
         with open(filename, 'r') as file:
@@ -34,34 +34,95 @@ methods are implemented as expected.
 
 """
 
+import sys
+import hmac
+import asyncio
+import json
+import time
 import uuid
+import zlib
+import base64
+import hashlib
 import logging
 from abc import abstractmethod
+from inspect import isawaitable
+from collections import OrderedDict
 from collections.abc import MutableMapping
 
+from growler.aio.redis import RedisClient
+
 logger = logging.getLogger(__name__)
 
 
 class Session(MutableMapping):
     """
     Session data
+
+    The data is loaded from the storage upon first access, so requests
+    which never use their session cost nothing more than this object.
+    Assigning or deleting items marks the session as 'dirty', and only
+    dirty sessions are written back to the storage.
+    Values mutated in place (e.g. appending to a stored list) are not
+    detected; call :meth:`modified` after such changes.
+
+    Attributes:
+        id: The session identifier, None until loaded if the client had
+            no session
+        is_new (bool): True if the session was created by this request
+        dirty (bool): True if the data was modified since loaded/saved
     """
 
-    def __init__(self, storage, values=None):
-        self._data = {} if values is None else values
+    def __init__(self, storage, values=None, *, id=None, loader=None):
+        """
+        Args:
+            storage (SessionStorage): The storage owning this session
+            values (dict or None): The session data, if already loaded
+            id: The session identifier
+            loader (callable or None): Called with this session upon
+                first access, returns the session data. If neither
+                values nor loader are given, the session starts empty.
+        """
         self._store = storage
+        self._loader = loader
+        self._data = values
+        self.id = id
+        self.is_new = False
+        self.dirty = False
+        if values is None and loader is None:
+            self._data = {}
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        """
+        The dict of session values, loaded upon first access.
+        """
+        if self._data is None:
+            self._data = self._loader(self)
+        return self._data
+
+    def modified(self):
+        """
+        Marks the session as changed, so it will be saved.
+        """
+        self.dirty = True
 
     def __getitem__(self, name):
-        return self._data[name]
+        return self.data[name]
 
     def __setitem__(self, name, value):
-        self._data[name] = value
+        self.data[name] = value
+        self.dirty = True
 
     def __delitem__(self, name):
-        del self._data[name]
+        del self.data[name]
+        self.dirty = True
 
     def __len__(self):
-        return self._data.__len__()
+        return self.data.__len__()
 
 #   def __getattr__(self, name):
 #     print ("[__getattr__]:", name)
@@ -74,7 +135,7 @@ class Session(MutableMapping):
 #     self._data[name] = value
 
     def get(self, name, default=None):
-        return self._data.get(name, default)
+        return self.data.get(name, default)
 
 #   def __set__(self, name, value):
 #     print ("+++ Seting ",name,vlaue)
@@ -96,7 +157,7 @@ class Session(MutableMapping):
 #     return self._data.iteritems()
 #
     def __iter__(self):
-        return self._data.__iter__()
+        return self.data.__iter__()
 #
 #   def __contains__(self, key):
 #     return key in self._data
@@ -105,16 +166,189 @@ class Session(MutableMapping):
 #     print ("DICT")
 
     async def save(self):
-        await self._store.save(self)
+        """
+        Writes the session to the storage, if it has been modified.
+        """
+        if not self.dirty:
+            return
+        result = self._store.save(self)
+        if isawaitable(result):
+            await result
+        self.dirty = False
 
 
 class SessionStorage:
 
+    @abstractmethod
+    def load(self, sess):
+        """
+        Returns the data of the session, assigning a new id to sess
+        (and setting sess.is_new) if there is no stored session.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def save(self, sess):
         raise NotImplementedError
 
 
+def approximate_size(data):
+    """
+    Returns an estimate of the memory (bytes) used by a session's data:
+    the size of the container plus its keys and values, one level deep.
+    """
+    size = sys.getsizeof(data)
+    if isinstance(data, dict):
+        for key, value in data.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class BoundedSessionStore:
+    """
+    In-memory mapping of session ids to session data, bounded by the
+    number of sessions, (approximate) memory used, and idle time.
+
+    Sessions are kept in least-recently-used order; when a bound is
+    exceeded the least recently used sessions are evicted.
+    Sessions idle for longer than `ttl` seconds are expired: they are
+    never returned, and are removed from the front of the order a few
+    at a time upon each insertion, so sweeping is amortized over
+    requests rather than done in one pass.
+
+    Attributes:
+        nbytes (int): Approximate memory used by stored sessions
+        evictions (int): Number of sessions removed to stay in bounds
+        expirations (int): Number of sessions removed as idle
+    """
+
+    def __init__(self,
+                 max_sessions=100000,
+                 max_bytes=None,
+                 ttl=3600.0,
+                 *,
+                 sweep_batch=16,
+                 clock=time.monotonic):
+        """
+        Args:
+            max_sessions (int or None): Maximum number of sessions
+            max_bytes (int or None): Maximum memory (bytes) used by
+                session data, as estimated by approximate_size
+            ttl (float or None): Seconds of inactivity after which a
+                session expires
+            sweep_batch (int): Most expired sessions removed per
+                insertion
+            clock (callable): Returns the current time in seconds
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_batch = sweep_batch
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, sid):
+        return self.get(sid) is not None
+
+    def __getitem__(self, sid):
+        data = self.get(sid)
+        if data is None:
+            raise KeyError(sid)
+        return data
+
+    def get(self, sid, default=None):
+        """
+        Returns the data of session sid, marking it as recently used,
+        or default if there is no such (live) session.
+        """
+        entry = self._entries.get(sid)
+        if entry is None:
+            return default
+
+        data, last_access, size = entry
+        now = self.clock()
+        if self.ttl is not None and now - last_access > self.ttl:
+            self._remove(sid)
+            self.expirations += 1
+            return default
+
+        self._entries[sid] = (data, now, size)
+        self._entries.move_to_end(sid)
+        return data
+
+    def __setitem__(self, sid, data):
+        self._remove(sid)
+        size = approximate_size(data)
+        self._entries[sid] = (data, self.clock(), size)
+        self.nbytes += size
+        self.sweep()
+        self._enforce_bounds()
+
+    def __delitem__(self, sid):
+        if not self._remove(sid):
+            raise KeyError(sid)
+
+    def _remove(self, sid):
+        entry = self._entries.pop(sid, None)
+        if entry is None:
+            return False
+        self.nbytes -= entry[2]
+        return True
+
+    def _enforce_bounds(self):
+        entries = self._entries
+        while entries and (
+                (self.max_sessions is not None and len(entries) > self.max_sessions)
+                or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            _, (_, _, size) = entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def sweep(self, limit=None):
+        """
+        Removes up to limit (default sweep_batch) expired sessions from
+        the least recently used end.
+
+        Returns:
+            int: The number of sessions removed
+        """
+        if self.ttl is None:
+            return 0
+        limit = self.sweep_batch if limit is None else limit
+        deadline = self.clock() - self.ttl
+        entries = self._entries
+        removed = 0
+        while entries and removed < limit:
+            sid, (_, last_access, size) = next(iter(entries.items()))
+            if last_access >= deadline:
+                break
+            del entries[sid]
+            self.nbytes -= size
+            removed += 1
+        self.expirations += removed
+        return removed
+
+    def stats(self):
+        """
+        Returns dict of the store's metrics.
+        """
+        return {
+            'sessions': len(self._entries),
+            'bytes': self.nbytes,
+            'max_sessions': self.max_sessions,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
 class DefaultSessionStorage(SessionStorage):
     """
     The growler default session storage uses a standard python dict to store
@@ -124,36 +358,468 @@ class DefaultSessionStorage(SessionStorage):
 
     >>> app.use(CookieParser())
     >>> app.use(DefaultSessionStorage())
+
+    Sessions are held in a :class:`BoundedSessionStore`, so idle and
+    least recently used sessions are dropped rather than accumulating
+    forever. Another store with the same mapping interface may be given
+    instead, such as a
+    :class:`growler.middleware.sessionlog.SessionLogStore` which keeps
+    sessions across restarts.
     """
 
-    def __init__(self, session_id_name='qid'):
+    def __init__(self,
+                 session_id_name='qid',
+                 *,
+                 max_sessions=100000,
+                 max_bytes=None,
+                 ttl=3600.0,
+                 store=None):
         """
         Construct a session storage object using the parameter as the
         unique session key.
+
+        The remaining arguments bound the stored sessions, see
+        :class:`BoundedSessionStore`, unless the store is given.
         """
         super().__init__()
         self.session_id_name = session_id_name
-        self._sessions = {}
+        if store is None:
+            store = BoundedSessionStore(max_sessions, max_bytes, ttl)
+        self._sessions = store
         self.log = logger.getChild("id=%x" % id(self))
 
     def __call__(self, req, res):
         """
-        The middleware action. Adds a session member to the req object
-        and the session id to the response object.
+        The middleware action. Adds a (lazily loaded) session member to
+        the req object. The session is only looked up, and a cookie
+        only sent, if the session is used.
         """
-        qid = self.session_id_name
         try:
-            sid = req.cookies[qid].value
+            sid = req.cookies[self.session_id_name].value
         except KeyError:
-            sid = req.cookies[qid] = uuid.uuid4()
+            sid = None
+
+        req.session = Session(self, id=sid, loader=lambda sess: self.load(sess, res))
+
+    def load(self, sess, res=None):
+        """
+        Returns the stored data of the session, creating a new session
+        if the client has none (or it has expired).
+        If given the response, the session is committed as the headers
+        are sent.
+        """
+        data = None if sess.id is None else self._sessions.get(sess.id)
+        if data is None:
+            sess.id = self.new_session_id()
+            sess.is_new = True
+            data = {}
+        self.log.debug("%r", sess.id)
+
+        if res is not None:
+            res.events.on('headers', lambda: self.commit(sess, res))
+        return data
 
-        res.cookies[qid] = sid
+    @staticmethod
+    def new_session_id():
+        return str(uuid.uuid4())
 
-        self.log.debug("%r", sid)
-        if sid not in self._sessions:
-            self._sessions[sid] = {'id': sid}
-        req.session = Session(self, self._sessions[sid])
+    def commit(self, sess, res):
+        """
+        Saves the session if modified, and sets the session cookie of
+        new sessions which were saved.
+        """
+        if sess.dirty:
+            self.save(sess)
+            sess.dirty = False
+        if sess.is_new and sess.id in self._sessions:
+            res.cookies[self.session_id_name] = sess.id
 
     def save(self, sess):
         self.log.debug("Saving %r", sess.id)
         self._sessions[sess.id] = sess._data
+
+    def stats(self):
+        """
+        Returns dict of the session store's metrics.
+        """
+        return self._sessions.stats()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+class CookieSessionStorage(SessionStorage):
+    """
+    Session storage keeping the (small) session data in the client's
+    cookie, so no server-side state or lookup is needed; any worker or
+    server sharing the secret key can handle any request.
+
+    The data is serialized as JSON, compressed with zlib if larger than
+    `compress_threshold` bytes, and signed with an HMAC. The signature
+    is checked in constant time, and cookies with invalid signatures or
+    older than `max_age` seconds are ignored (giving an empty, new
+    session). The data is readable by the client - do not store
+    secrets in these sessions.
+
+    Multiple keys may be given for key rotation: the first signs new
+    cookies, all are accepted when verifying.
+
+    The cookie is only sent when the session was modified.
+
+    >>> app.use(CookieParser())
+    >>> app.use(CookieSessionStorage(os.environ['SESSION_KEY']))
+    """
+
+    VERSION = b'1'
+
+    def __init__(self,
+                 secret_key,
+                 *,
+                 cookie_name='session',
+                 max_age=None,
+                 max_cookie_size=4000,
+                 compress_threshold=256,
+                 digestmod=hashlib.sha256,
+                 cookie_options=None):
+        """
+        Args:
+            secret_key (str or bytes or list): The key(s) signing the
+                cookie; if a list, the first signs and all verify.
+            cookie_name (str): Name of the session cookie
+            max_age (int or None): Seconds a cookie remains valid after
+                being issued, also sent as the cookie's Max-Age
+            max_cookie_size (int): Largest cookie value (bytes) allowed;
+                browsers commonly drop cookies larger than 4KB.
+            compress_threshold (int or None): Serialized sessions at
+                least this long are compressed; None disables
+                compression.
+            digestmod: The hash function of the HMAC
+            cookie_options (dict or None): Cookie attributes, defaults
+                to {'path': '/', 'httponly': True, 'samesite': 'Lax'}
+        """
+        keys = secret_key if isinstance(secret_key, (list, tuple)) else [secret_key]
+        if not keys or not all(keys):
+            raise ValueError("CookieSessionStorage requires a secret key")
+
+        # construct the keyed hash objects once, copying them per use
+        self._macs = [hmac.new(k.encode() if isinstance(k, str) else k, digestmod=digestmod)
+                      for k in keys]
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.max_cookie_size = max_cookie_size
+        self.compress_threshold = compress_threshold
+        self.cookie_options = {'path': '/', 'httponly': True, 'samesite': 'Lax'}
+        self.cookie_options.update(cookie_options or {})
+        if max_age is not None:
+            self.cookie_options.setdefault('max-age', max_age)
+        self.log = logger.getChild("id=%x" % id(self))
+
+    def __call__(self, req, res):
+        """
+        Adds a (lazily decoded) session member to the req object.
+        """
+        try:
+            raw = req.cookies[self.cookie_name].value
+        except KeyError:
+            raw = None
+
+        req.session = Session(self, loader=lambda sess: self.load(sess, res, raw))
+
+    def signature(self, message, mac=None):
+        mac = (mac or self._macs[0]).copy()
+        mac.update(message)
+        return _b64encode(mac.digest())
+
+    def encode(self, data, now=None):
+        """
+        Returns the signed cookie value of the session data.
+
+        Raises:
+            ValueError: If the value exceeds max_cookie_size
+        """
+        payload = json.dumps(data, separators=(',', ':')).encode()
+        flag = b'j'
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload)
+            if len(compressed) < len(payload):
+                payload, flag = compressed, b'z'
+
+        issued = b'%x' % int(time.time() if now is None else now)
+        message = b'.'.join((self.VERSION + flag, issued, _b64encode(payload)))
+        value = message + b'.' + self.signature(message)
+        if len(value) > self.max_cookie_size:
+            raise ValueError("Session cookie of %d bytes exceeds the limit of %d"
+                             % (len(value), self.max_cookie_size))
+        return value.decode()
+
+    def decode(self, value, now=None):
+        """
+        Returns the session data stored in the cookie value, or None if
+        the value is malformed, incorrectly signed or expired.
+        """
+        if not value or len(value) > self.max_cookie_size:
+            return None
+        try:
+            value = value.encode('ascii')
+            message, sig = value.rsplit(b'.', 1)
+            header, issued, payload = message.split(b'.')
+        except (UnicodeEncodeError, ValueError):
+            return None
+
+        if not any(hmac.compare_digest(sig, self.signature(message, mac))
+                   for mac in self._macs):
+            self.log.debug("Rejected session cookie with bad signature")
+            return None
+
+        if header[:1] != self.VERSION or self.is_expired(issued, now):
+            return None
+
+        try:
+            payload = _b64decode(payload)
+            if header[1:] == b'z':
+                payload = zlib.decompress(payload)
+            data = json.loads(payload.decode())
+        except (ValueError, zlib.error):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def is_expired(self, issued, now=None):
+        """
+        Returns True if a cookie issued at the (hex encoded) time is
+        older than max_age seconds, or the time is malformed.
+        """
+        if self.max_age is None:
+            return False
+        now = time.time() if now is None else now
+        try:
+            return now - int(issued, 16) > self.max_age
+        except ValueError:
+            return True
+
+    def load(self, sess, res=None, raw=None):
+        """
+        Returns the session data decoded from the raw cookie value,
+        committing the session as the response headers are sent.
+        """
+        data = self.decode(raw)
+        if data is None:
+            sess.is_new = True
+            data = {}
+        if res is not None:
+            res.events.on('headers', lambda: self.commit(sess, res))
+        return data
+
+    def save(self, sess):
+        """
+        Encodes the session, to be sent as the cookie value.
+        """
+        sess.cookie_value = self.encode(sess.data)
+
+    def commit(self, sess, res):
+        """
+        Sets the cookie of a modified session.
+        """
+        if sess.dirty:
+            try:
+                self.save(sess)
+            except ValueError as err:
+                self.log.error("Session not saved: %s", err)
+                return
+            sess.dirty = False
+
+        value = getattr(sess, 'cookie_value', None)
+        if value is None:
+            return
+
+        res.cookies[self.cookie_name] = value
+        morsel = res.cookies[self.cookie_name]
+        for key, option in self.cookie_options.items():
+            morsel[key] = option
+
+
+class SessionBackend:
+    """
+    Interface of asynchronous session backends, storing the data of
+    sessions (dicts) by session id, used by
+    :class:`BackendSessionStorage`.
+    """
+
+    @abstractmethod
+    async def load(self, sid):
+        """
+        Returns the data of session sid, or None if there is none.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save(self, sid, data, ttl=None):
+        """
+        Stores the data of session sid, expiring after ttl seconds
+        (if not None).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, sid):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    Backend keeping sessions in a local :class:`BoundedSessionStore`.
+    The store's own ttl applies, the ttl passed to save is ignored.
+    """
+
+    def __init__(self, store=None):
+        self.store = BoundedSessionStore() if store is None else store
+
+    async def load(self, sid):
+        return self.store.get(sid)
+
+    async def save(self, sid, data, ttl=None):
+        self.store[sid] = data
+
+    async def delete(self, sid):
+        self.store._remove(sid)
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Backend storing sessions as JSON strings in Redis, at keys
+    `prefix` + session id, with the session's ttl as their expiry.
+
+    Loads and saves of concurrent requests are sent through a shared
+    :class:`growler.aio.redis.RedisClient`, pipelining them into a
+    few round trips.
+
+    >>> app.use(CookieParser())
+    >>> app.use(BackendSessionStorage(RedisSessionBackend(port=6379)))
+    """
+
+    def __init__(self, client=None, *, prefix='session:', **client_options):
+        """
+        Args:
+            client (RedisClient or None): The client to use; if None,
+                one is constructed with client_options
+            prefix (str): Prepended to session ids to form keys
+            client_options: Arguments of RedisClient (host, port, db,
+                password, pool_size, ...)
+        """
+        self.client = RedisClient(**client_options) if client is None else client
+        self.prefix = prefix
+
+    async def load(self, sid):
+        raw = await self.client.execute('GET', self.prefix + sid)
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw.decode())
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    async def save(self, sid, data, ttl=None):
+        args = ['SET', self.prefix + sid, json.dumps(data, separators=(',', ':'))]
+        if ttl is not None:
+            args += ['EX', max(1, int(ttl))]
+        await self.client.execute(*args)
+
+    async def delete(self, sid):
+        await self.client.execute('DEL', self.prefix + sid)
+
+    async def close(self):
+        await self.client.close()
+
+
+class BackendSessionStorage(SessionStorage):
+    """
+    Session storage keeping sessions in an asynchronous
+    :class:`SessionBackend`, such as :class:`RedisSessionBackend`,
+    identified by a session id cookie.
+
+    The backend is only queried if the client sent a session cookie.
+    Modified sessions are saved in the background as the response
+    headers are sent (or explicitly, with ``await req.session.save()``),
+    and the cookie is only set for new sessions which were saved.
+    """
+
+    def __init__(self, backend, session_id_name='qid', *, ttl=3600):
+        """
+        Args:
+            backend (SessionBackend): The session backend
+            session_id_name (str): Name of the session id cookie
+            ttl (int or None): Seconds after which unmodified sessions
+                expire from the backend
+        """
+        super().__init__()
+        self.backend = backend
+        self.session_id_name = session_id_name
+        self.ttl = ttl
+        self._saving = set()
+        self.log = logger.getChild("id=%x" % id(self))
+
+    async def __call__(self, req, res):
+        try:
+            sid = req.cookies[self.session_id_name].value
+        except KeyError:
+            sid = None
+
+        sess = Session(self, id=sid)
+        sess._data = await self.load(sess)
+        res.events.on('headers', lambda: self.commit(sess, res))
+        req.session = sess
+
+    async def load(self, sess):
+        """
+        Returns the stored data of the session, creating a new session
+        if the client has none (or it has expired).
+        """
+        data = None if sess.id is None else await self.backend.load(sess.id)
+        if data is None:
+            sess.id = self.new_session_id()
+            sess.is_new = True
+            data = {}
+        return data
+
+    @staticmethod
+    def new_session_id():
+        return str(uuid.uuid4())
+
+    def save(self, sess):
+        self.log.debug("Saving %r", sess.id)
+        sess.stored = True
+        return self.backend.save(sess.id, sess.data, self.ttl)
+
+    def commit(self, sess, res):
+        """
+        Starts saving the session if modified, and sets the session
+        cookie of new sessions which are stored.
+        """
+        if sess.dirty:
+            task = asyncio.ensure_future(self.save(sess))
+            sess.dirty = False
+            self._saving.add(task)
+            task.add_done_callback(self._on_saved)
+
+        if sess.is_new and getattr(sess, 'stored', False):
+            res.cookies[self.session_id_name] = sess.id
+
+    def _on_saved(self, task):
+        self._saving.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.log.error("Session not saved: %r", task.exception())
+
+    async def flush(self):
+        """
+        Waits for the sessions being saved in the background.
+        """
+        if self._saving:
+            await asyncio.gather(*self._saving, return_exceptions=True)
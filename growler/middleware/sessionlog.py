@@ -0,0 +1,394 @@
+#
+# growler/middleware/sessionlog.py
+#
+"""
+A file-backed session store, so sessions survive restarts of the
+server without an external service.
+
+.. code:: python
+
+    store = SessionLogStore('/var/lib/myapp/sessions.log')
+    app.use(CookieParser())
+    app.use(DefaultSessionStorage(store=store))
+
+Every save appends a record to the log, and an in-memory index maps
+session ids to the position of their latest record. Upon startup the
+log is memory-mapped and replayed to rebuild the index; a torn record
+at the end (from a crash mid-write) is discarded. When the log grows to
+several times the size of the live records, it is compacted by
+rewriting the live records to a new file which atomically replaces the
+old one. Within an event loop the rewrite runs in its default executor;
+records saved meanwhile are copied over before the files are swapped.
+
+Writes are not synced to disk individually; the log is fsync'ed at most
+every `fsync_interval` seconds, bounding the sessions lost upon a power
+failure while keeping saves cheap.
+
+A log file must only be used by one process at a time.
+"""
+
+import os
+import mmap
+import json
+import time
+import zlib
+import struct
+import logging
+from asyncio import get_running_loop
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLogStore:
+    """
+    Mapping of session ids to session data (JSON serializable dicts),
+    persisted in an append-only log file.
+
+    Sessions expire `ttl` seconds after they were last saved. The index
+    is kept in order of saving, and expired sessions are removed from
+    its front a few at a time upon each save (as in
+    :class:`BoundedSessionStore`), so they stop counting as live and
+    their records are dropped at the next compaction.
+
+    Attributes:
+        size (int): Length of the log file (bytes)
+        live_bytes (int): Length of the records of stored sessions
+        compactions (int): Number of times the log was compacted
+        expirations (int): Number of sessions removed as expired
+        syncs (int): Number of times the log was fsync'ed
+    """
+
+    CRC = struct.Struct('<I')
+    # data length, time saved, session id length, operation
+    HEADER = struct.Struct('<IdHB')
+    SET = 1
+    DELETE = 2
+
+    def __init__(self,
+                 path,
+                 *,
+                 ttl=7 * 24 * 3600.0,
+                 fsync_interval=1.0,
+                 compact_ratio=2.0,
+                 compact_min_size=1 << 20,
+                 sweep_batch=16,
+                 clock=time.time):
+        """
+        Args:
+            path (str or Path): The log file, created if missing
+            ttl (float or None): Seconds after its last save a session
+                expires
+            fsync_interval (float or None): Most seconds between
+                writing a record and syncing the log; 0 syncs every
+                write, None leaves syncing to the operating system.
+            compact_ratio (float): Compact when the log is this many
+                times larger than its live records
+            compact_min_size (int): Never compact logs smaller than
+                this (bytes)
+            sweep_batch (int): Most expired sessions removed per save
+            clock (callable): Returns the current (wall clock) time
+        """
+        self.path = str(path)
+        self.ttl = ttl
+        self.fsync_interval = fsync_interval
+        self.compact_ratio = compact_ratio
+        self.compact_min_size = compact_min_size
+        self.sweep_batch = sweep_batch
+        self.clock = clock
+
+        self._index = {}
+        self.live_bytes = 0
+        self.compactions = 0
+        self.expirations = 0
+        self.syncs = 0
+        self._unsynced = False
+        self._sync_handle = None
+        self._compacting = False
+        self.log = logger.getChild("id=%x" % id(self))
+
+        self._fd = self._open(self.path)
+        start = time.perf_counter()
+        self.size = self._replay()
+        self.sweep(len(self._index))
+        self.log.info("Loaded %d sessions from %r in %.3fs",
+                      len(self._index), self.path, time.perf_counter() - start)
+
+    @staticmethod
+    def _open(path):
+        return os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def _replay(self):
+        """
+        Rebuilds the index from the log, truncating any incomplete or
+        corrupt records at its end. Returns the length of the log.
+        """
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            return 0
+
+        crc_size, header_size = self.CRC.size, self.HEADER.size
+        pos = 0
+        with mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) as data:
+            while pos + crc_size + header_size <= size:
+                crc, = self.CRC.unpack_from(data, pos)
+                length, saved, id_length, op = self.HEADER.unpack_from(data, pos + crc_size)
+                id_start = pos + crc_size + header_size
+                end = id_start + id_length + length
+                if end > size or zlib.crc32(data[pos + crc_size:end]) != crc:
+                    break
+
+                sid = data[id_start:id_start + id_length].decode()
+                if op == self.SET:
+                    self._index_set(sid, (id_start + id_length, length, saved, end - pos))
+                else:
+                    self._index_remove(sid)
+                pos = end
+
+        if pos < size:
+            self.log.warning("Discarding %d bytes of incomplete records at the end of %r",
+                             size - pos, self.path)
+            os.ftruncate(self._fd, pos)
+        return pos
+
+    def _index_set(self, sid, entry):
+        self._index_remove(sid)
+        self._index[sid] = entry
+        self.live_bytes += entry[3]
+
+    def _index_remove(self, sid):
+        entry = self._index.pop(sid, None)
+        if entry is None:
+            return False
+        self.live_bytes -= entry[3]
+        return True
+
+    def _expired(self, entry, now=None):
+        if self.ttl is None:
+            return False
+        return (self.clock() if now is None else now) - entry[2] > self.ttl
+
+    @classmethod
+    def _record(cls, sid, op, payload, saved):
+        sid = sid.encode()
+        body = cls.HEADER.pack(len(payload), saved, len(sid), op) + sid + payload
+        return cls.CRC.pack(zlib.crc32(body)) + body, cls.CRC.size + cls.HEADER.size + len(sid)
+
+    def _append(self, sid, op, payload=b''):
+        saved = self.clock()
+        record, data_start = self._record(sid, op, payload, saved)
+        offset = self.size
+        os.write(self._fd, record)
+        self.size += len(record)
+        self._unsynced = True
+        self._schedule_sync()
+        return (offset + data_start, len(payload), saved, len(record))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, sid):
+        entry = self._index.get(sid)
+        return entry is not None and not self._expired(entry)
+
+    def __getitem__(self, sid):
+        data = self.get(sid)
+        if data is None:
+            raise KeyError(sid)
+        return data
+
+    def get(self, sid, default=None):
+        """
+        Returns the data of session sid, or default if there is no
+        such (live) session.
+        """
+        entry = self._index.get(sid)
+        if entry is None:
+            return default
+        if self._expired(entry):
+            self._index_remove(sid)
+            self.expirations += 1
+            return default
+        offset, length, _, _ = entry
+        return json.loads(os.pread(self._fd, length, offset).decode())
+
+    def __setitem__(self, sid, data):
+        payload = json.dumps(data, separators=(',', ':')).encode()
+        self._index_set(sid, self._append(sid, self.SET, payload))
+        self.sweep()
+        self.maybe_compact()
+
+    def __delitem__(self, sid):
+        if not self._index_remove(sid):
+            raise KeyError(sid)
+        self._append(sid, self.DELETE)
+
+    def sweep(self, limit=None):
+        """
+        Removes up to limit (default sweep_batch) expired sessions from
+        the index, oldest first.
+
+        Returns:
+            int: The number of sessions removed
+        """
+        if self.ttl is None:
+            return 0
+        limit = self.sweep_batch if limit is None else limit
+        deadline = self.clock() - self.ttl
+        index = self._index
+        removed = 0
+        while index and removed < limit:
+            sid = next(iter(index))
+            if index[sid][2] >= deadline:
+                break
+            self._index_remove(sid)
+            removed += 1
+        self.expirations += removed
+        return removed
+
+    def maybe_compact(self):
+        """
+        Compacts the log if it is large enough, relative to its live
+        records. Within an event loop, the compacted log is written by
+        the loop's default executor, off the request path.
+        """
+        if (self._compacting
+                or self.size < self.compact_min_size
+                or self.size <= self.compact_ratio * self.live_bytes):
+            return
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            self.compact()
+            return
+
+        self._compacting = True
+        entries, snapshot_size = list(self._index.items()), self.size
+        future = loop.run_in_executor(None, self._write_compacted, entries)
+        future.add_done_callback(lambda f: self._on_compacted(f, snapshot_size))
+
+    def compact(self):
+        """
+        Rewrites the log with only the latest record of each live
+        session, atomically replacing the current file.
+        """
+        snapshot_size = self.size
+        index, size = self._write_compacted(list(self._index.items()))
+        self._install_compacted(snapshot_size, index, size)
+
+    @property
+    def _compact_path(self):
+        return self.path + '.compact'
+
+    def _write_compacted(self, entries):
+        """
+        Writes the live records among entries (sid, index entry pairs)
+        to the compacted log file, returning its index and size.
+        """
+        now = self.clock()
+        index, size = {}, 0
+        with open(self._compact_path, 'wb') as out:
+            for sid, entry in entries:
+                if self._expired(entry, now):
+                    continue
+                offset, length, saved, _ = entry
+                payload = os.pread(self._fd, length, offset)
+                record, data_start = self._record(sid, self.SET, payload, saved)
+                out.write(record)
+                index[sid] = (size + data_start, length, saved, len(record))
+                size += len(record)
+            out.flush()
+            os.fsync(out.fileno())
+        return index, size
+
+    def _on_compacted(self, future, snapshot_size):
+        self._compacting = False
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None and self._fd is None:
+            error = "store closed"
+        if error is not None:
+            self.log.error("Failed to compact session log: %s", error)
+            if os.path.exists(self._compact_path):
+                os.unlink(self._compact_path)
+            return
+        self._install_compacted(snapshot_size, *future.result())
+
+    def _install_compacted(self, snapshot_size, index, size):
+        """
+        Replaces the log with the compacted one, after appending the
+        records written since its first snapshot_size bytes were
+        compacted.
+        """
+        tail = b''
+        if self.size > snapshot_size:
+            tail = os.pread(self._fd, self.size - snapshot_size, snapshot_size)
+            with open(self._compact_path, 'ab') as out:
+                out.write(tail)
+            shift = size - snapshot_size
+            for sid, entry in self._index.items():
+                if entry[0] >= snapshot_size:
+                    index[sid] = (entry[0] + shift, ) + entry[1:]
+
+        os.replace(self._compact_path, self.path)
+        os.close(self._fd)
+        self._fd = self._open(self.path)
+
+        self.log.info("Compacted session log from %d to %d bytes", self.size, size + len(tail))
+        # keep the order of saving, and forget sessions removed meanwhile
+        self._index = {sid: index[sid] for sid in self._index if sid in index}
+        self.live_bytes = sum(entry[3] for entry in self._index.values())
+        self.size = size + len(tail)
+        self.compactions += 1
+        self._unsynced = bool(tail)
+        if tail:
+            self._schedule_sync()
+
+    def _schedule_sync(self):
+        if self.fsync_interval is None:
+            return
+        if self.fsync_interval <= 0:
+            self.sync()
+            return
+        if self._sync_handle is not None:
+            return
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return
+        self._sync_handle = loop.call_later(self.fsync_interval, self.sync)
+
+    def sync(self):
+        """
+        Flushes records written since the last sync to disk.
+        """
+        self._sync_handle = None
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = False
+            self.syncs += 1
+
+    def close(self):
+        """
+        Syncs and closes the log.
+        """
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+
+    def stats(self):
+        """
+        Returns dict of the store's metrics.
+        """
+        return {
+            'sessions': len(self._index),
+            'size': self.size,
+            'live_bytes': self.live_bytes,
+            'compactions': self.compactions,
+            'expirations': self.expirations,
+            'syncs': self.syncs,
+        }
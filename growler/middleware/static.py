@@ -2,13 +2,147 @@
 # growler/middleware/static.py
 #
 
+import os
 import re
+import gzip
+import json
+import time
 import logging
 import mimetypes
+from asyncio import get_running_loop
+from hashlib import blake2b
 from pathlib import Path
+from collections import OrderedDict
+
+from growler.http.response import PrebuiltResponse
+from .compress import ENCODERS, Compression, negotiate, zstd
 
 logger = logging.getLogger(__name__)
 
+PRECOMPRESSED_SUFFIXES = {
+    'zstd': '.zst',
+    'gzip': '.gz',
+}
+
+
+class StaticFile:
+    """
+    Cached information on a file of a Static middleware's index.
+    """
+
+    __slots__ = (
+        'path',
+        'size',
+        'mtime_ns',
+        'ino',
+        'etag',
+        'mime',
+        'siblings',
+        'digest',
+        'checked',
+    )
+
+    def __init__(self, path, stat, etag_suffix=''):
+        self.checked = time.monotonic()
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.ino = stat.st_ino
+        self.etag = etag_from_stat(stat) + etag_suffix
+        self.mime = mimetypes.guess_type(path)[0]
+        self.siblings = {}
+        self.digest = None
+
+    def matches(self, stat):
+        """
+        Returns True if stat describes the same, unmodified, file.
+        """
+        return (self.mtime_ns, self.size, self.ino) == \
+            (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class StaleFileError(Exception):
+    """
+    Raised when an indexed file was modified since it was last
+    checked.
+    """
+
+
+class AssetManifest:
+    """
+    Mapping of the logical names of assets ('css/site.css') to their
+    fingerprinted URLs ('/css/site.3f9a0c1e2d4b5a69.css'), published by
+    a Static middleware serving fingerprinted assets.
+
+    The manifest is updated in place when the Static middleware
+    refreshes, so references to it (e.g. in template globals) stay
+    current. Calling the manifest looks up a URL, falling back to the
+    plain URL of unknown names:
+
+    >>> engine = StringRenderer('views', globals={'assets': static.manifest})
+    >>> # in a template: <link href="{assets[css/site.css]}">
+    """
+
+    def __init__(self, prefix='/'):
+        self.prefix = prefix
+        self.urls = {}
+
+    def __getitem__(self, name):
+        return self.urls[name.lstrip('/')]
+
+    def __contains__(self, name):
+        return name.lstrip('/') in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __iter__(self):
+        return iter(self.urls)
+
+    def get(self, name, default=None):
+        return self.urls.get(name.lstrip('/'), default)
+
+    def __call__(self, name):
+        name = name.lstrip('/')
+        return self.urls.get(name, self.prefix + name)
+
+    def update(self, urls):
+        """
+        Replaces the contents of the manifest with urls.
+        """
+        self.urls.clear()
+        self.urls.update(urls)
+
+    def to_json(self, **kwargs):
+        """
+        Returns the manifest as a JSON object string.
+        """
+        return json.dumps(self.urls, sort_keys=True, **kwargs)
+
+    def write(self, filename):
+        """
+        Writes the manifest as JSON to filename, for use by other tools
+        (e.g. a frontend build).
+        """
+        with open(str(filename), 'w') as f:
+            f.write(self.to_json(indent=2))
+
+
+class CachedFile:
+    """
+    Contents of a file held by a Static middleware's memory cache, as
+    prebuilt responses of each available content encoding (None being
+    the uncompressed file).
+    """
+
+    __slots__ = ('file_id', 'variants', 'encodings', 'nbytes')
+
+    def __init__(self, file_id, variants):
+        self.file_id = file_id
+        self.variants = variants
+        self.encodings = tuple(enc for enc in variants if enc is not None)
+        self.nbytes = sum(v.nbytes for v in variants.values())
+
 
 class Static:
     """
@@ -18,11 +152,54 @@ class Static:
     This middleware uses the HTTPResponse object's send_file method
     to determine mime type.
     At this time there is no way to change this without subclassing.
+
+    If enabled, precompressed siblings of the requested file (e.g.
+    'app.js.gz' or 'app.js.zst', see :func:`precompress`) are sent to
+    clients accepting that encoding, in place of the original file.
+
+    With `index` enabled, the served tree is scanned upon construction
+    (and every `refresh_interval` seconds, if given), and requests are
+    answered from the in-memory index: paths which are not files are
+    passed on with a single dict lookup, and files are read through a
+    bounded cache of open file descriptors.
+    Files added to the tree are not served until the next refresh.
+    An entry's file is stat'ed again once it has been trusted for
+    `revalidate_interval` seconds, and every read checks (with fstat)
+    that the open file still matches its entry; entries of modified
+    files are rebuilt, rather than served with outdated headers.
+    Periodic refreshes scan the tree in the event loop's default
+    executor, requests being served from the current index until the
+    new one is ready.
+
+    With a `cache_size`, files no larger than `cache_max_file_size` are
+    kept in memory, in a least-recently-used cache bounded to
+    cache_size bytes, as prebuilt responses (along with compressed
+    variants of compressible types), so a hit is sent with a single
+    write. Cached files are replaced once their mtime or size change.
+
+    With `fingerprint` enabled (which implies `index`), the contents of
+    every file are hashed, and each file is additionally served at a
+    fingerprinted URL ('/app.js' at '/app.<hash>.js') with a
+    far-future, immutable Cache-Control header. The URLs are published
+    in the :attr:`manifest` (see :class:`AssetManifest`).
     """
 
+    IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
     INVALID_PATH = re.compile(r"(:?\.\.)")
 
-    def __init__(self, path):
+    def __init__(self,
+                 path,
+                 *,
+                 precompressed=False,
+                 index=False,
+                 refresh_interval=None,
+                 revalidate_interval=1.0,
+                 max_open_files=64,
+                 cache_size=0,
+                 cache_max_file_size=64 * 1024,
+                 fingerprint=False,
+                 url_prefix='/'):
         """
         Construct Static middleware object providing files from
         given path.
@@ -31,6 +208,26 @@ class Static:
             path (str or list): The directory path to search for
                 files. If this is a list, the paths will be joined
                 automatically.
+            precompressed (bool or iterable of str): Serve
+                precompressed sibling files; True checks for all
+                available encodings ('zstd' and 'gzip'), otherwise the
+                encodings to check, in order of preference.
+            index (bool): Serve files from an index of the tree built
+                upon construction.
+            refresh_interval (float or None): Seconds between rescans
+                of the tree when indexed; None disables rescanning.
+            revalidate_interval (float or None): Seconds an index
+                entry is trusted before its file is stat'ed again upon
+                a request; 0 checks upon every request, None never.
+            max_open_files (int): Number of file descriptors kept open
+                for indexed files; 0 opens the file on every request.
+            cache_size (int): Bytes of memory used to cache small
+                files; 0 disables the cache.
+            cache_max_file_size (int): Largest file (bytes) to cache
+            fingerprint (bool): Serve files at content-hashed URLs,
+                listed in the manifest.
+            url_prefix (str): The path this middleware is mounted on,
+                prepended to the URLs of the manifest.
         """
 
         self.log = logger.getChild("id=%x" % id(self))
@@ -56,8 +253,54 @@ class Static:
             err_msg = "Path '{}' is not a directory.".format(self.path)
             raise NotADirectoryError(err_msg)
 
+        if precompressed is True:
+            precompressed = PRECOMPRESSED_SUFFIXES.keys()
+        self.precompressed = tuple(enc for enc in (precompressed or ())
+                                   if enc != 'zstd' or zstd is not None)
+
+        self.refresh_interval = refresh_interval
+        self.revalidate_interval = revalidate_interval
+        self.max_open_files = max_open_files
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._refreshing = None
+        self._open_files = OrderedDict()
+
+        self.cache_size = cache_size
+        self.cache_max_file_size = cache_max_file_size
+        self.cache_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self._file_cache = OrderedDict()
+
+        self.fingerprint = fingerprint
+        self.manifest = AssetManifest(url_prefix.rstrip('/') + '/')
+        self._fingerprinted = frozenset()
+
+        self.index = None
+        if index or fingerprint:
+            self.refresh()
+
         self.log.info("Serving static files from %r", self.path)
 
+    @staticmethod
+    def from_bundle(filename):
+        """
+        Returns middleware serving the files packed in a bundle file,
+        rather than from a directory.
+        See :mod:`growler.middleware.bundle`.
+
+        Args:
+            filename (str or Path): The bundle file
+
+        Returns:
+            growler.middleware.bundle.StaticBundle
+        """
+        from .bundle import StaticBundle
+        return StaticBundle(filename)
+
     def __call__(self, req, res):
         """
         Middleware handle function. Simply checks if matching path
@@ -65,6 +308,9 @@ class Static:
         If the request has a reference to the parent path, '..', the
         request is ignored by this object.
         """
+        if self.index is not None:
+            return self.send_indexed(req, res)
+
         file_path = self.path / req.path[1:]
 
         # ignore anything that tries to reference an invalid path, such as
@@ -73,6 +319,19 @@ class Static:
             return
 
         if file_path.is_file():
+            if self.cache_size:
+                stat = file_path.stat()
+                if stat.st_size <= self.cache_max_file_size:
+                    path = str(file_path)
+                    self.send_cached(req, res, path, _file_id(stat),
+                                     mimetypes.guess_type(path)[0],
+                                     etag_from_stat(stat),
+                                     file_path.read_bytes)
+                    return
+
+            if self.precompressed and self.send_precompressed(req, res, file_path):
+                return
+
             mime = mimetypes.guess_type(str(file_path))
             etag = self.calculate_etag(file_path)
             res.headers['Etag'] = etag
@@ -88,6 +347,474 @@ class Static:
 
             self.log.info("Sent %s (%s)", file_path, mime[0])
 
+    def send_precompressed(self, req, res, file_path):
+        """
+        Sends the compressed sibling of file_path with the best
+        encoding accepted by the client, if one exists and is not older
+        than the original.
+
+        Returns:
+            bool: True if a response was sent
+        """
+        stat = file_path.stat()
+        siblings = {}
+        for encoding in self.precompressed:
+            sibling = file_path.with_name(file_path.name + PRECOMPRESSED_SUFFIXES[encoding])
+            try:
+                sibling_stat = sibling.stat()
+            except OSError:
+                continue
+            if sibling_stat.st_mtime_ns >= stat.st_mtime_ns:
+                siblings[encoding] = sibling
+
+        if not siblings:
+            return False
+
+        # the response depends on Accept-Encoding, whichever is sent
+        res.headers['Vary'] = 'Accept-Encoding'
+
+        accept_encoding = req.headers.get('ACCEPT-ENCODING', None) or ''
+        encoding = negotiate(accept_encoding, tuple(siblings))
+        if encoding is None:
+            return False
+
+        sibling = siblings[encoding]
+        etag = "%s-%s" % (self.calculate_etag(sibling), encoding)
+        res.headers['Etag'] = etag
+        res.headers['Content-Encoding'] = encoding
+
+        if req.headers.get('IF-NONE-MATCH', None) == etag:
+            res.status_code = 304
+            res.end()
+            return True
+
+        mime = mimetypes.guess_type(str(file_path))
+        res.set_type(mime[0])
+        res.send_file(sibling)
+        self.log.info("Sent %s (%s, %s)", sibling, mime[0], encoding)
+        return True
+
+    def refresh(self):
+        """
+        Scans the served tree, rebuilding the index. Entries of
+        unmodified files are kept; descriptors of modified or removed
+        files are closed.
+        """
+        self.install_index(*self.scan())
+
+    def start_refresh(self):
+        """
+        Starts scanning the tree in the event loop's default executor,
+        installing the new index once the scan completes. Refreshes
+        synchronously if there is no running loop.
+        """
+        if self._refreshing is not None:
+            return
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            self.refresh()
+            return
+        self._refreshing = loop.run_in_executor(None, self.scan)
+        self._refreshing.add_done_callback(self._on_scanned)
+
+    def _on_scanned(self, future):
+        self._refreshing = None
+        if future.cancelled():
+            return
+        try:
+            self.install_index(*future.result())
+        except Exception:
+            self.log.exception("Failed to refresh the index of %r", self.path)
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def scan(self):
+        """
+        Walks the served tree, returning the new index, the
+        precompressed siblings of its files (by URL) and the
+        fingerprinted URLs for the manifest (None unless
+        fingerprinting). Does not modify the current index, so may be
+        run in another thread.
+        """
+        old_index = self.index or {}
+        index = {}
+        root = str(self.path)
+
+        for dirpath, _, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            url_dir = '/' if rel_dir == '.' else '/' + rel_dir.replace(os.sep, '/') + '/'
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                url = url_dir + filename
+                entry = old_index.get(url)
+                if entry is None or not entry.matches(stat):
+                    entry = StaticFile(path, stat)
+                index[url] = entry
+
+        siblings = {}
+        for url, entry in index.items():
+            siblings[url] = {}
+            for encoding in self.precompressed:
+                sibling = index.get(url + PRECOMPRESSED_SUFFIXES[encoding])
+                if sibling is not None and sibling.mtime_ns >= entry.mtime_ns:
+                    siblings[url][encoding] = StaticFile(sibling.path,
+                                                         os.stat(sibling.path),
+                                                         '-' + encoding)
+
+        urls = self.add_fingerprints(index) if self.fingerprint else None
+        return index, siblings, urls
+
+    def install_index(self, index, siblings, urls=None):
+        """
+        Replaces the index with one returned by :meth:`scan`, updating
+        the manifest and closing descriptors (and uncaching files) of
+        modified or removed files.
+        """
+        for url, entry_siblings in siblings.items():
+            index[url].siblings = entry_siblings
+
+        if urls is not None:
+            self._fingerprinted = frozenset(urls.values())
+            self.manifest.update(urls)
+
+        live = {entry.path: entry for entry in index.values()}
+        for path, (fd, entry) in list(self._open_files.items()):
+            current = live.get(path)
+            if (current is None or current.ino != entry.ino
+                    or current.mtime_ns != entry.mtime_ns):
+                del self._open_files[path]
+                os.close(fd)
+
+        for url in [url for url in self._file_cache if url not in index]:
+            self.uncache_file(url)
+
+        self.index = index
+        self.refreshes += 1
+        if self.refresh_interval is not None:
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def add_fingerprints(self, index):
+        """
+        Adds the fingerprinted URLs of the files in index, hashing the
+        contents of new or modified files, and returns the dict of the
+        manifest's URLs.
+        Precompressed siblings are served through the original file's
+        URLs, so are not listed.
+        """
+        sibling_suffixes = tuple(PRECOMPRESSED_SUFFIXES.values())
+        urls = {}
+        for url, entry in list(index.items()):
+            if url.endswith(sibling_suffixes) and url.rsplit('.', 1)[0] in index:
+                continue
+            if entry.digest is None:
+                with open(entry.path, 'rb') as f:
+                    entry.digest = blake2b(f.read(), digest_size=8).hexdigest()
+            directory, _, name = url.rpartition('/')
+            stem, dot, ext = name.rpartition('.')
+            if not stem:
+                stem, dot, ext = name, '.', ''
+            suffix = dot + ext if ext else ''
+            fingerprinted = "%s/%s.%s%s" % (directory, stem, entry.digest, suffix)
+            index[fingerprinted] = entry
+            urls[url[1:]] = self.manifest.prefix + fingerprinted[1:]
+        return urls
+
+    def send_indexed(self, req, res):
+        """
+        Sends the file at the request path using the index, doing
+        nothing if there is no such file.
+        """
+        if self.refresh_interval is not None and time.monotonic() >= self._next_refresh:
+            self.start_refresh()
+
+        entry = self.index.get(req.path)
+        if entry is not None:
+            entry = self.revalidate(req.path, entry)
+        if entry is None:
+            self.misses += 1
+            return
+        self.hits += 1
+
+        for _ in range(2):
+            try:
+                self.send_entry(req, res, entry)
+                return
+            except FileNotFoundError:
+                # removed since the last refresh
+                self.drop_entry(req.path)
+                self._clear_file_headers(res)
+                return
+            except StaleFileError:
+                # modified since last checked
+                self._clear_file_headers(res)
+                entry = self.rebuild_entry(req.path, entry)
+                if entry is None:
+                    return
+
+    @staticmethod
+    def _clear_file_headers(res):
+        for header in ('Etag', 'Vary', 'Content-Encoding', 'Cache-Control'):
+            if header in res.headers:
+                del res.headers[header]
+
+    def send_entry(self, req, res, entry):
+        """
+        Sends the indexed file, from the memory cache or its (or a
+        precompressed sibling's) descriptor.
+
+        Raises:
+            StaleFileError: If the file no longer matches the entry
+        """
+        immutable = req.path in self._fingerprinted
+        if immutable:
+            res.headers['Cache-Control'] = self.IMMUTABLE_CACHE_CONTROL
+
+        if self.cache_size and entry.size <= self.cache_max_file_size:
+            headers = {'Cache-Control': self.IMMUTABLE_CACHE_CONTROL} if immutable else None
+            self.send_cached(req, res, req.path,
+                             (entry.mtime_ns, entry.size, entry.ino),
+                             entry.mime, entry.etag,
+                             lambda: self.read_file(entry),
+                             entry.siblings, headers)
+            return
+
+        variant = entry
+        if entry.siblings:
+            res.headers['Vary'] = 'Accept-Encoding'
+            accept_encoding = req.headers.get('ACCEPT-ENCODING', None) or ''
+            encoding = negotiate(accept_encoding, tuple(entry.siblings))
+            if encoding is not None:
+                variant = entry.siblings[encoding]
+                res.headers['Content-Encoding'] = encoding
+
+        res.headers['Etag'] = variant.etag
+        if req.headers.get('IF-NONE-MATCH', None) == variant.etag:
+            res.status_code = 304
+            res.end()
+            return
+
+        data = self.read_file(variant)
+        res.set_type(entry.mime)
+        res.message = data
+        res.status_code = 200
+        res.end()
+        self.log.info("Sent %s (%s)", variant.path, entry.mime)
+
+    def revalidate(self, url, entry):
+        """
+        Returns the index entry of url, checking that its file is
+        unmodified if it was last checked more than
+        revalidate_interval seconds ago (see :meth:`rebuild_entry`).
+        """
+        if self.revalidate_interval is None:
+            return entry
+        now = time.monotonic()
+        if now - entry.checked < self.revalidate_interval:
+            return entry
+        return self.rebuild_entry(url, entry, now)
+
+    def rebuild_entry(self, url, entry, now=None):
+        """
+        Stats the file (and precompressed siblings) of an index entry,
+        returning the entry if they are unmodified, otherwise replacing
+        it with a new entry of the current files. Returns None,
+        dropping the entry, if the file was removed or url is a
+        fingerprint of its former contents.
+        """
+        try:
+            stat = os.stat(entry.path)
+        except FileNotFoundError:
+            self.drop_entry(url)
+            return None
+
+        if entry.matches(stat) and all(map(_unmodified, entry.siblings.values())):
+            entry.checked = time.monotonic() if now is None else now
+            return entry
+
+        if self.fingerprint:
+            # the manifest refers to the former contents
+            self.start_refresh()
+            if url in self._fingerprinted:
+                self.drop_entry(url)
+                return None
+
+        new_entry = StaticFile(entry.path, stat)
+        for encoding in self.precompressed:
+            path = entry.path + PRECOMPRESSED_SUFFIXES[encoding]
+            try:
+                sibling_stat = os.stat(path)
+            except OSError:
+                continue
+            if sibling_stat.st_mtime_ns >= new_entry.mtime_ns:
+                new_entry.siblings[encoding] = StaticFile(path, sibling_stat, '-' + encoding)
+        self.index[url] = new_entry
+        return new_entry
+
+    def drop_entry(self, url):
+        """
+        Removes the entry of url from the index (and the memory cache).
+        """
+        self.index.pop(url, None)
+        self.uncache_file(url)
+
+    def send_cached(self, req, res, key, file_id, mime, etag, read,
+                    siblings=None, headers=None):
+        """
+        Sends a file from the memory cache, filling the cache if the
+        file is missing or has changed.
+
+        Args:
+            key (str): The file's key in the cache; its URL when
+                indexed, otherwise its filesystem path
+            file_id (tuple): Values identifying the file's version
+                (mtime, size and inode)
+            mime (str or None): The file's content type
+            etag (str): The ETag of the uncompressed file
+            read (callable): Returns the file's contents
+            siblings (dict or None): Precompressed siblings of the
+                file (StaticFile objects, by encoding)
+            headers (dict or None): Additional headers to send
+        """
+        cached = self._file_cache.get(key)
+        if cached is not None and cached.file_id == file_id:
+            self._file_cache.move_to_end(key)
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            cached = self.cache_file(key, file_id, mime, etag, read(), siblings, headers)
+
+        encoding = None
+        if cached.encodings:
+            accept_encoding = req.headers.get('ACCEPT-ENCODING', None) or ''
+            encoding = negotiate(accept_encoding, cached.encodings)
+        prebuilt = cached.variants[encoding]
+
+        requested_etag = req.headers.get('IF-NONE-MATCH', None)
+        if requested_etag is not None and requested_etag == prebuilt.headers['Etag']:
+            res.headers['Etag'] = requested_etag
+            if cached.encodings:
+                res.headers['Vary'] = 'Accept-Encoding'
+            res.status_code = 304
+            res.end()
+            return
+
+        res.send_prebuilt(prebuilt)
+
+    def cache_file(self, key, file_id, mime, etag, data, siblings=None, headers=None):
+        """
+        Builds the prebuilt responses of a file, storing them in the
+        memory cache and evicting the least recently used files to stay
+        within cache_size.
+        """
+        compressed = {}
+        if Compression.is_compressible(mime):
+            for encoding in ('zstd', 'gzip'):
+                sibling = (siblings or {}).get(encoding)
+                if sibling is not None:
+                    with open(sibling.path, 'rb') as f:
+                        compressed[encoding] = (f.read(), sibling.etag)
+                elif encoding in ENCODERS:
+                    body = _compress_file_data(data, encoding, 6 if encoding == 'gzip' else 3)
+                    if len(body) < len(data):
+                        compressed[encoding] = (body, "%s-%s" % (etag, encoding))
+
+        headers = dict(headers or {}, Etag=etag)
+        if compressed:
+            headers['Vary'] = 'Accept-Encoding'
+        variants = {None: PrebuiltResponse(data, content_type=mime, headers=headers)}
+        for encoding, (body, variant_etag) in compressed.items():
+            variant_headers = dict(headers, **{'Etag': variant_etag,
+                                               'Content-Encoding': encoding})
+            variants[encoding] = PrebuiltResponse(body, content_type=mime,
+                                                  headers=variant_headers)
+
+        cached = CachedFile(file_id, variants)
+        self.uncache_file(key)
+        if cached.nbytes > self.cache_size:
+            return cached
+
+        self._file_cache[key] = cached
+        self.cache_bytes += cached.nbytes
+        while self.cache_bytes > self.cache_size:
+            _, evicted = self._file_cache.popitem(last=False)
+            self.cache_bytes -= evicted.nbytes
+            self.cache_evictions += 1
+        return cached
+
+    def uncache_file(self, key):
+        """
+        Removes the file stored under key from the memory cache.
+        """
+        cached = self._file_cache.pop(key, None)
+        if cached is not None:
+            self.cache_bytes -= cached.nbytes
+
+    def read_file(self, entry):
+        """
+        Returns the contents of the indexed file, reading through the
+        cache of open file descriptors.
+
+        Raises:
+            StaleFileError: If the file does not match the entry
+        """
+        if self.max_open_files <= 0:
+            with open(entry.path, 'rb') as f:
+                if not entry.matches(os.fstat(f.fileno())):
+                    raise StaleFileError(entry.path)
+                return _pread(f.fileno(), entry.size)
+
+        fd = self._open_fd(entry)
+        if not entry.matches(os.fstat(fd)):
+            # the cached descriptor may be of a replaced file
+            del self._open_files[entry.path]
+            os.close(fd)
+            fd = self._open_fd(entry)
+            if not entry.matches(os.fstat(fd)):
+                raise StaleFileError(entry.path)
+        return _pread(fd, entry.size)
+
+    def _open_fd(self, entry):
+        cached = self._open_files.get(entry.path)
+        if cached is not None:
+            self._open_files.move_to_end(entry.path)
+            return cached[0]
+
+        fd = os.open(entry.path, os.O_RDONLY)
+        self._open_files[entry.path] = (fd, entry)
+        while len(self._open_files) > self.max_open_files:
+            _, (old_fd, _) = self._open_files.popitem(last=False)
+            os.close(old_fd)
+        return fd
+
+    def close(self):
+        """
+        Closes all cached file descriptors.
+        """
+        while self._open_files:
+            _, (fd, _) = self._open_files.popitem()
+            os.close(fd)
+
+    def stats(self):
+        """
+        Returns dict of the index and memory cache metrics.
+        """
+        return {
+            'files': len(self.index or ()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'open_files': len(self._open_files),
+            'cache_files': len(self._file_cache),
+            'cache_bytes': self.cache_bytes,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_evictions': self.cache_evictions,
+        }
+
     @staticmethod
     def calculate_etag(file_path):
         """
@@ -99,6 +826,102 @@ class Static:
         Returns:
             String of the etag value to be sent back in header
         """
-        stat = file_path.stat()
-        etag = "%x-%x" % (stat.st_mtime_ns, stat.st_size)
-        return etag
+        return etag_from_stat(file_path.stat())
+
+
+def _unmodified(entry):
+    """
+    True if the file of the StaticFile is unchanged.
+    """
+    try:
+        return entry.matches(os.stat(entry.path))
+    except OSError:
+        return False
+
+
+def etag_from_stat(stat):
+    """
+    Returns the etag value of the file with the given stat result.
+    """
+    return "%x-%x" % (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_id(stat):
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+if hasattr(os, 'pread'):
+    def _pread(fd, size):
+        return os.pread(fd, size, 0)
+else:  # pragma: no cover
+    def _pread(fd, size):
+        os.lseek(fd, 0, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+def precompress(directory,
+                *,
+                encodings=('gzip', 'zstd'),
+                min_size=256,
+                levels=None,
+                force=False):
+    """
+    Writes compressed siblings ('name.gz', 'name.zst') of the files
+    under directory, to be served by :class:`Static` with
+    precompressed enabled. Meant to be run when building or deploying
+    the application.
+
+    Files smaller than min_size, those already compressed (by type),
+    and existing compressed files are skipped, as are siblings which
+    are up to date; compressed files which would not be smaller than
+    the original are not written.
+
+    Args:
+        directory (str or Path): Root of the tree to compress
+        encodings (iterable of str): Encodings to produce; 'zstd' is
+            ignored if unavailable.
+        min_size (int): Smallest file size (bytes) to compress
+        levels (dict or None): Compression level of each encoding
+        force (bool): Rewrite siblings even if they are up to date
+
+    Returns:
+        list of Path: The files written
+    """
+    levels = dict({'gzip': 9, 'zstd': 19}, **(levels or {}))
+    encodings = [enc for enc in encodings if enc != 'zstd' or zstd is not None]
+    skip_suffixes = tuple(PRECOMPRESSED_SUFFIXES.values())
+    is_compressible = Compression.is_compressible
+
+    written = []
+    for root, _, filenames in os.walk(str(directory)):
+        for filename in sorted(filenames):
+            path = Path(root, filename)
+            if filename.endswith(skip_suffixes):
+                continue
+            stat = path.stat()
+            if stat.st_size < min_size:
+                continue
+            if not is_compressible(mimetypes.guess_type(filename)[0]):
+                continue
+
+            data = None
+            for encoding in encodings:
+                target = path.with_name(filename + PRECOMPRESSED_SUFFIXES[encoding])
+                if (not force and target.exists()
+                        and target.stat().st_mtime_ns >= stat.st_mtime_ns):
+                    continue
+                if data is None:
+                    data = path.read_bytes()
+                compressed = _compress_file_data(data, encoding, levels[encoding])
+                if len(compressed) >= len(data):
+                    continue
+                target.write_bytes(compressed)
+                written.append(target)
+    return written
+
+
+def _compress_file_data(data, encoding, level):
+    if encoding == 'zstd':
+        return zstd.compress(data, level=level)
+    # mtime=0 makes the output reproducible between builds
+    return gzip.compress(data, compresslevel=level, mtime=0)
@@ -0,0 +1,403 @@
+#
+# growler/middleware/template.py
+#
+"""
+A small template engine, compiling templates with conditionals, loops
+and includes to python code objects.
+
+.. code:: html
+
+    {# views/index.html.tpl #}
+    {% include "header" %}
+    <ul>
+    {% for i, item in enumerate(items) %}
+      <li class="{{ 'odd' if i % 2 else 'even' }}">{{ item.name }}</li>
+    {% endfor %}
+    </ul>
+    {% if user %}Hello {{ user }}{% else %}Please log in{% endif %}
+
+Tags:
+
+* ``{{ expr }}`` - the (html escaped) value of a python expression
+* ``{{! expr }}`` - the value of the expression, *not* escaped
+* ``{% if expr %}``, ``{% elif expr %}``, ``{% else %}``, ``{% endif %}``
+* ``{% for target in expr %}``, ``{% endfor %}``
+* ``{% set name = expr %}`` - assigns a variable
+* ``{% include expr %}`` - renders the template named by the expression,
+  with the same variables
+* ``{# comment #}``
+
+Each template is translated into python source once, and compiled; the
+code object is kept in the engine's TemplateCache. Rendering executes
+the code with the template's values as its namespace, collecting the
+output fragments in a list joined once at the end.
+Streamed rendering instead runs a generator function compiled (upon
+first use) from the same template, yielding the fragments as they are
+produced so the page is sent while it renders.
+
+Expressions are python code executed with the application's
+privileges; templates must be trusted.
+"""
+
+import re
+import ast
+import logging
+from types import FunctionType
+from html import escape as _html_escape
+
+from .renderer import Renderer, RenderEngine
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateSyntaxError(SyntaxError):
+    """
+    Raised when a template cannot be compiled.
+    """
+
+
+class Markup(str):
+    """
+    A string of html which is not escaped when rendered.
+    """
+
+    __slots__ = ()
+
+    def __html__(self):
+        return self
+
+
+def escape(value):
+    """
+    Returns the html escaped str of value; objects with an __html__
+    method (such as Markup) provide their own html.
+    """
+    if hasattr(value, '__html__'):
+        return value.__html__()
+    return _html_escape(str(value))
+
+
+TOKEN_RE = re.compile(r'{{.*?}}|{%.*?%}|{#.*?#}', re.DOTALL)
+FOR_RE = re.compile(r'^(.+?)\s+in\s+(.+)$', re.DOTALL)
+SET_RE = re.compile(r'^([A-Za-z_][\w\s,]*?)\s*=(?!=)\s*(.+)$', re.DOTALL)
+
+
+class CompiledTemplate:
+    """
+    A template translated to python code.
+
+    Attributes:
+        filename (str): Name of the template file, used in errors
+        python_source (str): The generated python code
+        code (code): The compiled python_source
+    """
+
+    __slots__ = ('filename', 'source', 'python_source', 'code', '_stream_code')
+
+    def __init__(self, source, filename='<template>'):
+        """
+        Args:
+            source (str): The template text
+            filename (str): Name of the template, used in errors
+
+        Raises:
+            TemplateSyntaxError: If the template is invalid
+        """
+        self.filename = filename
+        self.source = source
+        self.python_source = _TemplateCompiler(source, filename).compile()
+        self.code = compile(self.python_source, filename, 'exec')
+        self._stream_code = None
+
+    def render_into(self, namespace, out, include=None):
+        """
+        Runs the template with the variables in the namespace dict
+        (which is modified), appending the output fragments to the out
+        list.
+
+        Args:
+            namespace (dict): The template's variables
+            out (list): Receives the output fragments
+            include (callable or None): Called with the names of
+                included templates
+        """
+        namespace['_t_extend'] = out.extend
+        namespace['_t_esc'] = escape
+        namespace['_t_include'] = include or self._no_include
+        exec(self.code, namespace)
+
+    @property
+    def stream_code(self):
+        """
+        The compiled code of the generator function `_t_render`,
+        yielding the output fragments one at a time.
+        """
+        if self._stream_code is None:
+            compiler = _TemplateCompiler(self.source, self.filename, stream=True)
+            module = compile(compiler.compile(), self.filename, 'exec')
+            self._stream_code = next(const for const in module.co_consts
+                                     if getattr(const, 'co_name', None) == '_t_render')
+        return self._stream_code
+
+    def iter_render(self, namespace, include=None):
+        """
+        Returns a generator running the template with the variables in
+        the namespace dict (which is modified), yielding the output
+        fragments as they are produced.
+
+        Args:
+            namespace (dict): The template's variables
+            include (callable or None): Called with the names of
+                included templates, returns their fragments
+        """
+        namespace['_t_esc'] = escape
+        namespace['_t_include'] = include or self._no_include
+        return FunctionType(self.stream_code, namespace)()
+
+    def render(self, obj=None):
+        """
+        Returns the template rendered with the values of obj.
+        """
+        out = []
+        self.render_into(dict(obj or {}), out)
+        return ''.join(out)
+
+    @staticmethod
+    def _no_include(name):
+        raise ValueError("Cannot include template %r outside of an engine" % name)
+
+
+class _TemplateCompiler:
+    """
+    Translates template text to python source, or with `stream` to the
+    source of a generator function.
+
+    Names assigned by the template (loop targets and set tags) are
+    declared global in the generator, so they are kept in the namespace
+    shared with included templates.
+    """
+
+    def __init__(self, source, filename, stream=False):
+        self.source = source
+        self.filename = filename
+        self.stream = stream
+        self.lines = []
+        self.indent = 1 if stream else 0
+        self.blocks = []
+        self.pending = []
+        self.lineno = 1
+
+    def error(self, message):
+        return TemplateSyntaxError(message, (self.filename, self.lineno, None, None))
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def flush(self):
+        """
+        Emits a single call outputting all pending fragments or, when
+        streaming, statements yielding them one at a time, so each is
+        sent before the next is evaluated.
+        """
+        if self.stream:
+            for fragment in self.pending:
+                self.emit('yield %s' % fragment)
+        elif self.pending:
+            self.emit('_t_extend((%s,))' % ', '.join(self.pending))
+        self.pending = []
+
+    def check(self, code, mode='eval'):
+        if not code:
+            raise self.error("Missing expression")
+        try:
+            compile('(%s)' % code if mode == 'eval' else code, self.filename, mode)
+        except SyntaxError as err:
+            raise self.error("Invalid expression %r: %s" % (code, err.msg)) from None
+        return code
+
+    def open_block(self, kind, header):
+        self.flush()
+        self.emit(header)
+        self.indent += 1
+        self.emit('pass')
+        self.blocks.append([kind, self.lineno, False])
+
+    def continue_block(self, kind, header):
+        self.flush()
+        if not self.blocks or self.blocks[-1][0] != 'if' or self.blocks[-1][2]:
+            raise self.error("Unexpected '%s'" % kind)
+        if kind == 'else':
+            self.blocks[-1][2] = True
+        self.indent -= 1
+        self.emit(header)
+        self.indent += 1
+        self.emit('pass')
+
+    def close_block(self, kind):
+        self.flush()
+        if not self.blocks or self.blocks[-1][0] != kind:
+            raise self.error("Unexpected 'end%s'" % kind)
+        self.blocks.pop()
+        self.indent -= 1
+
+    def compile(self):
+        source = self.source
+        pos = 0
+        for match in TOKEN_RE.finditer(source):
+            text = source[pos:match.start()]
+            if text:
+                self.pending.append(repr(text))
+            self.lineno += source.count('\n', pos, match.start())
+            self.compile_tag(match.group())
+            self.lineno += match.group().count('\n')
+            pos = match.end()
+
+        if pos < len(source):
+            self.pending.append(repr(source[pos:]))
+        self.flush()
+
+        if self.blocks:
+            kind, self.lineno, _ = self.blocks[-1]
+            raise self.error("Unclosed '%s' block" % kind)
+        if not self.stream:
+            return '\n'.join(self.lines) + '\n'
+
+        # an empty 'yield from' makes the function a generator
+        body = ['    yield from ()'] + self.lines
+        names = sorted(self.assigned_names('\n'.join(body)))
+        if names:
+            body.insert(0, '    global %s' % ', '.join(names))
+        return 'def _t_render():\n' + '\n'.join(body) + '\n'
+
+    @staticmethod
+    def assigned_names(source):
+        """
+        Returns the set of names assigned in the (indented) source.
+        """
+        tree = ast.parse('if 1:\n' + source)
+        return {node.id for node in ast.walk(tree)
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+
+    def compile_tag(self, tag):
+        body = tag[2:-2].strip()
+        if tag.startswith('{#'):
+            return
+
+        if tag.startswith('{{'):
+            if body.startswith('!'):
+                self.pending.append('str((%s))' % self.check(body[1:].strip()))
+            else:
+                self.pending.append('_t_esc((%s))' % self.check(body))
+            return
+
+        keyword, _, arg = body.partition(' ')
+        arg = arg.strip()
+        if self.compile_block_tag(keyword, arg, body):
+            return
+        if keyword == 'set':
+            if SET_RE.match(arg) is None:
+                raise self.error("Invalid assignment %r" % body)
+            self.flush()
+            self.emit(self.check(arg, 'exec'))
+        elif keyword == 'include':
+            self.flush()
+            call = '_t_include((%s))' % self.check(arg)
+            self.emit('yield from ' + call if self.stream else call)
+        else:
+            raise self.error("Unknown tag %r" % body)
+
+    def compile_block_tag(self, keyword, arg, body):
+        """
+        Compiles the tags opening, continuing or closing if and for
+        blocks, returning False for any other tag.
+        """
+        if keyword == 'if':
+            self.open_block('if', 'if (%s):' % self.check(arg))
+        elif keyword == 'elif':
+            self.continue_block('elif', 'elif (%s):' % self.check(arg))
+        elif keyword == 'else' and not arg:
+            self.continue_block('else', 'else:')
+        elif keyword == 'endif' and not arg:
+            self.close_block('if')
+        elif keyword == 'for':
+            match = FOR_RE.match(arg)
+            if match is None:
+                raise self.error("Invalid for loop %r" % body)
+            header = 'for %s in (%s):' % match.groups()
+            self.check(header + ' pass', 'exec')
+            self.open_block('for', header)
+        elif keyword == 'endfor' and not arg:
+            self.close_block('for')
+        else:
+            return False
+        return True
+
+
+class TemplateEngine(RenderEngine):
+    """
+    Render engine of :class:`CompiledTemplate` templates, with files
+    ending in '.html.tpl'.
+
+    >>> app.use(TemplateEngine('views', auto_reload=False))
+    >>> app.get('/', lambda req, res: res.render('index', {'items': items}))
+    """
+
+    default_file_extensions = [
+        '.html.tpl',
+    ]
+
+    max_include_depth = 32
+
+    def compile_template(self, filename):
+        with open(filename, 'r') as file:
+            return CompiledTemplate(file.read(), filename)
+
+    def render_source(self, filename, obj=None):
+        out = []
+        namespace = dict(obj or {})
+        depth = 0
+
+        def include(name):
+            nonlocal depth
+            included = self.get_included(name, depth)
+            depth += 1
+            try:
+                included.render_into(namespace, out, include)
+            finally:
+                depth -= 1
+
+        template = self.templates.get(self.path.joinpath(filename))
+        template.render_into(namespace, out, include)
+        return ''.join(out)
+
+    def render_stream(self, filename, obj=None):
+        namespace = dict(obj or {})
+        depth = 0
+
+        def include(name):
+            nonlocal depth
+            included = self.get_included(name, depth)
+            depth += 1
+            try:
+                yield from included.iter_render(namespace, include)
+            finally:
+                depth -= 1
+
+        template = self.templates.get(self.path.joinpath(filename))
+        return template.iter_render(namespace, include)
+
+    def get_included(self, name, depth):
+        """
+        Returns the compiled template included by name, from a template
+        nested depth includes deep.
+        """
+        included = self.resolve(name)
+        if included is None:
+            raise ValueError("Could not find a template with name '%s'" % name)
+        if depth >= self.max_include_depth:
+            raise ValueError("Templates included more than %d deep" % depth)
+        return self.templates.get(included)
+
+
+# register the renderer
+Renderer.render_engine_map['template'] = TemplateEngine
@@ -11,9 +11,13 @@ without directly accessing this.
 
 import re
 import logging
-from inspect import signature
+from asyncio import gather
+from inspect import signature, isawaitable, unwrap
 from collections import OrderedDict
 from growler.http import HTTPMethod
+from growler.http.response import PrebuiltResponse
+from growler.aio.executor import ExecutorMiddleware
+from growler.aio.limiter import ConcurrencyLimiter, LimitedMiddleware
 
 ROUTABLE_NAME_REGEX = re.compile(
     "(%s)_.*" % '|'.join([
@@ -40,6 +44,12 @@ class MiddlewareNode:
 
     A 'subchain' middleware node has the subtree stored as the func
     attribute.
+
+    The 'provides' and 'needs' slots are sets of names declaring what
+    the middleware sets up for the rest of the chain, and what it
+    requires from other middleware (e.g. 'session' or 'user').
+    Middleware declaring either may be run concurrently with its
+    neighbors; see :class:`ConcurrentMiddleware`.
     """
 
     IGNORE_TRAILING_SLASH = True
@@ -50,6 +60,8 @@ class MiddlewareNode:
         'mask',
         'is_errorhandler',
         'is_subchain',
+        'provides',
+        'needs',
     ]
 
     def __init__(self, **inits):
@@ -82,6 +94,14 @@ class MiddlewareNode:
         """
         return self.mask & method
 
+    @property
+    def is_concurrent(self):
+        """
+        True if the node declared dependency information, allowing it
+        to be run alongside other concurrent middleware.
+        """
+        return bool(self.provides or self.needs)
+
     def path_split(self, path):
         """
         Splits a path into the part matching this middleware and the
@@ -133,6 +153,7 @@ class MiddlewareChain:
 
     def __init__(self):
         self.mw_list = []
+        self.concurrent_groups = {}
         self.log = logging.getLogger("%s:%d" % (__name__, id(self)))
 
     def __call__(self, method, path):
@@ -170,7 +191,9 @@ class MiddlewareChain:
         error_handler_stack = []
 
         # loop through all middleware matching the request
-        matching_middleware = self.find_matching_middleware(method, path)
+        matching_middleware = self.group_concurrent_middleware(
+            self.find_matching_middleware(method, path)
+        )
         for mw, path_match, rest_url in matching_middleware:
 
             # If a subchain - loop through middleware
@@ -225,6 +248,50 @@ class MiddlewareChain:
 
             yield mw, path_match, rest_url
 
+    def group_concurrent_middleware(self, matching_middleware):
+        """
+        Collects consecutive matching middleware belonging to the same
+        concurrent group (see :meth:`add`) into a single node, holding
+        the group's :class:`ConcurrentMiddleware` restricted to the
+        matching members.
+        All other nodes pass through unchanged.
+        """
+        group, items = None, []
+        for item in matching_middleware:
+            item_group = self.concurrent_groups.get(item[0])
+            if item_group is not None and item_group is group:
+                items.append(item)
+                continue
+
+            if items:
+                yield self._concurrent_node(group, items)
+
+            if item_group is None:
+                group, items = None, []
+                yield item
+            else:
+                group, items = item_group, [item]
+
+        if items:
+            yield self._concurrent_node(group, items)
+
+    @staticmethod
+    def _concurrent_node(group, items):
+        if len(items) == 1:
+            return items[0]
+
+        mw, path_match, rest_url = items[0]
+        node = MiddlewareNode(
+            func=group.select([item[0] for item in items]),
+            mask=mw.mask,
+            path=mw.path,
+            is_errorhandler=False,
+            is_subchain=False,
+            provides=frozenset(),
+            needs=frozenset(),
+        )
+        return node, path_match, rest_url
+
     def iterate_subchain(self, chain):
         """
         A coroutine used by __call__ to forward all requests to a
@@ -262,7 +329,7 @@ class MiddlewareChain:
         """
         return bool(not matching)
 
-    def add(self, method_mask, path, func):
+    def add(self, method_mask, path, func, *, provides=None, needs=None):
         """
         Add a function to the middleware chain.
         This function is returned when iterating over the chain with
@@ -276,6 +343,17 @@ class MiddlewareChain:
             func (callable): The function to be yieled from the
                 generator upon a request matching the method_mask
                 and path
+            provides (str or iterable of str): Names of what the
+                middleware provides to the rest of the chain
+            needs (str or iterable of str): Names of what the
+                middleware requires from other middleware
+
+        Consecutive middleware declaring provides or needs form a
+        concurrent group, whose :class:`ConcurrentMiddleware` is built
+        here rather than upon each request.
+
+        Raises:
+            ValueError: If the dependencies of the group are circular.
         """
         is_err = len(signature(func).parameters) == 3
         is_subchain = isinstance(func, MiddlewareChain)
@@ -285,7 +363,18 @@ class MiddlewareChain:
             path=path,
             is_errorhandler=is_err,
             is_subchain=is_subchain,
+            provides=_name_set(provides),
+            needs=_name_set(needs),
         )
+        if tup.is_concurrent and not (is_err or is_subchain):
+            run = [tup]
+            for node in reversed(self.mw_list):
+                if node not in self.concurrent_groups:
+                    break
+                run.insert(0, node)
+            group = ConcurrentMiddleware(run)
+            for node in run:
+                self.concurrent_groups[node] = group
         self.mw_list.append(tup)
 
     def __contains__(self, func):
@@ -303,7 +392,8 @@ class MiddlewareChain:
             bool: True if func is a function contained anywhere in
                 the chain.
         """
-        return any((func is mw.func) or (mw.is_subchain and func in mw.func)
+        return any((func is mw.func) or (func is unwrap(mw.func))
+                   or (mw.is_subchain and func in mw.func)
                    for mw in self.mw_list)
 
     def count_all(self):
@@ -361,6 +451,141 @@ class MiddlewareChain:
         return self.mw_list[-1]
 
 
+class ConcurrentMiddleware:
+    """
+    Middleware running a group of middleware which have declared what
+    they provide and need, concurrently.
+
+    The group is split into 'waves': each wave holds the middleware
+    whose needs are not provided by any group member that has yet to
+    run.
+    Within a wave, each middleware is called (in order of
+    registration) and any awaitables returned are gathered together.
+    If the response has ended after a wave, the remaining waves are
+    not run.
+
+    Needs which are not provided by a member of the group are assumed
+    to have been handled by earlier middleware.
+
+    A group is built once, from all the middleware registered together;
+    :meth:`select` returns the group restricted to the members matching
+    a request, keeping the order of the waves.
+    """
+
+    def __init__(self, nodes, node_waves=None):
+        """
+        Args:
+            nodes (list of MiddlewareNode): The grouped nodes, in
+                order of registration.
+            node_waves (list of lists of MiddlewareNode): The waves of
+                nodes, if already sorted
+
+        Raises:
+            ValueError: If the dependencies of the nodes are circular.
+        """
+        self.nodes = list(nodes)
+        self.funcs = [node.func for node in self.nodes]
+        if node_waves is None:
+            node_waves = self._sort_waves(self.nodes)
+        self.node_waves = node_waves
+        self.waves = [[node.func for node in wave] for wave in node_waves]
+
+    @staticmethod
+    def _sort_waves(nodes):
+        group_provides = frozenset().union(*(node.provides for node in nodes))
+        provided = set()
+        remaining = list(nodes)
+        waves = []
+        while remaining:
+            wave = [node for node in remaining
+                    if not (node.needs & group_provides) - provided]
+            if not wave:
+                raise ValueError("Circular middleware dependencies: %r" %
+                                 [node.func for node in remaining])
+            for node in wave:
+                remaining.remove(node)
+                provided |= node.provides
+            waves.append(wave)
+        return waves
+
+    def select(self, nodes):
+        """
+        Returns the group restricted to the given member nodes (self,
+        if that is every member).
+        """
+        if len(nodes) == len(self.nodes):
+            return self
+        selected = set(map(id, nodes))
+        node_waves = [[node for node in wave if id(node) in selected]
+                      for wave in self.node_waves]
+        return self.__class__(nodes, [wave for wave in node_waves if wave])
+
+    def __call__(self, req, res):
+        """
+        Runs the waves of synchronous middleware directly, returning
+        a coroutine finishing the group once an awaitable is found.
+        """
+        for idx, wave in enumerate(self.waves):
+            awaitables = self._call_wave(wave, req, res)
+            if awaitables:
+                return self._finish(req, res, idx, awaitables)
+            if res.has_ended:
+                break
+        return None
+
+    @staticmethod
+    def _call_wave(wave, req, res):
+        """
+        Calls the middleware of a wave, returning the awaitables they
+        return. Stops calling once the response has ended.
+        """
+        awaitables = []
+        try:
+            for func in wave:
+                ret_val = func(req, res)
+                if isawaitable(ret_val):
+                    awaitables.append(ret_val)
+                if res.has_ended:
+                    break
+        except BaseException:
+            for awaitable in awaitables:
+                close = getattr(awaitable, 'close', None)
+                if close is not None:
+                    close()
+            raise
+        return awaitables
+
+    async def _finish(self, req, res, idx, awaitables):
+        while True:
+            results = await gather(*awaitables, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+            idx += 1
+            awaitables = []
+            while not awaitables:
+                if res.has_ended or idx == len(self.waves):
+                    return
+                awaitables = self._call_wave(self.waves[idx], req, res)
+                if not awaitables:
+                    idx += 1
+
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.funcs)
+
+
+def _name_set(names):
+    """
+    Normalizes a 'provides' or 'needs' argument into a frozenset.
+    """
+    if names is None:
+        return frozenset()
+    if isinstance(names, str):
+        return frozenset((names, ))
+    return frozenset(names)
+
+
 class Router(MiddlewareChain):
     """
     The router class holds all the 'routes': callbacks connected
@@ -388,14 +613,37 @@ class Router(MiddlewareChain):
     The default growler.App has its root router at self.router, and
     offers convience aliases to automatically add routes:
     >>> app.get(..) == app.router.get(...)
+
+    A router may limit the number of requests its routes handle at
+    once; requests beyond the limit wait in a queue, ordered by the
+    priority given to each route, and are refused with a 503 if the
+    queue is full:
+
+    >>> api = Router(concurrency=16, max_queue=64)
+    >>> api.get("/healthz", healthz, priority='critical')
     """
     sinatra_param_regex = re.compile(r":(\w+)")
     regex_type = type(sinatra_param_regex)
 
-    def __init__(self):
+    # default max_queue of limits, per concurrent request
+    queue_factor = 4
+
+    def __init__(self, *, concurrency=None, max_queue=None):
+        """
+        Args:
+            concurrency (int or ConcurrencyLimiter or None): Maximum
+                number of requests handled by the routes of this
+                router at once. A limiter object may be shared
+                between routers.
+            max_queue (int or None): Maximum number of requests which
+                may wait for the router; None defaults to queue_factor
+                times concurrency. For an unbounded queue pass a
+                ConcurrencyLimiter as concurrency.
+        """
         super().__init__()
         self.log = logger.getChild("id=%x" % id(self))
         self.add_route = self.add
+        self.limiter = self._make_limiter(concurrency, max_queue)
 
     def add_router(self, path, router):
         """
@@ -406,10 +654,10 @@ class Router(MiddlewareChain):
         self.add(HTTPMethod.ALL, path, router)
         return self
 
-    def _add_route(self, method, path, middleware=None):
+    def _add_route(self, method, path, middleware=None, **options):
         """The implementation of adding a route"""
-        if middleware is not None:
-            self.add(method, path, middleware)
+        if middleware is not None or options.get('static_response') is not None:
+            self.add(method, path, self.route_middleware(middleware, **options))
             return self
         else:
 
@@ -417,32 +665,89 @@ class Router(MiddlewareChain):
                 """
                 Function called when _add_route is used as a decorator
                 """
-                self.add(method, path, func)
+                self.add(method, path, self.route_middleware(func, **options))
                 return func
 
             return addroute_decorator
 
-    def all(self, path, middleware=None):
+    def route_middleware(self,
+                         middleware,
+                         *,
+                         executor=None,
+                         concurrency=None,
+                         max_queue=None,
+                         priority=None,
+                         static_response=None):
+        """
+        Applies the per-route options given upon registration to the
+        middleware, returning the callable to be stored in the chain.
+
+        Args:
+            middleware (callable): The route function
+            executor (str or MiddlewareExecutor or bool): Run the
+                (synchronous) route in an executor, off of the event
+                loop.
+                Names (e.g. 'thread') refer to the application's
+                executors, True selects the application's default.
+            concurrency (int or ConcurrencyLimiter or None): Maximum
+                number of requests this route handles at once.
+            max_queue (int or None): Maximum number of requests which
+                may wait for the route; None defaults to queue_factor
+                times concurrency.
+            priority (str or int or None): The priority class
+                (see :class:`growler.aio.limiter.Priority`) of the
+                route's requests waiting for this router or route.
+            static_response (PrebuiltResponse or str or bytes or dict):
+                A constant response, serialized upon registration, sent
+                in place of calling a route function (middleware must
+                be None). See :class:`growler.http.response.PrebuiltResponse`.
+        """
+        if static_response is not None:
+            if middleware is not None:
+                raise TypeError("Route given both middleware and a static_response")
+            middleware = PrebuiltResponse.from_value(static_response)
+
+        if executor:
+            middleware = ExecutorMiddleware(middleware, executor)
+
+        if self.limiter is not None:
+            middleware = LimitedMiddleware(middleware, self.limiter, priority)
+
+        limiter = self._make_limiter(concurrency, max_queue)
+        if limiter is not None:
+            middleware = LimitedMiddleware(middleware, limiter, priority)
+
+        return middleware
+
+    @classmethod
+    def _make_limiter(cls, concurrency, max_queue):
+        if concurrency is None or isinstance(concurrency, ConcurrencyLimiter):
+            return concurrency
+        if max_queue is None:
+            max_queue = cls.queue_factor * concurrency
+        return ConcurrencyLimiter(concurrency, max_queue)
+
+    def all(self, path, middleware=None, **options):
         """ Matches all HTTP requests """
-        return self._add_route(HTTPMethod.ALL, path, middleware)
+        return self._add_route(HTTPMethod.ALL, path, middleware, **options)
 
-    def get(self, path, middleware=None):
+    def get(self, path, middleware=None, **options):
         """ Matches "GET" HTTP request """
-        return self._add_route(HTTPMethod.GET, path, middleware)
+        return self._add_route(HTTPMethod.GET, path, middleware, **options)
 
-    def post(self, path, middleware=None):
+    def post(self, path, middleware=None, **options):
         """ Matches "POST" HTTP request """
-        return self._add_route(HTTPMethod.POST, path, middleware)
+        return self._add_route(HTTPMethod.POST, path, middleware, **options)
 
-    def put(self, path, middleware=None):
+    def put(self, path, middleware=None, **options):
         """ Matches "PUT" HTTP request """
-        return self._add_route(HTTPMethod.PUT, path, middleware)
+        return self._add_route(HTTPMethod.PUT, path, middleware, **options)
 
-    def delete(self, path, middleware=None):
+    def delete(self, path, middleware=None, **options):
         """ Matches "DELETE" HTTP request """
-        return self._add_route(HTTPMethod.DELETE, path, middleware)
+        return self._add_route(HTTPMethod.DELETE, path, middleware, **options)
 
-    def use(self, middleware, path=None):
+    def use(self, middleware, path=None, *, provides=None, needs=None):
         """
         Call the provided middleware upon requests matching the path.
         If path is not provided or None, all requests will match.
@@ -452,13 +757,17 @@ class Router(MiddlewareChain):
                 ``(res, req) -> None``
             path (Optional[str or regex]): a specific path the
                 request must match for the middleware to be called.
+            provides (Optional[str or iterable]): Names of what the
+                middleware provides to the rest of the chain
+            needs (Optional[str or iterable]): Names of what the
+                middleware requires from other middleware
         Returns:
             This router
         """
         self.log.info(" Using middleware %r", middleware)
         if path is None:
             path = MiddlewareChain.ROOT_PATTERN
-        self.add(HTTPMethod.ALL, path, middleware)
+        self.add(HTTPMethod.ALL, path, middleware, provides=provides, needs=needs)
         return self
 
     def match_routes(self, req):
@@ -511,6 +820,116 @@ class Router(MiddlewareChain):
         return re.compile('/'.join(regex))
 
 
+class VirtualHostRouter:
+    """
+    Middleware dispatching requests to one of many applications based
+    on the request's HOST header, before any path matching is done.
+
+    Hosts are stored in dicts, so the cost of finding the target does
+    not grow with the number of hosts.
+    Names beginning with '*.' match any subdomain (e.g. '*.example.com'
+    matches 'a.example.com' and 'a.b.example.com', but not
+    'example.com'); exact names take precedence, then the most
+    specific wildcard.
+
+    >>> vhosts = VirtualHostRouter()
+    >>> vhosts.add('example.com', example_app)
+    >>> vhosts.add('*.tenant.io', tenant_router)
+    >>> app.use(vhosts)
+
+    Targets are growler applications, which run their own middleware
+    chain (including 404 and error handling) for the request.
+    Routers (any MiddlewareChain) are wrapped in an application.
+    Requests for unknown hosts are sent to the `default` target, or if
+    that is None, continue along the current middleware chain.
+    """
+
+    def __init__(self, hosts=None, default=None):
+        """
+        Args:
+            hosts (Optional[dict]): Initial mapping of host name to
+                target
+            default (Optional[Application or MiddlewareChain]): Target
+                of requests with unknown hosts
+        """
+        self.hosts = {}
+        self.wildcards = {}
+        self.default = None if default is None else self._as_app(default)
+        self.log = logger.getChild("id=%x" % id(self))
+
+        for host, target in (hosts or {}).items():
+            self.add(host, target)
+
+    def add(self, host, target):
+        """
+        Route requests for host to target.
+
+        Args:
+            host (str): The host name, optionally with a leading '*.'
+                to match all subdomains.
+            target (Application or MiddlewareChain): The handler of
+                requests to the host.
+        """
+        host = self.normalize_host(host)
+        target = self._as_app(target)
+        if host.startswith('*.'):
+            self.wildcards[host[2:]] = target
+        else:
+            self.hosts[host] = target
+        return target
+
+    @staticmethod
+    def _as_app(target):
+        if isinstance(target, MiddlewareChain):
+            from growler.application import Application
+            target = Application(middleware_chain=target)
+        return target
+
+    def lookup(self, host):
+        """
+        Returns the target of the (unnormalized) host, or the default
+        target if there is no match.
+        """
+        host = self.normalize_host(host)
+        try:
+            return self.hosts[host]
+        except KeyError:
+            pass
+
+        if self.wildcards:
+            parent = host
+            dot = parent.find('.')
+            while dot != -1:
+                parent = parent[dot + 1:]
+                try:
+                    return self.wildcards[parent]
+                except KeyError:
+                    dot = parent.find('.')
+
+        return self.default
+
+    @staticmethod
+    def normalize_host(host):
+        """
+        Lowercases the host and removes any port number and trailing
+        dot.
+        """
+        if host.startswith('['):
+            host = host[:host.find(']') + 1]
+        else:
+            host = host.partition(':')[0]
+        return host.rstrip('.').lower()
+
+    def __call__(self, req, res):
+        target = self.lookup(req.headers.get('HOST', ''))
+        if target is None:
+            return None
+        return target.start_client_request(req, res)
+
+    def __len__(self):
+        return len(self.hosts) + len(self.wildcards)
+
+
 class RouterMeta(type):
     """
     A metaclass for classes that should automatically be converted
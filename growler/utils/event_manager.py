@@ -123,6 +123,12 @@ class Events:
         self._event_list[name].append(_callback)
         return _callback
 
+    def has_listeners(self, name):
+        """
+        Returns True if any callback was added to the event named 'name'.
+        """
+        return bool(self._event_list.get(name))
+
     async def emit(self, name):
         """
         Add a callback to the event named 'name'.
@@ -0,0 +1,103 @@
+#
+# tests/middleware/test_bundle.py
+#
+
+import gzip
+import pytest
+from unittest import mock
+from growler.middleware import Static
+from growler.middleware.bundle import (
+    Bundle,
+    StaticBundle,
+    build_bundle,
+    main,
+)
+
+
+@pytest.fixture
+def tree(tmpdir):
+    public = tmpdir.mkdir('public')
+    (public / 'index.html').write('<html></html>')
+    (public.mkdir('js') / 'app.js').write('var x = 1;\n' * 100)
+    return public
+
+
+@pytest.fixture
+def bundle_file(tree, tmpdir):
+    filename = str(tmpdir / 'public.bundle')
+    assert build_bundle(str(tree), filename, encodings=['gzip']) == 2
+    return filename
+
+
+@pytest.fixture
+def static(bundle_file):
+    static = Static.from_bundle(bundle_file)
+    yield static
+    static.close()
+
+
+def call(static, path, **headers):
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.path = path
+    req.headers = headers
+    res.headers = {}
+    static(req, res)
+    return res
+
+
+def test_bundle_index(bundle_file):
+    bundle = Bundle(bundle_file)
+    assert sorted(bundle.index) == ['/index.html', '/js/app.js']
+    entry = bundle.get('/index.html')
+    assert bytes(bundle.view(entry.offset, entry.size)) == b'<html></html>'
+    assert entry.mime == 'text/html'
+    assert not entry.variants
+    assert 'gzip' in bundle.get('/js/app.js').variants
+    bundle.close()
+
+
+def test_not_a_bundle(tmpdir):
+    f = tmpdir / 'junk'
+    f.write('not a bundle at all, no, not at all')
+    with pytest.raises(ValueError):
+        Bundle(str(f))
+
+
+def test_serve_memoryview(static):
+    assert isinstance(static, StaticBundle)
+    res = call(static, '/index.html')
+    assert isinstance(res.message, memoryview)
+    assert bytes(res.message) == b'<html></html>'
+    res.set_type.assert_called_with('text/html')
+    assert res.end.called
+    assert res.headers['Etag'].startswith('"')
+
+
+def test_serve_compressed_variant(static):
+    res = call(static, '/js/app.js', **{'ACCEPT-ENCODING': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert res.headers['Etag'].endswith('-gzip"')
+    assert gzip.decompress(bytes(res.message)) == b'var x = 1;\n' * 100
+
+
+def test_not_modified(static):
+    etag = static.bundle.get('/index.html').etag
+    res = call(static, '/index.html', **{'IF-NONE-MATCH': etag})
+    assert res.status_code == 304
+    assert not res.set_type.called
+
+
+def test_miss(static):
+    res = call(static, '/api/users')
+    assert not res.end.called
+    assert static.stats()['misses'] == 1
+
+
+def test_cli(tree, tmpdir, capsys):
+    output = str(tmpdir / 'cli.bundle')
+    assert main([str(tree), output, '--compress', 'gzip']) == 0
+    assert 'Packed 2 files' in capsys.readouterr().out
+    bundle = Bundle(output)
+    assert len(bundle) == 2
+    bundle.close()
@@ -0,0 +1,234 @@
+#
+# tests/middleware/test_cache.py
+#
+
+import pytest
+import growler
+from unittest import mock
+from growler.http import HTTPMethod
+from mocks import make_req, make_res
+from growler.middleware.cache import (
+    ResponseCache,
+    CachedResponse,
+    parse_cache_control,
+)
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(max_bytes=4096)
+
+
+def handle(cache, req, body='hello', cache_control='max-age=60', status=200):
+    """Passes req through the cache, calling the 'handler' on a miss"""
+    res = make_res()
+    cache(req, res)
+    if not res.has_ended:
+        if cache_control:
+            res.headers['Cache-Control'] = cache_control
+        res.send_text(body, status)
+    return res
+
+
+def sent_body(res):
+    return res.protocol.transport.write.call_args_list[-1][0][0]
+
+
+def test_parse_cache_control():
+    directives = parse_cache_control('public, max-age=10, stale-while-revalidate="5"')
+    assert directives == {'public': None,
+                          'max-age': '10',
+                          'stale-while-revalidate': '5'}
+
+
+def test_miss_then_hit(cache):
+    handle(cache, make_req())
+    assert cache.misses == 1
+    assert len(cache.entries) == 1
+
+    second = handle(cache, make_req(), body='other')
+    assert cache.hits == 1
+    assert sent_body(second) == b'hello'
+    assert second.headers['Age'] == '0'
+    assert second.headers['Content-Type'] == 'text/plain'
+
+
+def test_query_and_vary_in_key():
+    cache = ResponseCache(vary=['Accept'])
+    handle(cache, make_req(query={'a': ['1']}, headers={'ACCEPT': 'text/html'}))
+    handle(cache, make_req(query={'a': ['2']}, headers={'ACCEPT': 'text/html'}))
+    handle(cache, make_req(query={'a': ['1']}, headers={'ACCEPT': 'text/plain'}))
+    assert cache.misses == 3
+    handle(cache, make_req(query={'a': ['1']}, headers={'ACCEPT': 'text/html'}))
+    assert cache.hits == 1
+
+
+@pytest.mark.parametrize('cache_control', [
+    None,
+    'no-store',
+    'private, max-age=60',
+    'max-age=0',
+    'max-age=bad',
+])
+def test_not_stored(cache, cache_control):
+    handle(cache, make_req(), cache_control=cache_control)
+    assert not cache.entries
+
+
+def test_error_not_stored(cache):
+    handle(cache, make_req(), status=500)
+    assert not cache.entries
+
+
+def test_post_ignored(cache):
+    res = make_res()
+    cache(make_req(method=HTTPMethod.POST), res)
+    assert not res.events._event_list['after_send']
+
+
+def test_set_cookie_not_stored(cache):
+    res = make_res()
+    req = make_req()
+    cache(req, res)
+    res.headers['Set-Cookie'] = 'a=b'
+    res.headers['Cache-Control'] = 'max-age=60'
+    res.send_text('body')
+    entry, = cache.entries.values()
+    stored = {k.lower() for k, v in entry.headers}
+    assert 'content-type' in stored
+    assert 'set-cookie' not in stored
+    assert 'date' not in stored
+    assert 'content-length' not in stored
+
+
+def test_response_vary_variants():
+    from growler.middleware.compress import Compression
+    cache = ResponseCache()
+    compression = Compression(min_size=10)
+
+    def handle_compressed(accept_encoding):
+        headers = {'ACCEPT-ENCODING': accept_encoding} if accept_encoding else {}
+        req = make_req(headers=headers)
+        res = make_res()
+        compression(req, res)
+        cache(req, res)
+        if not res.has_ended:
+            res.headers['Cache-Control'] = 'max-age=60'
+            res.send_text('hello ' * 20)
+        return res
+
+    assert handle_compressed('gzip').headers['Content-Encoding'] == 'gzip'
+    plain = handle_compressed(None)
+    assert cache.misses == 2
+    assert 'Content-Encoding' not in plain.headers
+    assert sent_body(plain) == b'hello ' * 20
+
+    assert handle_compressed('gzip').headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in handle_compressed(None).headers
+    assert cache.hits == 2
+    assert len(cache.entries) == 2
+
+
+def test_vary_star_not_stored(cache):
+    req, res = make_req(), make_res()
+    cache(req, res)
+    res.headers['Cache-Control'] = 'max-age=60'
+    res.headers['Vary'] = 'Cookie, *'
+    res.send_text('hello')
+    assert not cache.entries
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_bytes=1000, max_entry_size=600)
+    handle(cache, make_req('/a'), body='a' * 300)
+    handle(cache, make_req('/b'), body='b' * 300)
+    handle(cache, make_req('/a'))
+    handle(cache, make_req('/c'), body='c' * 300)
+    assert cache.evictions == 1
+    assert [key[0][1] for key in cache.entries] == ['/a', '/c']
+    assert cache.size == sum(e.size for e in cache.entries.values())
+
+    handle(cache, make_req('/big'), body='x' * 700)
+    assert len(cache.entries) == 2
+
+
+def test_expired_entry_removed(cache):
+    handle(cache, make_req())
+    entry, = cache.entries.values()
+    entry.created -= 61
+    handle(cache, make_req(), body='fresh')
+    assert cache.misses == 2
+    entry, = cache.entries.values()
+    assert entry.body == b'fresh'
+
+
+def test_stale_while_revalidate(cache):
+    handle(cache, make_req(), cache_control='max-age=1, stale-while-revalidate=30')
+    entry, = cache.entries.values()
+    entry.created -= 5
+
+    with mock.patch.object(cache, 'refresh') as refresh:
+        res = handle(cache, make_req(), body='new')
+        handle(cache, make_req(), body='new')
+
+    assert cache.stale_hits == 2
+    assert sent_body(res) == b'hello'
+    assert refresh.call_count == 1
+    assert entry.refreshing
+
+
+@pytest.mark.asyncio
+async def test_refresh_stores_new_response(cache):
+    app = growler.App()
+    app.use(cache)
+
+    @app.get('/')
+    def index(req, res):
+        res.headers['Cache-Control'] = 'max-age=1, stale-while-revalidate=30'
+        res.send_text('refreshed')
+
+    handle(cache, make_req(), cache_control='max-age=1, stale-while-revalidate=30')
+    entry, = cache.entries.values()
+    entry.created -= 5
+
+    req = make_req()
+    req.app = app
+    task = cache.refresh(req, make_res(), entry)
+    await task
+
+    new_entry, = cache.entries.values()
+    assert new_entry.body == b'refreshed'
+    assert not entry.refreshing
+
+
+def test_cached_response_keeps_existing_headers():
+    entry = CachedResponse(200, [('X-A', 'cached'), ('X-B', 'cached')], b'body')
+    res = make_res()
+    res.headers['X-A'] = 'mine'
+    entry.send(res)
+    assert res.headers['X-A'] == 'mine'
+    assert res.headers['X-B'] == 'cached'
+    assert res.has_ended
+
+
+def test_stats(cache):
+    handle(cache, make_req())
+    handle(cache, make_req())
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+
+
+def test_streamed_response_not_cached(cache):
+    req = make_req()
+    res = make_res()
+    cache(req, res)
+    res.headers['Cache-Control'] = 'max-age=60'
+    res.write_chunk('<html>')
+    res.end_chunks()
+    assert not cache.entries
+
+    second = make_res()
+    cache(make_req(), second)
+    assert not second.has_ended
@@ -0,0 +1,168 @@
+#
+# tests/middleware/test_coalesce.py
+#
+
+import pytest
+import asyncio
+from growler.http import HTTPMethod
+from mocks import make_req, make_res
+from growler.middleware.coalesce import RequestCoalescer
+
+
+def sent_body(res):
+    return res.protocol.transport.write.call_args_list[-1][0][0]
+
+
+@pytest.fixture
+def coalescer():
+    return RequestCoalescer(timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_followers_get_leader_response(coalescer):
+    leader = make_res()
+    assert coalescer(make_req(), leader) is None
+
+    followers = [make_res() for _ in range(3)]
+    followers[0].headers['X-Request-Id'] = 'abc'
+    pending = [coalescer(make_req(), res) for res in followers]
+    assert all(asyncio.iscoroutine(p) for p in pending)
+
+    leader.headers['X-Request-Id'] = 'leader'
+    leader.headers['Content-Type'] = 'application/json'
+    leader.send_text('{"a": 1}')
+    await asyncio.gather(*pending)
+
+    for res in followers:
+        assert res.has_ended
+        assert sent_body(res) == b'{"a": 1}'
+        assert res.headers['Content-Type'] == 'application/json'
+    assert followers[0].headers['X-Request-Id'] == 'abc'
+    assert coalescer.coalesced == 3
+    assert coalescer.leaders == 1
+    assert not coalescer.in_flight
+
+
+@pytest.mark.asyncio
+async def test_error_not_shared(coalescer):
+    leader = make_res()
+    coalescer(make_req(), leader)
+    follower = make_res()
+    pending = coalescer(make_req(), follower)
+
+    leader.send_text("500 - Server Error", 500)
+    await pending
+
+    assert not follower.has_ended
+    assert coalescer.fallbacks == 1
+
+
+@pytest.mark.asyncio
+async def test_follower_timeout():
+    coalescer = RequestCoalescer(timeout=0.01)
+    coalescer(make_req(), make_res())
+    follower = make_res()
+    await coalescer(make_req(), follower)
+    assert not follower.has_ended
+    assert coalescer.fallbacks == 1
+
+
+def test_stale_leader_replaced(coalescer):
+    coalescer(make_req(), make_res())
+    flight, = coalescer.in_flight.values()
+    flight.started -= 5
+    assert coalescer(make_req(), make_res()) is None
+    assert coalescer.leaders == 2
+
+
+def test_different_keys_not_merged(coalescer):
+    assert coalescer(make_req('/a'), make_res()) is None
+    assert coalescer(make_req('/b'), make_res()) is None
+    assert coalescer(make_req('/a', query={'x': ['1']}), make_res()) is None
+    assert coalescer(make_req('/a', method=HTTPMethod.POST), make_res()) is None
+    assert len(coalescer.in_flight) == 3
+
+
+def test_custom_key():
+    coalescer = RequestCoalescer(lambda req: 'everything')
+    coalescer(make_req('/a'), make_res())
+    assert list(coalescer.in_flight) == ['everything']
+
+
+@pytest.mark.asyncio
+async def test_streamed_leader_not_shared(coalescer):
+    leader = make_res()
+    coalescer(make_req(), leader)
+    follower = make_res()
+    pending = coalescer(make_req(), follower)
+
+    leader.write_chunk('<html>')
+    leader.end_chunks()
+    await pending
+
+    assert not follower.has_ended
+    assert coalescer.fallbacks == 1
+
+
+@pytest.mark.asyncio
+async def test_not_modified_not_shared(coalescer):
+    leader = make_res()
+    coalescer(make_req(), leader)
+    follower = make_res()
+    pending = coalescer(make_req(), follower)
+
+    leader.status_code = 304
+    leader.end()
+    await pending
+
+    assert not follower.has_ended
+    assert coalescer.fallbacks == 1
+
+
+def test_accept_encoding_in_key(coalescer):
+    gzip = {'ACCEPT-ENCODING': 'gzip'}
+    assert coalescer(make_req(headers=gzip), make_res()) is None
+    assert coalescer(make_req(), make_res()) is None
+    assert len(coalescer.in_flight) == 2
+
+
+def test_credentials_not_merged(coalescer):
+    for headers in ({'COOKIE': 'sid=a'}, {'AUTHORIZATION': 'Bearer a'}):
+        assert coalescer(make_req(headers=headers), make_res()) is None
+    assert not coalescer.in_flight
+    assert coalescer.leaders == 0
+
+
+@pytest.mark.asyncio
+async def test_leader_vary_mismatch_not_shared(coalescer):
+    leader = make_res()
+    coalescer(make_req(headers={'ACCEPT-LANGUAGE': 'en'}), leader)
+    same, other = make_res(), make_res()
+    pending = [
+        coalescer(make_req(headers={'ACCEPT-LANGUAGE': 'en'}), same),
+        coalescer(make_req(headers={'ACCEPT-LANGUAGE': 'fr'}), other),
+    ]
+
+    leader.headers['Vary'] = 'Accept-Language'
+    leader.send_text('hello')
+    await asyncio.gather(*pending)
+
+    assert same.has_ended
+    assert not other.has_ended
+    assert coalescer.coalesced == 1
+    assert coalescer.fallbacks == 1
+
+
+@pytest.mark.asyncio
+async def test_vary_star_not_shared(coalescer):
+    leader = make_res()
+    coalescer(make_req(), leader)
+    follower = make_res()
+    pending = coalescer(make_req(), follower)
+
+    leader.headers['Vary'] = '*'
+    leader.send_text('hello')
+    await pending
+
+    assert not follower.has_ended
+    assert coalescer.fallbacks == 1
@@ -0,0 +1,176 @@
+#
+# tests/middleware/test_compress.py
+#
+
+import json
+import zlib
+import pytest
+import asyncio
+from mocks import make_req, make_res
+from growler.middleware.compress import (
+    ENCODERS,
+    Compression,
+    parse_accept_encoding,
+)
+
+
+@pytest.fixture
+def compression():
+    return Compression(min_size=100)
+
+
+def written(res):
+    return [c[0][0] for c in res.protocol.transport.write.call_args_list]
+
+
+def dechunk(data):
+    body = b''
+    while True:
+        size, _, data = data.partition(b'\r\n')
+        size = int(size, 16)
+        if size == 0:
+            return body
+        body += data[:size]
+        data = data[size + 2:]
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, deflate;q=0.5, br;q=bad') == {
+        'gzip': 1.0,
+        'deflate': 0.5,
+        'br': 0.0,
+    }
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip', 'gzip'),
+    ('deflate, gzip;q=0.5', 'deflate'),
+    ('gzip;q=0, deflate', 'deflate'),
+    ('identity', None),
+    ('', None),
+])
+def test_negotiate(header, expected):
+    compression = Compression(encodings=('gzip', 'deflate'))
+    assert compression.negotiate(header) == expected
+
+
+def test_negotiate_wildcard():
+    compression = Compression(encodings=('gzip', 'deflate'))
+    assert compression.negotiate('*') == 'gzip'
+    assert compression.negotiate('*, gzip;q=0') == 'deflate'
+
+
+def test_unavailable_encodings_ignored():
+    compression = Compression(encodings=('br', 'gzip'))
+    assert compression.encodings == ('gzip',)
+
+
+def test_compress_json(compression):
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'gzip'}), res)
+    obj = {'data': list(range(100))}
+    res.send_json(obj)
+
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    body = written(res)[-1]
+    assert res.headers['Content-Length'] == str(len(body))
+    assert zlib.decompress(body, 16 + zlib.MAX_WBITS) == json.dumps(obj).encode()
+    assert compression.bytes_out < compression.bytes_in
+
+
+def test_deflate(compression):
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'deflate'}), res)
+    res.send_text('a' * 200)
+    assert zlib.decompress(written(res)[-1]) == b'a' * 200
+
+
+def test_small_response_skipped(compression):
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'gzip'}), res)
+    res.send_text('tiny')
+    assert 'Content-Encoding' not in res.headers
+    assert written(res)[-1] == b'tiny'
+
+
+@pytest.mark.parametrize('content_type, expected', [
+    ('image/png', False),
+    ('application/zip', False),
+    ('image/svg+xml', True),
+    ('application/json', True),
+    (None, True),
+])
+def test_is_compressible(compression, content_type, expected):
+    assert compression.is_compressible(content_type) is expected
+
+
+def test_existing_vary_extended(compression):
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'gzip'}), res)
+    res.headers['Vary'] = 'Accept'
+    res.send_text('a' * 200)
+    assert res.headers['Vary'] == 'Accept, Accept-Encoding'
+
+
+def test_error_skipped(compression):
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'gzip'}), res)
+    res.send_text('a' * 200, 500)
+    assert 'Content-Encoding' not in res.headers
+
+
+def test_streamed_chunks(compression):
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'gzip'}), res)
+    res.write_chunk('<html><head></head>', flush=True)
+    res.write_chunk('x' * 50)
+    res.end_chunks()
+
+    assert res.headers['Transfer-Encoding'] == 'chunked'
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in res.headers
+    assert res.has_ended
+
+    header_bytes, *chunks = written(res)
+    body = dechunk(b''.join(chunks))
+    assert zlib.decompress(body, 16 + zlib.MAX_WBITS) == b'<html><head></head>' + b'x' * 50
+
+    # flushed data can be decoded before the rest arrives
+    first = dechunk(chunks[0] + b'0\r\n\r\n')
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decoder.decompress(first) == b'<html><head></head>'
+
+
+def test_streamed_chunks_uncompressed():
+    res = make_res()
+    res.write_chunk('abc')
+    res.end_chunks()
+    header_bytes, *chunks = written(res)
+    assert b''.join(chunks) == b'3\r\nabc\r\n0\r\n\r\n'
+
+
+@pytest.mark.skipif('zstd' not in ENCODERS, reason='compression.zstd not available')
+def test_zstd_preferred(compression):
+    from compression import zstd
+    res = make_res()
+    compression(make_req(headers={'ACCEPT-ENCODING': 'gzip, zstd'}), res)
+    res.send_text('a' * 200)
+    assert res.headers['Content-Encoding'] == 'zstd'
+    assert zstd.decompress(written(res)[-1]) == b'a' * 200
+
+
+def test_adaptive_level():
+    compression = Compression(adaptive=True, lag_threshold=0.1)
+    assert compression.level('gzip') == 6
+    compression.lag = 0.5
+    assert compression.level('gzip') == 1
+
+
+@pytest.mark.asyncio
+async def test_lag_sampling():
+    compression = Compression(adaptive=True, lag_interval=0.01)
+    compression(make_req(), make_res())
+    assert compression._sampling
+    await asyncio.sleep(0.2)
+    assert not compression._sampling
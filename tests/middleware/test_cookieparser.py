@@ -4,8 +4,11 @@
 
 import pytest
 from unittest import mock
-from http.cookies import SimpleCookie
-from growler.middleware.cookieparser import CookieParser
+from growler.middleware.cookieparser import (
+    CookieParser,
+    RequestCookies,
+    parse_cookie_header,
+)
 
 
 @pytest.fixture
@@ -41,12 +44,53 @@ def test_cp_does_not_clobber_cookies(cp, req, res):
 
 
 def test_cp_call(cp, req, res):
+    req.headers['COOKIE'] = 'foo=bar; qid=abc'
     cp(req, res)
-    assert isinstance(req.cookies, SimpleCookie)
-    assert isinstance(res.cookies, SimpleCookie)
+    assert isinstance(req.cookies, RequestCookies)
+    assert req.cookies['foo'] == 'bar'
+    assert req.cookies['qid'].value == 'abc'
+    assert dict(req.cookies) == {'foo': 'bar', 'qid': 'abc'}
+    assert not hasattr(res, 'cookies')
 
-    # set a cookie
-    res.cookies['foo'] = 'bar'
 
-    header = res.headers['Set-Cookie']()
-    assert header == ' foo=bar'
+def test_cp_lazy(cp, req, res):
+    req.headers['COOKIE'] = 'foo=bar'
+    cp(req, res)
+    assert req.cookies._cookies is None
+    assert 'foo' in req.cookies
+    assert req.cookies._cookies == {'foo': 'bar'}
+
+
+def test_cp_no_header(cp, req, res):
+    cp(req, res)
+    assert len(req.cookies) == 0
+    assert req.cookies.get('foo') is None
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('a=1', {'a': '1'}),
+    ('a=1;b=2', {'a': '1', 'b': '2'}),
+    (' a = 1 ;  b=x=y ', {'a': '1', 'b': 'x=y'}),
+    ('a=1; a=2', {'a': '1'}),
+    ('a="quoted value"', {'a': 'quoted value'}),
+    ('a="\\"x\\""', {'a': '"x"'}),
+    ('a="\\073\\\\"', {'a': ';\\'}),
+    ('a=; noval; =x; ;', {'a': ''}),
+    ('', {}),
+])
+def test_parse_cookie_header(header, expected):
+    assert parse_cookie_header(header) == expected
+
+
+def test_cookies_assignable(cp, req, res):
+    from http.cookies import SimpleCookie
+    req.headers['COOKIE'] = 'foo=bar; qid=abc'
+    cp(req, res)
+    req.cookies['foo'] = 'baz'
+    req.cookies['new'] = SimpleCookie('x=1')['x']
+    del req.cookies['qid']
+    assert dict(req.cookies) == {'foo': 'baz', 'new': '1'}
+    assert req.cookies['new'].value == '1'
+
+    req.cookies.cookies = {'only': 'one'}
+    assert dict(req.cookies) == {'only': 'one'}
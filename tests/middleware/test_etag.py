@@ -0,0 +1,118 @@
+#
+# tests/middleware/test_etag.py
+#
+
+import pytest
+from growler.http import HTTPMethod
+from mocks import make_req, make_res
+from growler.middleware.etag import ETag
+from growler.middleware.compress import Compression
+
+
+@pytest.fixture
+def etag():
+    return ETag()
+
+
+def test_sets_etag(etag):
+    res = make_res()
+    etag(make_req(), res)
+    res.send_json({'a': 1})
+    assert res.headers['ETag'] == etag.calculate_etag('{"a": 1}')
+    assert res.status_code == 200
+
+
+def test_not_modified(etag):
+    tag = etag.calculate_etag(b'hello')
+    res = make_res()
+    etag(make_req(headers={'IF-NONE-MATCH': '"other", ' + tag}), res)
+    res.send_text('hello')
+
+    assert res.status_code == 304
+    assert 'Content-Length' not in res.headers
+    header_bytes, body = [c[0][0] for c in res.protocol.transport.write.call_args_list]
+    assert header_bytes.startswith(b'HTTP/1.1 304 Not Modified')
+    assert body == b''
+
+
+def test_modified(etag):
+    res = make_res()
+    etag(make_req(headers={'IF-NONE-MATCH': '"stale"'}), res)
+    res.send_html('<p>hi</p>')
+    assert res.status_code == 200
+    assert res.message == '<p>hi</p>'
+
+
+def test_existing_etag_kept(etag):
+    res = make_res()
+    etag(make_req(), res)
+    res.headers['Etag'] = 'abc'
+    res.send_text('hello')
+    assert res.headers['ETag'] == 'abc'
+
+
+def test_errors_skipped(etag):
+    res = make_res()
+    etag(make_req(headers={'IF-NONE-MATCH': '*'}), res)
+    res.send_text('missing', 404)
+    assert 'ETag' not in res.headers
+    assert res.status_code == 404
+
+
+def test_post_skipped(etag):
+    res = make_res()
+    etag(make_req(method=HTTPMethod.POST), res)
+    res.send_text('created')
+    assert 'ETag' not in res.headers
+
+
+@pytest.mark.parametrize('header, tag, expected', [
+    ('"a"', '"a"', True),
+    ('W/"a"', '"a"', True),
+    ('"b", W/"a"', 'W/"a"', True),
+    ('*', '"a"', True),
+    ('"b"', '"a"', False),
+    ('', '"a"', False),
+    (None, '"a"', False),
+])
+def test_matches(header, tag, expected):
+    assert ETag.matches(header, tag) is expected
+
+
+def test_weak():
+    assert ETag(weak=True).calculate_etag(b'x').startswith('W/"')
+
+
+def test_streamed_skipped(etag):
+    res = make_res()
+    etag(make_req(headers={'IF-NONE-MATCH': '*'}), res)
+    res.write_chunk('<html>')
+    res.end_chunks()
+    assert 'ETag' not in res.headers
+    assert res.status_code == 200
+    header_bytes = res.protocol.transport.write.call_args_list[0][0][0]
+    assert header_bytes.startswith(b'HTTP/1.1 200 OK')
+
+
+def test_compressed_variant_weak(etag):
+    text = 'hello ' * 100
+    compression = Compression(min_size=10)
+    identity, gzipped = make_res(), make_res()
+    for res, headers in ((identity, {}), (gzipped, {'ACCEPT-ENCODING': 'gzip'})):
+        req = make_req(headers=headers)
+        etag(req, res)
+        compression(req, res)
+        res.send_text(text)
+
+    assert identity.headers['ETag'] == etag.calculate_etag(text)
+    assert gzipped.headers['ETag'] == 'W/' + etag.calculate_etag(text)
+
+    res = make_res()
+    req = make_req(headers={'ACCEPT-ENCODING': 'gzip',
+                            'IF-NONE-MATCH': gzipped.headers['ETag']})
+    etag(req, res)
+    compression(req, res)
+    res.send_text(text)
+    assert res.status_code == 304
+    assert res.headers['ETag'] == gzipped.headers['ETag']
+    assert 'Content-Encoding' not in res.headers
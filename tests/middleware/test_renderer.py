@@ -2,6 +2,7 @@
 # tests/middleware/test_renderer.py
 #
 
+import os
 import re
 import sys
 import types
@@ -12,7 +13,12 @@ import growler
 from pathlib import Path
 from unittest import mock
 from sys import version_info
-from growler.middleware.renderer import Renderer, RenderEngine, StringRenderer
+from growler.middleware.renderer import (
+    Renderer,
+    RenderEngine,
+    StringRenderer,
+    FormatTemplate,
+)
 
 
 @pytest.fixture
@@ -130,3 +136,246 @@ def test_render_source(string_renderer, tmpdir):
     result = string_renderer.render_source('foo.txt', {'spam': 'a-lot'})
 
     assert result == "spam-a-lot"
+
+
+def test_engine_globals(tmpdir):
+    (tmpdir / 'page.html.tmpl').write('<link href="{assets[css/site.css]}">{title}')
+    engine = StringRenderer(str(tmpdir), globals={'assets': {'css/site.css': '/site.1.css'},
+                                                  'title': 'default'})
+    res = mock.Mock()
+    del res.render
+    engine(mock.Mock(), res)
+    res.render('page', {'title': 'mine'})
+    res.send_html.assert_called_with('<link href="/site.1.css">mine')
+
+
+@pytest.mark.parametrize('source, values', [
+    ('plain text', {}),
+    ('{a} and {b!r}', {'a': 1, 'b': 'x'}),
+    ('{{escaped}} {a:>5}|{a:{width}}', {'a': 'v', 'width': 3}),
+    ('{d[key]} {obj.real} {lst[1]}', {'d': {'key': 'k'}, 'obj': 4, 'lst': [0, 9]}),
+])
+def test_format_template(source, values):
+    assert FormatTemplate(source).render(values) == source.format(**values)
+
+
+def test_format_template_missing_key():
+    with pytest.raises(KeyError):
+        FormatTemplate('{missing}').render({})
+
+
+def test_template_cache(string_renderer, tmpdir):
+    view = tmpdir / 'page.html.tmpl'
+    view.write('v1 {x}')
+    with mock.patch.object(string_renderer, 'file_text',
+                           wraps=string_renderer.file_text) as file_text:
+        filename = string_renderer.resolve('page')
+        assert string_renderer.render_source(filename, {'x': 1}) == 'v1 1'
+        assert string_renderer.render_source(filename, {'x': 2}) == 'v1 2'
+        assert file_text.call_count == 1
+
+        view.write('v2 {x}')
+        os.utime(str(view), ns=(0, 10 ** 9))
+        assert string_renderer.render_source(filename, {'x': 3}) == 'v2 3'
+        assert file_text.call_count == 2
+
+    assert string_renderer.templates.stats()['hits'] == 1
+
+
+def test_template_cache_resolve(string_renderer, tmpdir):
+    assert string_renderer.resolve('page') is None
+    view = tmpdir / 'page.html.tmpl'
+    view.write('x')
+    assert string_renderer.resolve('page') == Path(str(view))
+
+    with mock.patch.object(string_renderer, 'find_template_filename') as find:
+        assert string_renderer.resolve('page') == Path(str(view))
+        assert not find.called
+
+    view.remove()
+    assert string_renderer.resolve('page') is None
+
+
+def test_template_cache_no_reload(tmpdir):
+    engine = StringRenderer(str(tmpdir), auto_reload=False)
+    view = tmpdir / 'page.html.tmpl'
+    assert engine.resolve('page') is None
+    view.write('v1')
+    assert engine.resolve('page') is None
+
+    engine.templates.clear()
+    filename = engine.resolve('page')
+    assert engine.render_source(filename, {}) == 'v1'
+    view.write('v2 changed')
+    with mock.patch('os.stat') as stat:
+        assert engine.render_source(filename, {}) == 'v1'
+        assert not stat.called
+
+
+def make_response(app=None):
+    from growler.http.response import HTTPResponse
+    protocol = mock.Mock()
+    protocol.transport.can_write_eof.return_value = True
+    protocol.http_application = app or growler.App()
+    res = HTTPResponse(protocol)
+    res.locals = {}
+    res.render = Renderer(res)
+    return res
+
+
+def written_chunks(res):
+    header, *chunks = [c[0][0] for c in res.protocol.transport.write.call_args_list]
+    return header, chunks
+
+
+def test_render_stream(tmpdir):
+    (tmpdir / 'page.html.tmpl').write(
+        '<html><head><link href="{css}"></HEAD><body>{body}</body></html>')
+    engine = StringRenderer(str(tmpdir))
+    res = make_response()
+    res.render.add_engine(engine)
+    res.render('page', {'css': '/a.css', 'body': 'x' * 100}, stream=True)
+
+    header, chunks = written_chunks(res)
+    assert b'Transfer-Encoding: chunked' in header
+    assert b'Content-Type: text/html' in header
+    assert chunks[0] == b'2d\r\n<html><head><link href="/a.css"></HEAD><body>\r\n'
+    assert chunks[1] == b'%x\r\n%s</body></html>\r\n' % (114, b'x' * 100)
+    assert chunks[2] == b'0\r\n\r\n'
+    assert res.has_ended
+
+
+def test_render_stream_chunk_size():
+    res = make_response()
+    res.render.chunk_size = 12
+    res.render.send_stream(['<head>', '</he', 'ad>'] + ['abcd'] * 6)
+    header, chunks = written_chunks(res)
+    assert chunks == [
+        b'd\r\n<head></head>\r\n',
+        b'c\r\nabcdabcdabcd\r\n',
+        b'c\r\nabcdabcdabcd\r\n',
+        b'0\r\n\r\n',
+    ]
+
+
+def test_engine_without_base_init(tmpdir):
+    (tmpdir / 'page.txt').write('<p>{x}</p>')
+
+    class Engine(RenderEngine):
+        def __init__(self, path):
+            self.path = Path(path)
+
+        def render_source(self, filename, obj):
+            return filename.read_text().format(**obj)
+
+    res = make_response()
+    res.render.add_engine(Engine(str(tmpdir)))
+    res.render('page.txt', {'x': 1})
+    assert res.has_ended
+
+
+def test_render_stream_default_engine(base_renderer, tmpdir):
+    base_renderer.render_source = mock.Mock(return_value='<p>whole</p>')
+    assert list(base_renderer.render_stream('x', {})) == ['<p>whole</p>']
+
+
+@pytest.mark.asyncio
+async def test_render_awaitable(tmpdir):
+    (tmpdir / 'page.html.tmpl').write('<p>{x}</p>')
+    res = make_response()
+    res.render.add_engine(StringRenderer(str(tmpdir)))
+    await res.render('page', {'x': 1})
+    assert res.has_ended
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+async def test_render_in_executor(tmpdir, executor):
+    (tmpdir / 'page.html.tmpl').write('<p>{x}</p>')
+    engine = StringRenderer(str(tmpdir), executor=executor)
+    app = growler.App()
+    res = make_response(app)
+    res.render.add_engine(engine)
+
+    try:
+        result = res.render('page', {'x': 1})
+        assert not res.has_ended
+        await result
+        assert res.has_ended
+        header, body = [c[0][0] for c in res.protocol.transport.write.call_args_list]
+        assert body == b'<p>1</p>'
+
+        res = make_response(app)
+        res.render.add_engine(engine)
+        await res.render('page', {'x': 2}, stream=True)
+        header, *chunks = [c[0][0] for c in res.protocol.transport.write.call_args_list]
+        assert chunks == [b'8\r\n<p>2</p>\r\n', b'0\r\n\r\n']
+        assert app.get_executor(executor).completed == 2
+    finally:
+        app.get_executor(executor).shutdown()
+
+
+@pytest.mark.asyncio
+async def test_render_in_executor_sync_handler(tmpdir):
+    from growler.http import HTTPMethod
+    (tmpdir / 'page.html.tmpl').write('<p>{x}</p>')
+    app = growler.App()
+    app.use(StringRenderer(str(tmpdir), executor='thread'))
+
+    @app.get('/')
+    def index(req, res):
+        res.render('page', {'x': 1})
+
+    req = mock.Mock(method=HTTPMethod.GET, path='/', headers={})
+    res = make_response(app)
+    del res.render
+    try:
+        pending = app.handle_client_request(req, res)
+        assert pending is not None
+        await pending
+        header, body = [c[0][0] for c in res.protocol.transport.write.call_args_list]
+        assert header.startswith(b'HTTP/1.1 200 OK')
+        assert body == b'<p>1</p>'
+    finally:
+        app.get_executor('thread').shutdown()
+
+
+@pytest.mark.asyncio
+async def test_render_in_executor_response_ended(tmpdir):
+    (tmpdir / 'page.html.tmpl').write('<p>{x}</p>')
+    app = growler.App()
+    res = make_response(app)
+    res.render.add_engine(StringRenderer(str(tmpdir), executor='thread'))
+    try:
+        rendering = res.render('page', {'x': 1})
+        res.send_text('timeout', 503)
+        await rendering
+        assert len(res.protocol.transport.write.call_args_list) == 2
+    finally:
+        app.get_executor('thread').shutdown()
+
+
+def test_engine_pickle(tmpdir):
+    import pickle
+    (tmpdir / 'page.html.tmpl').write('{x}')
+    engine = StringRenderer(str(tmpdir), globals={'a': 1}, auto_reload=False)
+    engine.preload()
+    assert engine.templates.stats()['templates'] == 1
+
+    copy = pickle.loads(pickle.dumps(engine))
+    assert copy.path == engine.path
+    assert copy.globals == {'a': 1}
+    assert not copy.templates.auto_reload
+    assert copy.templates.stats()['templates'] == 0
+    assert copy.render_source(copy.resolve('page'), {'x': 3}) == '3'
+
+
+def test_worker_engine_loaded_once(tmpdir):
+    import pickle
+    from growler.middleware import renderer
+    engine = StringRenderer(str(tmpdir))
+    ref = pickle.dumps(engine.worker_engine)
+    first = pickle.loads(ref)
+    assert isinstance(first, StringRenderer)
+    assert pickle.loads(ref) is first
+    del renderer._worker_engines[engine.worker_engine.key]
@@ -2,6 +2,7 @@
 # tests/middleware/test_session.py
 #
 
+import asyncio
 import uuid
 import pytest
 import growler
@@ -51,8 +52,40 @@ def test_getters_and_setters(sess):
 
 @pytest.mark.asyncio
 async def test_session_save(sess, mock_backend):
+    sess['data'] = 'foo'
     await sess.save()
     mock_backend.save.assert_called_with(sess)
+    assert not sess.dirty
+
+
+@pytest.mark.asyncio
+async def test_session_save_unmodified(sess, mock_backend):
+    await sess.save()
+    assert not mock_backend.save.called
+
+
+def test_session_lazy_load(mock_backend):
+    loader = mock.Mock(return_value={'a': 1})
+    sess = session.Session(mock_backend, id='abc', loader=loader)
+    assert not sess.loaded
+    assert not loader.called
+    assert sess['a'] == 1
+    assert sess.get('a') == 1
+    loader.assert_called_once_with(sess)
+    assert not sess.dirty
+
+
+def test_session_dirty_tracking(sess):
+    assert not sess.dirty
+    sess.get('x')
+    assert not sess.dirty
+    sess.setdefault('items', [])
+    assert sess.dirty
+    sess.dirty = False
+    sess['items'].append(1)
+    assert not sess.dirty
+    sess.modified()
+    assert sess.dirty
 
 
 @pytest.fixture
@@ -69,9 +102,38 @@ def test_defaultstorage_call_nocookie(storage):
     storage.session_id_name = name
     req, res = mock.MagicMock(), mock.MagicMock()
     req.cookies = {}
+    res.cookies = {}
     storage(req, res)
     assert isinstance(req.session, session.Session)
-    assert isinstance(req.cookies[name], uuid.UUID)
+    assert not req.session.loaded
+    assert not res.events.on.called
+
+    req.session['user'] = 'alice'
+    assert req.session.is_new
+    uuid.UUID(req.session.id)
+    commit = res.events.on.call_args[0][1]
+    commit()
+    assert res.cookies[name] == req.session.id
+    assert storage._sessions[req.session.id] == {'user': 'alice'}
+
+
+def test_defaultstorage_unmodified_new_session(storage):
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = {}
+    res.cookies = {}
+    storage(req, res)
+    assert req.session.get('user') is None
+    res.events.on.call_args[0][1]()
+    assert res.cookies == {}
+    assert len(storage._sessions) == 0
+
+
+def test_defaultstorage_unused_session(storage):
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = {}
+    storage(req, res)
+    assert not res.events.on.called
+    assert len(storage._sessions) == 0
 
 
 def test_defaultstorage_call(storage):
@@ -84,3 +146,282 @@ def test_defaultstorage_save(storage):
     m = mock.MagicMock()
     storage.save(m)
     assert storage._sessions[m.id] is m._data
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_store_lru_eviction(clock):
+    store = session.BoundedSessionStore(max_sessions=2, clock=clock)
+    store['a'] = {'id': 'a'}
+    store['b'] = {'id': 'b'}
+    assert store['a'] == {'id': 'a'}
+    store['c'] = {'id': 'c'}
+    assert 'b' not in store
+    assert 'a' in store and 'c' in store
+    assert store.evictions == 1
+    assert len(store) == 2
+
+
+def test_store_memory_bound(clock):
+    store = session.BoundedSessionStore(max_sessions=None, max_bytes=2000, clock=clock)
+    for i in range(10):
+        store[i] = {'blob': 'x' * 500}
+    assert store.nbytes <= 2000
+    assert store.evictions > 0
+    assert store.nbytes == sum(session.approximate_size(store._entries[k][0])
+                               for k in store._entries)
+
+
+def test_store_ttl(clock):
+    store = session.BoundedSessionStore(ttl=10, clock=clock)
+    store['a'] = {}
+    clock.now = 5
+    assert store.get('a') == {}
+    clock.now = 14
+    assert store.get('a') == {}
+    clock.now = 30
+    assert store.get('a') is None
+    with pytest.raises(KeyError):
+        store['a']
+    assert store.expirations == 1
+    assert store.nbytes == 0
+
+
+def test_store_amortized_sweep(clock):
+    store = session.BoundedSessionStore(ttl=10, sweep_batch=2, clock=clock)
+    for i in range(5):
+        store[i] = {}
+    clock.now = 20
+    store['new'] = {}
+    assert len(store) == 4
+    store['newer'] = {}
+    assert len(store) == 3
+    assert store.sweep(limit=10) == 1
+    assert list(store._entries) == ['new', 'newer']
+    assert store.stats()['expirations'] == 5
+
+
+def test_defaultstorage_reuses_session(storage):
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = {}
+    res.cookies = {}
+    storage(req, res)
+    req.session['user'] = 'alice'
+    res.events.on.call_args[0][1]()
+    sid = res.cookies[storage.session_id_name]
+
+    req2, res2 = mock.MagicMock(), mock.MagicMock()
+    req2.cookies = {storage.session_id_name: mock.Mock(value=sid)}
+    res2.cookies = {}
+    storage(req2, res2)
+    assert req2.session['user'] == 'alice'
+    assert not req2.session.is_new
+    req2.session['user'] = 'bob'
+    res2.events.on.call_args[0][1]()
+    assert res2.cookies == {}
+    assert storage._sessions[sid] == {'user': 'bob'}
+    assert storage.stats()['sessions'] == 1
+
+
+def test_defaultstorage_expired_cookie_gets_new_id(storage):
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = {storage.session_id_name: mock.Mock(value='unknown')}
+    storage(req, res)
+    assert len(req.session) == 0
+    assert req.session.id != 'unknown'
+    assert req.session.is_new
+
+
+@pytest.fixture
+def cookie_storage():
+    return session.CookieSessionStorage('secret', max_age=60)
+
+
+def cookie_request(storage, value=None):
+    from http.cookies import SimpleCookie
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = SimpleCookie()
+    if value is not None:
+        req.cookies[storage.cookie_name] = value
+    res.cookies = SimpleCookie()
+    storage(req, res)
+    return req, res
+
+
+def commit(res):
+    for call in res.events.on.call_args_list:
+        call[0][1]()
+
+
+def test_cookie_storage_roundtrip(cookie_storage):
+    req, res = cookie_request(cookie_storage)
+    assert len(req.session) == 0
+    assert req.session.is_new
+    req.session['user'] = 'alice'
+    commit(res)
+
+    morsel = res.cookies['session']
+    assert morsel['httponly'] is True
+    assert morsel['path'] == '/'
+    assert morsel['max-age'] == 60
+
+    req2, res2 = cookie_request(cookie_storage, morsel.value)
+    assert req2.session['user'] == 'alice'
+    assert not req2.session.is_new
+    commit(res2)
+    assert 'session' not in res2.cookies
+
+
+def test_cookie_storage_unused(cookie_storage):
+    req, res = cookie_request(cookie_storage)
+    assert not res.events.on.called
+    assert not req.session.loaded
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda v: v[:-2] + ('AA' if not v.endswith('AA') else 'BB'),
+    lambda v: v.replace('.', '.x', 1),
+    lambda v: 'garbage',
+    lambda v: '',
+])
+def test_cookie_storage_rejects_tampered(cookie_storage, tamper):
+    value = cookie_storage.encode({'admin': False})
+    assert cookie_storage.decode(value) == {'admin': False}
+    assert cookie_storage.decode(tamper(value)) is None
+
+
+def test_cookie_storage_other_key(cookie_storage):
+    other = session.CookieSessionStorage('other')
+    assert cookie_storage.decode(other.encode({'a': 1})) is None
+
+
+def test_cookie_storage_key_rotation():
+    old = session.CookieSessionStorage('old')
+    rotated = session.CookieSessionStorage(['new', 'old'])
+    assert rotated.decode(old.encode({'a': 1})) == {'a': 1}
+    assert old.decode(rotated.encode({'a': 1})) is None
+
+
+def test_cookie_storage_expired(cookie_storage):
+    value = cookie_storage.encode({'a': 1}, now=1000)
+    assert cookie_storage.decode(value, now=1030) == {'a': 1}
+    assert cookie_storage.decode(value, now=1061) is None
+
+
+def test_cookie_storage_compression(cookie_storage):
+    data = {'items': ['same value'] * 100}
+    value = cookie_storage.encode(data)
+    assert value.startswith('1z.')
+    assert len(value) < len(str(data))
+    assert cookie_storage.decode(value) == data
+
+
+def test_cookie_storage_size_limit():
+    storage = session.CookieSessionStorage('secret', max_cookie_size=100,
+                                           compress_threshold=None)
+    with pytest.raises(ValueError):
+        storage.encode({'blob': 'x' * 200})
+
+    req, res = cookie_request(storage)
+    req.session['blob'] = 'x' * 200
+    commit(res)
+    assert 'session' not in res.cookies
+
+
+def test_cookie_storage_requires_key():
+    with pytest.raises(ValueError):
+        session.CookieSessionStorage('')
+
+
+@pytest.mark.asyncio
+async def test_cookie_storage_explicit_save(cookie_storage):
+    req, res = cookie_request(cookie_storage)
+    req.session['a'] = 1
+    await req.session.save()
+    assert not req.session.dirty
+    commit(res)
+    assert cookie_storage.decode(res.cookies['session'].value) == {'a': 1}
+
+
+def backend_request(sid=None):
+    from http.cookies import SimpleCookie
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = SimpleCookie()
+    if sid is not None:
+        req.cookies['qid'] = sid
+    res.cookies = SimpleCookie()
+    return req, res
+
+
+@pytest.mark.asyncio
+async def test_backend_storage_new_session():
+    backend = session.MemorySessionBackend()
+    storage = session.BackendSessionStorage(backend)
+    req, res = backend_request()
+    await storage(req, res)
+    assert req.session.is_new
+    req.session['a'] = 1
+    commit(res)
+    await storage.flush()
+
+    sid = res.cookies['qid'].value
+    assert sid == req.session.id
+    assert await backend.load(sid) == {'a': 1}
+
+    req, res = backend_request(sid)
+    await storage(req, res)
+    assert not req.session.is_new
+    assert req.session['a'] == 1
+    commit(res)
+    assert 'qid' not in res.cookies
+
+
+@pytest.mark.asyncio
+async def test_backend_storage_unmodified_not_saved():
+    backend = mock.Mock(spec=session.SessionBackend)
+    storage = session.BackendSessionStorage(backend)
+    req, res = backend_request()
+    await storage(req, res)
+    commit(res)
+    assert not backend.load.called
+    assert not backend.save.called
+    assert 'qid' not in res.cookies
+
+
+@pytest.mark.asyncio
+async def test_redis_backend():
+    from test_aio_redis import FakeRedis
+    async with FakeRedis() as server:
+        backend = session.RedisSessionBackend(port=server.port, host='127.0.0.1')
+        storage = session.BackendSessionStorage(backend, ttl=60)
+
+        requests = [backend_request() for _ in range(20)]
+        await asyncio.gather(*(storage(req, res) for req, res in requests))
+        for i, (req, res) in enumerate(requests):
+            req.session['n'] = i
+            commit(res)
+        await storage.flush()
+        assert len(server.data) == 20
+        assert set(server.expiry.values()) == {60}
+
+        sids = [res.cookies['qid'].value for _, res in requests]
+        requests = [backend_request(sid) for sid in sids]
+        await asyncio.gather(*(storage(req, res) for req, res in requests))
+        assert [req.session['n'] for req, _ in requests] == list(range(20))
+
+        assert backend.client.stats()['batches'] == 2
+        assert await backend.load('missing') is None
+        await backend.delete(sids[0])
+        assert await backend.load(sids[0]) is None
+        await backend.close()
@@ -0,0 +1,210 @@
+#
+# tests/middleware/test_sessionlog.py
+#
+
+import os
+import pytest
+import asyncio
+from unittest import mock
+from growler.middleware.session import DefaultSessionStorage
+from growler.middleware.sessionlog import SessionLogStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('sessions.log'))
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store(path, clock):
+    store = SessionLogStore(path, clock=clock, ttl=100, fsync_interval=None)
+    yield store
+    store.close()
+
+
+def test_set_get(store):
+    store['a'] = {'user': 'alice'}
+    store['b'] = {'n': 1}
+    store['a'] = {'user': 'bob'}
+    assert store['a'] == {'user': 'bob'}
+    assert store.get('b') == {'n': 1}
+    assert store.get('c') is None
+    assert 'a' in store
+    assert len(store) == 2
+
+
+def test_delete(store):
+    store['a'] = {}
+    del store['a']
+    assert 'a' not in store
+    with pytest.raises(KeyError):
+        del store['a']
+
+
+def test_replay(path, store, clock):
+    store['a'] = {'x': 1}
+    store['b'] = {'x': 2}
+    store['a'] = {'x': 3}
+    del store['b']
+    store.close()
+
+    restored = SessionLogStore(path, clock=clock)
+    assert restored['a'] == {'x': 3}
+    assert 'b' not in restored
+    assert restored.size == os.path.getsize(path)
+    assert restored.live_bytes == store.live_bytes
+    restored.close()
+
+
+def test_torn_record_discarded(path, store, clock):
+    store['a'] = {'x': 1}
+    store['b'] = {'x': 2}
+    store.close()
+    good_size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03 partial record')
+
+    restored = SessionLogStore(path, clock=clock, fsync_interval=None)
+    assert len(restored) == 2
+    assert os.path.getsize(path) == good_size
+    restored['c'] = {'x': 3}
+    restored.close()
+
+    assert SessionLogStore(path, clock=clock)['c'] == {'x': 3}
+
+
+def test_ttl(store, clock):
+    store['a'] = {}
+    clock.now += 50
+    assert 'a' in store
+    clock.now += 51
+    assert 'a' not in store
+    assert store.get('a') is None
+
+
+def test_compact(path, clock):
+    store = SessionLogStore(path, clock=clock, ttl=100, fsync_interval=None,
+                            compact_min_size=2000)
+    store['expired'] = {'x': 0}
+    clock.now += 200
+    for i in range(100):
+        store['a'] = {'i': i}
+    store['b'] = {'i': -1}
+
+    assert store.compactions > 0
+    assert store.size < 2000
+    assert store['a'] == {'i': 99}
+    assert 'expired' not in store._index
+    store.close()
+
+    restored = SessionLogStore(path, clock=clock)
+    assert restored['a'] == {'i': 99}
+    assert restored['b'] == {'i': -1}
+    assert restored.size == os.path.getsize(path)
+    restored.close()
+
+
+@pytest.mark.asyncio
+async def test_compact_in_executor(path, clock):
+    store = SessionLogStore(path, clock=clock, ttl=100, fsync_interval=None,
+                            compact_min_size=2000)
+    store['gone'] = {'x': 0}
+    for i in range(100):
+        store['a'] = {'i': i}
+    assert store.compactions == 0
+
+    # saved while the compacted log is being written
+    store['b'] = {'i': -1}
+    store['a'] = {'i': 100}
+    del store['gone']
+
+    while not store.compactions:
+        await asyncio.sleep(0.01)
+    assert store.size < 2000
+    assert store['a'] == {'i': 100}
+    assert store['b'] == {'i': -1}
+    assert 'gone' not in store
+    assert list(store._index) == ['b', 'a']
+    store.close()
+
+    restored = SessionLogStore(path, clock=clock)
+    assert restored['a'] == {'i': 100}
+    assert restored['b'] == {'i': -1}
+    assert 'gone' not in restored
+    assert restored.size == os.path.getsize(path)
+    restored.close()
+
+
+def test_sync_every_write(path):
+    store = SessionLogStore(path, fsync_interval=0)
+    store['a'] = {}
+    store['b'] = {}
+    assert store.syncs == 2
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_sync_batched(path):
+    store = SessionLogStore(path, fsync_interval=0.01)
+    for i in range(10):
+        store[str(i)] = {}
+    assert store.syncs == 0
+    await asyncio.sleep(0.05)
+    assert store.syncs == 1
+    store.close()
+
+
+def test_default_storage(path):
+    store = SessionLogStore(path, fsync_interval=None)
+    storage = DefaultSessionStorage(store=store)
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.cookies = {}
+    res.cookies = {}
+    storage(req, res)
+    req.session['user'] = 'alice'
+    for call in res.events.on.call_args_list:
+        call[0][1]()
+    store.close()
+
+    sid = res.cookies['qid']
+    assert SessionLogStore(path)[sid] == {'user': 'alice'}
+
+
+def test_expired_sessions_compacted(path, clock):
+    store = SessionLogStore(path, clock=clock, ttl=10, fsync_interval=None,
+                            compact_min_size=16 * 1024)
+    for i in range(5000):
+        clock.now += 1
+        store['s%d' % i] = {'n': i}
+
+    assert len(store) <= 11 + store.sweep_batch
+    assert store.expirations >= 5000 - 11 - store.sweep_batch
+    assert store.compactions > 0
+    assert store.size < 2 * 16 * 1024
+    assert store['s4999'] == {'n': 4999}
+    store.close()
+
+
+def test_expired_sessions_dropped_on_replay(path, store, clock):
+    store['old'] = {}
+    clock.now += 200
+    store['new'] = {}
+    store.close()
+
+    restored = SessionLogStore(path, clock=clock, ttl=100)
+    assert len(restored) == 1
+    assert restored.live_bytes < os.path.getsize(path)
+    restored.close()
@@ -4,6 +4,8 @@
 
 import pytest
 import growler
+import json
+import mimetypes
 from pathlib import Path
 from unittest import mock
 from sys import version_info
@@ -91,3 +93,373 @@ def test_call_with_etag(static, tmpdir):
 
     assert not res.set_type.called
     assert not res.send_file.called
+
+
+@pytest.fixture
+def compressed_tree(tmpdir):
+    from growler.middleware.static import precompress
+    (tmpdir / 'app.js').write('var x = 1;\n' * 100)
+    (tmpdir / 'small.js').write('var y;')
+    (tmpdir / 'logo.png').write_binary(b'\x89PNG' * 100)
+    written = precompress(str(tmpdir), encodings=['gzip'])
+    return tmpdir, written
+
+
+def test_precompress(compressed_tree):
+    import gzip
+    tmpdir, written = compressed_tree
+    assert [p.name for p in written] == ['app.js.gz']
+    data = gzip.decompress((tmpdir / 'app.js.gz').read_binary())
+    assert data == (tmpdir / 'app.js').read_binary()
+
+
+def test_precompress_skips_up_to_date(compressed_tree):
+    from growler.middleware.static import precompress
+    tmpdir, _ = compressed_tree
+    assert precompress(str(tmpdir), encodings=['gzip']) == []
+    assert len(precompress(str(tmpdir), encodings=['gzip'], force=True)) == 1
+
+
+def test_call_precompressed(compressed_tree):
+    tmpdir, _ = compressed_tree
+    static = Static(str(tmpdir), precompressed=True)
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.path = '/app.js'
+    req.headers = {'ACCEPT-ENCODING': 'gzip, deflate'}
+    res.headers = {}
+
+    static(req, res)
+
+    gz_path = Path(str(tmpdir / 'app.js.gz'))
+    res.send_file.assert_called_with(gz_path)
+    res.set_type.assert_called_with(mimetypes.guess_type('app.js')[0])
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert res.headers['Etag'] == static.calculate_etag(gz_path) + '-gzip'
+
+
+def test_call_precompressed_not_accepted(compressed_tree):
+    tmpdir, _ = compressed_tree
+    static = Static(str(tmpdir), precompressed=True)
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.path = '/app.js'
+    req.headers = {'ACCEPT-ENCODING': 'gzip;q=0'}
+    res.headers = {}
+
+    static(req, res)
+
+    res.send_file.assert_called_with(Path(str(tmpdir / 'app.js')))
+    assert 'Content-Encoding' not in res.headers
+    assert res.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_call_precompressed_etag_match(compressed_tree):
+    tmpdir, _ = compressed_tree
+    static = Static(str(tmpdir), precompressed=['gzip'])
+    gz_etag = static.calculate_etag(Path(str(tmpdir / 'app.js.gz'))) + '-gzip'
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.path = '/app.js'
+    req.headers = {'ACCEPT-ENCODING': 'gzip', 'IF-NONE-MATCH': gz_etag}
+    res.headers = {}
+
+    static(req, res)
+
+    assert res.status_code == 304
+    assert not res.send_file.called
+
+
+def test_call_precompressed_stale_sibling_ignored(compressed_tree):
+    import os
+    tmpdir, _ = compressed_tree
+    gz = str(tmpdir / 'app.js.gz')
+    os.utime(gz, ns=(0, 0))
+    static = Static(str(tmpdir), precompressed=True)
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.path = '/app.js'
+    req.headers = {'ACCEPT-ENCODING': 'gzip'}
+    res.headers = {}
+
+    static(req, res)
+
+    res.send_file.assert_called_with(Path(str(tmpdir / 'app.js')))
+
+
+@pytest.fixture
+def indexed_tree(tmpdir):
+    (tmpdir / 'index.html').write('<html></html>')
+    (tmpdir.mkdir('css') / 'site.css').write('body {}')
+    return tmpdir
+
+
+def indexed_call(static, path, **headers):
+    req, res = mock.MagicMock(), mock.MagicMock()
+    req.path = path
+    req.headers = headers
+    res.headers = {}
+    static(req, res)
+    return res
+
+
+def test_index_built(indexed_tree):
+    static = Static(str(indexed_tree), index=True)
+    assert sorted(static.index) == ['/css/site.css', '/index.html']
+    entry = static.index['/css/site.css']
+    assert entry.etag == static.calculate_etag(Path(entry.path))
+    assert entry.mime == 'text/css'
+
+
+def test_index_hit(indexed_tree):
+    static = Static(str(indexed_tree), index=True)
+    res = indexed_call(static, '/css/site.css')
+    res.set_type.assert_called_with('text/css')
+    assert res.message == b'body {}'
+    assert res.end.called
+    assert static.stats()['open_files'] == 1
+
+    res = indexed_call(static, '/css/site.css')
+    assert res.message == b'body {}'
+    assert static.hits == 2
+    assert static.stats()['open_files'] == 1
+    static.close()
+
+
+def test_index_miss(indexed_tree):
+    static = Static(str(indexed_tree), index=True)
+    for path in ('/api/users', '/../etc/passwd', '/css'):
+        res = indexed_call(static, path)
+        assert not res.end.called
+    assert static.misses == 3
+
+
+def test_index_etag_match(indexed_tree):
+    static = Static(str(indexed_tree), index=True)
+    etag = static.index['/index.html'].etag
+    res = indexed_call(static, '/index.html', **{'IF-NONE-MATCH': etag})
+    assert res.status_code == 304
+    assert not res.set_type.called
+
+
+def test_index_open_file_limit(indexed_tree):
+    static = Static(str(indexed_tree), index=True, max_open_files=1)
+    indexed_call(static, '/css/site.css')
+    indexed_call(static, '/index.html')
+    assert list(static._open_files) == [static.index['/index.html'].path]
+    static.close()
+    assert not static._open_files
+
+
+def test_index_refresh(indexed_tree):
+    static = Static(str(indexed_tree), index=True, refresh_interval=0)
+    entry = static.index['/index.html']
+    (indexed_tree / 'new.txt').write('new')
+    res = indexed_call(static, '/new.txt')
+    assert res.message == b'new'
+    assert static.index['/index.html'] is entry
+    assert static.refreshes == 2
+
+
+@pytest.mark.asyncio
+async def test_index_refresh_in_executor(indexed_tree):
+    import os
+    import threading
+    static = Static(str(indexed_tree), index=True, refresh_interval=0)
+    walk_threads = []
+    walk = os.walk
+
+    def recording_walk(*args):
+        walk_threads.append(threading.current_thread())
+        return walk(*args)
+
+    (indexed_tree / 'new.txt').write('new')
+    with mock.patch('os.walk', recording_walk):
+        res = indexed_call(static, '/new.txt')
+        assert not res.end.called
+        refreshing = static._refreshing
+        indexed_call(static, '/index.html')
+        assert static._refreshing is refreshing
+        await refreshing
+
+    assert walk_threads and threading.main_thread() not in walk_threads
+    assert static.refreshes == 2
+    res = indexed_call(static, '/new.txt')
+    assert res.message == b'new'
+    await static._refreshing
+
+
+def test_index_file_modified_in_place(indexed_tree):
+    import os
+    static = Static(str(indexed_tree), index=True, revalidate_interval=None)
+    old_etag = indexed_call(static, '/index.html').headers['Etag']
+
+    f = indexed_tree / 'index.html'
+    f.write('<html>modified in place</html>')
+    os.utime(str(f), ns=(1, 1))
+    res = indexed_call(static, '/index.html')
+    assert res.message == b'<html>modified in place</html>'
+    assert res.headers['Etag'] != old_etag
+    assert res.headers['Etag'] == static.index['/index.html'].etag
+
+
+def test_index_file_replaced_revalidated(indexed_tree):
+    import os
+    static = Static(str(indexed_tree), index=True, revalidate_interval=0)
+    indexed_call(static, '/index.html')
+
+    new = indexed_tree / 'new.html'
+    new.write('<html>replaced</html>')
+    os.replace(str(new), str(indexed_tree / 'index.html'))
+    res = indexed_call(static, '/index.html')
+    assert res.message == b'<html>replaced</html>'
+    assert '/new.html' not in static.index
+
+
+def test_index_not_revalidated_within_interval(indexed_tree):
+    static = Static(str(indexed_tree), index=True, revalidate_interval=60)
+    with mock.patch('os.stat') as stat:
+        indexed_call(static, '/index.html')
+    assert not stat.called
+
+
+def test_index_file_removed(indexed_tree):
+    static = Static(str(indexed_tree), index=True, max_open_files=0)
+    (indexed_tree / 'index.html').remove()
+    res = indexed_call(static, '/index.html')
+    assert not res.end.called
+    assert 'Etag' not in res.headers
+    assert '/index.html' not in static.index
+
+
+def test_index_precompressed(compressed_tree):
+    tmpdir, _ = compressed_tree
+    static = Static(str(tmpdir), index=True, precompressed=['gzip'])
+    res = indexed_call(static, '/app.js', **{'ACCEPT-ENCODING': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['Etag'].endswith('-gzip')
+    assert res.message == (tmpdir / 'app.js.gz').read_binary()
+    static.close()
+
+
+def test_memory_cache_hit(indexed_tree):
+    static = Static(str(indexed_tree), cache_size=4096)
+    first = indexed_call(static, '/index.html')
+    second = indexed_call(static, '/index.html')
+    assert first.send_prebuilt.called
+    prebuilt = second.send_prebuilt.call_args[0][0]
+    assert prebuilt.body == b'<html></html>'
+    assert prebuilt.headers['Content-Type'] == 'text/html'
+    index_path = Path(str(indexed_tree / 'index.html'))
+    assert prebuilt.headers['Etag'] == static.calculate_etag(index_path)
+    assert not second.send_file.called
+    stats = static.stats()
+    assert stats['cache_hits'] == 1
+    assert stats['cache_misses'] == 1
+    assert stats['cache_files'] == 1
+    assert stats['cache_bytes'] > len(b'<html></html>')
+
+
+def test_memory_cache_invalidated(indexed_tree):
+    import os
+    static = Static(str(indexed_tree), cache_size=4096)
+    indexed_call(static, '/index.html')
+    f = indexed_tree / 'index.html'
+    f.write('<html>changed</html>')
+    os.utime(str(f), ns=(1, 1))
+    res = indexed_call(static, '/index.html')
+    assert res.send_prebuilt.call_args[0][0].body == b'<html>changed</html>'
+    assert static.cache_misses == 2
+    assert static.stats()['cache_files'] == 1
+
+
+def test_memory_cache_compressed_variant(tmpdir):
+    import gzip
+    (tmpdir / 'app.js').write('var x = 1;\n' * 100)
+    static = Static(str(tmpdir), index=True, cache_size=1 << 16)
+    res = indexed_call(static, '/app.js', **{'ACCEPT-ENCODING': 'gzip'})
+    prebuilt = res.send_prebuilt.call_args[0][0]
+    assert prebuilt.headers['Content-Encoding'] == 'gzip'
+    assert prebuilt.headers['Vary'] == 'Accept-Encoding'
+    assert prebuilt.headers['Etag'].endswith('-gzip')
+    assert gzip.decompress(prebuilt.body) == b'var x = 1;\n' * 100
+
+    res = indexed_call(static, '/app.js', **{'IF-NONE-MATCH': static.index['/app.js'].etag})
+    assert res.status_code == 304
+    assert not res.send_prebuilt.called
+
+
+def test_memory_cache_eviction(tmpdir):
+    import os
+    for name in 'abc':
+        (tmpdir / name).write_binary(os.urandom(1000))
+    static = Static(str(tmpdir), cache_size=2500, cache_max_file_size=1500)
+    for name in 'abca':
+        indexed_call(static, '/' + name)
+    assert static.cache_evictions == 2
+    assert static.cache_bytes <= 2500
+    assert all(len(c.variants) == 1 for c in static._file_cache.values())
+    assert list(static._file_cache) == [str(tmpdir / 'c'), str(tmpdir / 'a')]
+
+
+def test_memory_cache_skips_large_files(tmpdir):
+    (tmpdir / 'big').write_binary(bytes(100))
+    static = Static(str(tmpdir), cache_size=4096, cache_max_file_size=10)
+    res = indexed_call(static, '/big')
+    assert res.send_file.called
+    assert not res.send_prebuilt.called
+
+
+def test_fingerprint_manifest(indexed_tree):
+    from hashlib import blake2b
+    static = Static(str(indexed_tree), fingerprint=True, url_prefix='/static')
+    digest = blake2b(b'body {}', digest_size=8).hexdigest()
+    url = '/static/css/site.%s.css' % digest
+    assert static.manifest['css/site.css'] == url
+    assert static.manifest('/css/site.css') == url
+    assert static.manifest('missing.js') == '/static/missing.js'
+    assert static.index['/css/site.%s.css' % digest] is static.index['/css/site.css']
+    assert json.loads(static.manifest.to_json())['index.html'].startswith('/static/index.')
+
+
+def test_fingerprinted_url_immutable(indexed_tree):
+    static = Static(str(indexed_tree), fingerprint=True)
+    url = static.manifest['css/site.css']
+    res = indexed_call(static, url)
+    assert res.headers['Cache-Control'] == Static.IMMUTABLE_CACHE_CONTROL
+    assert res.message == b'body {}'
+
+    res = indexed_call(static, '/css/site.css')
+    assert 'Cache-Control' not in res.headers
+    static.close()
+
+
+def test_fingerprinted_url_cached(indexed_tree):
+    static = Static(str(indexed_tree), fingerprint=True, cache_size=1 << 16)
+    res = indexed_call(static, static.manifest['index.html'])
+    prebuilt = res.send_prebuilt.call_args[0][0]
+    assert prebuilt.headers['Cache-Control'] == Static.IMMUTABLE_CACHE_CONTROL
+
+    res = indexed_call(static, '/index.html')
+    assert 'Cache-Control' not in res.send_prebuilt.call_args[0][0].headers
+
+
+def test_fingerprint_refresh(indexed_tree):
+    import os
+    static = Static(str(indexed_tree), fingerprint=True)
+    manifest = static.manifest
+    old_url = manifest['index.html']
+    f = indexed_tree / 'index.html'
+    f.write('<html>new</html>')
+    os.utime(str(f), ns=(1, 1))
+    static.refresh()
+    assert static.manifest is manifest
+    assert manifest['index.html'] != old_url
+    assert old_url not in static.index
+
+
+def test_fingerprint_skips_siblings(compressed_tree):
+    tmpdir, _ = compressed_tree
+    static = Static(str(tmpdir), fingerprint=True, precompressed=['gzip'])
+    assert 'app.js.gz' not in static.manifest
+    assert 'app.js' in static.manifest
+    res = indexed_call(static, static.manifest['app.js'], **{'ACCEPT-ENCODING': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    static.close()
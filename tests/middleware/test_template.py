@@ -0,0 +1,140 @@
+#
+# tests/middleware/test_template.py
+#
+
+import pytest
+from unittest import mock
+from growler.middleware.renderer import Renderer
+from growler.middleware.template import (
+    Markup,
+    TemplateEngine,
+    CompiledTemplate,
+    TemplateSyntaxError,
+)
+
+
+@pytest.fixture
+def engine(tmpdir):
+    return TemplateEngine(str(tmpdir))
+
+
+def render(source, **values):
+    return CompiledTemplate(source).render(values)
+
+
+@pytest.mark.parametrize('source, values, expected', [
+    ('plain {text}', {}, 'plain {text}'),
+    ('{{ a }}+{{ b * 2 }}', {'a': 1, 'b': 2}, '1+4'),
+    ('{{ x }}', {'x': '<b>&</b>'}, '&lt;b&gt;&amp;&lt;/b&gt;'),
+    ('{{! x }}', {'x': '<b>'}, '<b>'),
+    ('{{ x }}', {'x': Markup('<b>')}, '<b>'),
+    ('a{# note {{ x }} #}b', {}, 'ab'),
+    ('{% if x %}yes{% endif %}', {'x': 0}, ''),
+    ('{% if x > 1 %}big{% elif x %}one{% else %}none{% endif %}', {'x': 2}, 'big'),
+    ('{% if x > 1 %}big{% elif x %}one{% else %}none{% endif %}', {'x': 1}, 'one'),
+    ('{% if x > 1 %}big{% elif x %}one{% else %}none{% endif %}', {'x': 0}, 'none'),
+    ('{% for i in xs %}[{{ i }}]{% endfor %}', {'xs': [1, 2]}, '[1][2]'),
+    ('{% for k, v in d.items() %}{{ k }}={{ v }};{% endfor %}', {'d': {'a': 1}}, 'a=1;'),
+    ('{% for r in rows %}{% for c in r %}{{ c }}{% endfor %}|{% endfor %}',
+     {'rows': [[1, 2], [3]]}, '12|3|'),
+    ('{% set n = len(xs) %}{{ n }}', {'xs': 'abc'}, '3'),
+    ('{% for i in [] %}x{% endfor %}', {}, ''),
+    ('', {}, ''),
+    ('{% set a, b = 1, 2 %}', {}, ''),
+    ('{{ x }}{% set x = 2 %}{{ x }}', {'x': 1}, '12'),
+    ('{% if x and\n   y %}{{ x +\n y }}{% endif %}', {'x': 1, 'y': 2}, '3'),
+])
+def test_render(source, values, expected):
+    assert render(source, **values) == expected
+
+
+def test_fragments_yielded():
+    template = CompiledTemplate('<p>{{ a }}, {{ b }}</p>{% if a %}x{% endif %}')
+    assert list(template.iter_render({'a': 1, 'b': 2})) == ['<p>', '1', ', ', '2', '</p>', 'x']
+
+
+def test_fragments_joined_once():
+    template = CompiledTemplate('<p>{{ a }}, {{ b }}</p>{% if a %}x{% endif %}')
+    assert template.python_source.count('_t_extend') == 2
+    assert 'yield' not in template.python_source
+    assert template.render({'a': 1, 'b': 2}) == '<p>1, 2</p>x'
+    assert template._stream_code is None
+
+
+def test_missing_variable():
+    with pytest.raises(NameError):
+        render('{{ missing }}')
+
+
+@pytest.mark.parametrize('source, lineno', [
+    ('{% if x %}', 1),
+    ('line\n{% endif %}', 2),
+    ('{% for x %}{% endfor %}', 1),
+    ('{{ }}', 1),
+    ('\n\n{{ 1 + }}', 3),
+    ('{% else %}', 1),
+    ('{% if a %}{% else %}{% else %}{% endif %}', 1),
+    ('{% if a %}{% endfor %}', 1),
+    ('{% unknown %}', 1),
+    ('{% set x == 1 %}', 1),
+])
+def test_syntax_errors(source, lineno):
+    with pytest.raises(TemplateSyntaxError) as err:
+        CompiledTemplate(source, 'page.html.tpl')
+    assert err.value.lineno == lineno
+    assert err.value.filename == 'page.html.tpl'
+
+
+def test_engine_render(engine, tmpdir):
+    (tmpdir / 'page.html.tpl').write('<ul>{% for i in xs %}<li>{{ i }}</li>{% endfor %}</ul>')
+    res = mock.Mock()
+    del res.render
+    engine(mock.Mock(), res)
+    res.render('page', {'xs': ['a', '<b>']})
+    res.send_html.assert_called_with('<ul><li>a</li><li>&lt;b&gt;</li></ul>')
+
+
+def test_engine_include(engine, tmpdir):
+    (tmpdir / 'header.html.tpl').write('<h1>{{ title }}</h1>{% set seen = True %}')
+    (tmpdir / 'page.html.tpl').write('{% include "header" %}{{ seen }}')
+    filename = engine.resolve('page')
+    assert engine.render_source(filename, {'title': 'Hi'}) == '<h1>Hi</h1>True'
+    stream = engine.render_stream(filename, {'title': 'Hi'})
+    assert list(stream) == ['<h1>', 'Hi', '</h1>', 'True']
+    assert engine.templates.get(filename)._stream_code is not None
+
+
+def test_engine_render_stream_incremental(engine, tmpdir):
+    (tmpdir / 'header.html.tpl').write('<head></head>')
+    (tmpdir / 'page.html.tpl').write('{% include "header" %}<body>{{ body() }}</body>')
+    body = mock.Mock(return_value='text')
+    stream = engine.render_stream(engine.resolve('page'), {'body': body})
+
+    assert next(stream) == '<head></head>'
+    assert next(stream) == '<body>'
+    assert not body.called
+    assert list(stream) == ['text', '</body>']
+
+
+def test_engine_include_missing(engine, tmpdir):
+    (tmpdir / 'page.html.tpl').write('{% include "nope" %}')
+    with pytest.raises(ValueError):
+        engine.render_source(engine.resolve('page'), {})
+
+
+def test_engine_include_recursion(engine, tmpdir):
+    (tmpdir / 'loop.html.tpl').write('x{% include "loop" %}')
+    with pytest.raises(ValueError):
+        engine.render_source(engine.resolve('loop'), {})
+
+
+def test_engine_compiles_once(engine, tmpdir):
+    (tmpdir / 'page.html.tpl').write('{{ x }}')
+    filename = engine.resolve('page')
+    for i in range(3):
+        assert engine.render_source(filename, {'x': i}) == str(i)
+    assert engine.templates.stats()['compiles'] == 1
+
+
+def test_registered():
+    assert Renderer.render_engine_map['template'] is TemplateEngine
@@ -7,6 +7,8 @@ import asyncio
 import socket
 import growler
 from unittest import mock
+from growler.http import HTTPMethod
+from growler.http.response import HTTPResponse
 
 
 @pytest.fixture
@@ -60,7 +62,7 @@ def mock_req():
 def mock_res():
     mock_protocol = mock.Mock()
     res = growler.http.HTTPResponse(mock_protocol)
-    return mock.Mock(spec=res)
+    return mock.Mock(spec=res, has_sent_headers=False)
 
 
 @pytest.fixture
@@ -73,3 +75,25 @@ def mock_req_factory(mock_req):
 def mock_res_factory(mock_res):
     factory = mock.Mock(return_value=mock_res)
     return factory
+
+
+def make_req(path='/', method=HTTPMethod.GET, query=None, headers=None):
+    """
+    Returns a mock request with the given attributes.
+    """
+    req = mock.Mock()
+    req.method = method
+    req.path = path
+    req.query = query or {}
+    req.headers = headers or {}
+    return req
+
+
+def make_res():
+    """
+    Returns a real HTTPResponse, writing to a mock transport.
+    """
+    protocol = mock.Mock()
+    protocol.transport.can_write_eof.return_value = True
+    protocol.http_application = growler.App()
+    return HTTPResponse(protocol)
@@ -0,0 +1,151 @@
+#
+# tests/test_aio_executor.py
+#
+
+import pytest
+import growler
+import threading
+from unittest import mock
+from growler.aio.executor import (
+    ExecutorMiddleware,
+    ThreadPoolMiddlewareExecutor,
+    ProcessPoolMiddlewareExecutor,
+)
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolMiddlewareExecutor(2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_in_thread(executor):
+    main_thread = threading.get_ident()
+    result = await executor.run(threading.get_ident)
+    assert result != main_thread
+
+    stats = executor.stats()
+    assert stats['submitted'] == 1
+    assert stats['completed'] == 1
+    assert stats['pending'] == 0
+    assert stats['queue_depth'] == 0
+    assert stats['max_workers'] == 2
+
+
+@pytest.mark.asyncio
+async def test_run_raises(executor):
+    def bad():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await executor.run(bad)
+
+    assert executor.failed == 1
+    assert executor.pending == 0
+
+
+def test_queue_depth(executor):
+    executor.pending = 5
+    assert executor.queue_depth == 3
+
+
+def test_middleware_rejects_coroutine():
+    async def handler(req, res):
+        pass
+
+    with pytest.raises(TypeError):
+        ExecutorMiddleware(handler)
+
+
+def test_middleware_rejects_process_pool():
+    with pytest.raises(TypeError):
+        ExecutorMiddleware(lambda req, res: None, 'process')
+
+
+@pytest.mark.asyncio
+async def test_middleware_uses_app_executor(executor):
+    called_in = []
+
+    def handler(req, res):
+        called_in.append(threading.get_ident())
+
+    req, res = mock.Mock(), mock.Mock()
+    req.app.get_executor.return_value = executor
+
+    mw = ExecutorMiddleware(handler, 'thread')
+    await mw(req, res)
+
+    req.app.get_executor.assert_called_with('thread')
+    assert called_in and called_in[0] != threading.get_ident()
+
+
+def test_app_get_executor():
+    app = growler.App(executor_workers=3)
+    executor = app.get_executor()
+    assert isinstance(executor, ThreadPoolMiddlewareExecutor)
+    assert executor.max_workers == 3
+    assert app.get_executor('thread') is executor
+    assert isinstance(app.get_executor('process'), ProcessPoolMiddlewareExecutor)
+
+
+def test_app_route_with_executor():
+    app = growler.App()
+
+    def handler(req, res):
+        pass
+
+    app.get('/', handler, executor='thread')
+
+    stored = app.router.last().func
+    assert isinstance(stored, ExecutorMiddleware)
+    assert stored.func is handler
+    assert handler in app.router
+
+
+@pytest.mark.asyncio
+async def test_middleware_writes_in_loop_thread(executor):
+    from growler.http.response import HTTPResponse
+    loop_thread = threading.get_ident()
+    write_threads = []
+
+    protocol = mock.Mock()
+    protocol.http_application = growler.App()
+    protocol.transport.can_write_eof.return_value = True
+    for name in ('write', 'write_eof', 'close'):
+        getattr(protocol.transport, name).side_effect = \
+            lambda *args: write_threads.append(threading.get_ident())
+    res = HTTPResponse(protocol)
+    req = mock.Mock()
+
+    handler_thread = []
+
+    def handler(req, res):
+        handler_thread.append(threading.get_ident())
+        res.headers['X-Thread'] = 'worker'
+        res.send_text('hello')
+        assert res.has_ended
+
+    await ExecutorMiddleware(handler, executor)(req, res)
+
+    assert handler_thread[0] != loop_thread
+    assert write_threads and set(write_threads) == {loop_thread}
+    assert res.headers['X-Thread'] == 'worker'
+    assert res.has_ended
+
+
+@pytest.mark.asyncio
+async def test_middleware_send_errors_raised_in_handler(executor):
+    res = mock.Mock()
+    res.send_text.side_effect = ValueError("bad")
+    errors = []
+
+    def handler(req, res):
+        try:
+            res.send_text('x')
+        except ValueError as err:
+            errors.append(err)
+
+    await ExecutorMiddleware(handler, executor)(mock.Mock(), res)
+    assert len(errors) == 1
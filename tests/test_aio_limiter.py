@@ -0,0 +1,146 @@
+#
+# tests/test_aio_limiter.py
+#
+
+import pytest
+import asyncio
+import growler
+from unittest import mock
+from growler.aio.limiter import (
+    Priority,
+    ConcurrencyLimiter,
+    LimitedMiddleware,
+)
+
+
+def test_priority_get():
+    assert Priority.get(None) == Priority.NORMAL
+    assert Priority.get('critical') == Priority.CRITICAL
+    assert Priority.get(5) == 5
+
+
+def test_try_acquire():
+    limiter = ConcurrencyLimiter(2)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.active == 1
+
+
+@pytest.mark.asyncio
+async def test_waiters_woken_by_priority():
+    limiter = ConcurrencyLimiter(1)
+    assert limiter.try_acquire()
+
+    order = []
+
+    async def waiter(name, priority):
+        await limiter.acquire(priority)
+        order.append(name)
+        limiter.release()
+
+    tasks = [asyncio.ensure_future(waiter('bulk', Priority.BULK)),
+             asyncio.ensure_future(waiter('normal', Priority.NORMAL)),
+             asyncio.ensure_future(waiter('health', Priority.CRITICAL))]
+    await asyncio.sleep(0)
+    assert limiter.waiting == 3
+
+    limiter.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ['health', 'normal', 'bulk']
+    assert limiter.active == 0
+    assert limiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_is_skipped():
+    limiter = ConcurrencyLimiter(1)
+    limiter.try_acquire()
+
+    task = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert limiter.waiting == 0
+    limiter.release()
+    assert limiter.active == 0
+
+
+def test_middleware_sync_call():
+    limiter = ConcurrencyLimiter(1)
+    func = mock.Mock(return_value=None)
+    mw = LimitedMiddleware(func, limiter)
+    req, res = mock.Mock(), mock.Mock()
+
+    assert mw(req, res) is None
+    func.assert_called_with(req, res)
+    assert limiter.active == 0
+
+
+def test_middleware_overflow_sends_503():
+    limiter = ConcurrencyLimiter(1, max_queue=0)
+    limiter.try_acquire()
+    func = mock.Mock()
+    mw = LimitedMiddleware(func, limiter)
+    req, res = mock.Mock(), mock.MagicMock()
+
+    assert mw(req, res) is None
+    assert not func.called
+    res.send_text.assert_called_with("503 - Service Unavailable", 503)
+    assert limiter.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_middleware_waits_for_slot():
+    limiter = ConcurrencyLimiter(1, max_queue=1)
+    limiter.try_acquire()
+    func = mock.Mock(return_value=None)
+    mw = LimitedMiddleware(func, limiter)
+
+    pending = asyncio.ensure_future(mw(mock.Mock(), mock.Mock()))
+    await asyncio.sleep(0)
+    assert not func.called
+
+    limiter.release()
+    await pending
+    assert func.called
+    assert limiter.active == 0
+
+
+def test_router_limits_routes():
+    router = growler.Router(concurrency=4, max_queue=8)
+    handler = mock.Mock()
+    router.get('/healthz', handler, priority='critical')
+
+    mw = router.last().func
+    assert isinstance(mw, LimitedMiddleware)
+    assert mw.limiter is router.limiter
+    assert mw.priority == Priority.CRITICAL
+    assert handler in router
+
+
+def test_route_limit_inside_router_limit():
+    router = growler.Router(concurrency=4)
+
+    def report(req, res):
+        pass
+
+    router.get('/report', report, concurrency=1, max_queue=2)
+
+    outer = router.last().func
+    assert outer.limiter.max_concurrent == 1
+    assert outer.limiter.max_queue == 2
+    assert router.limiter.max_queue == 4 * router.queue_factor
+    assert outer.func.limiter is router.limiter
+    assert report in router
+
+
+def test_unbounded_queue_limiter_shared():
+    limiter = ConcurrencyLimiter(2)
+    router = growler.Router(concurrency=limiter)
+    assert router.limiter is limiter
+    assert router.limiter.max_queue is None
@@ -0,0 +1,260 @@
+#
+# tests/test_aio_redis.py
+#
+
+import pytest
+import asyncio
+from growler.aio.redis import (
+    RedisError,
+    RedisClient,
+    encode_command,
+    read_reply,
+)
+
+
+def parse_commands(buffer):
+    """
+    Returns the complete commands (lists of bytes) at the start of
+    buffer, and the remaining bytes.
+    """
+    commands = []
+    while buffer.startswith(b'*'):
+        try:
+            head, rest = buffer.split(b'\r\n', 1)
+            args = []
+            for _ in range(int(head[1:])):
+                size, rest = rest.split(b'\r\n', 1)
+                size = int(size[1:])
+                if len(rest) < size + 2:
+                    raise ValueError
+                args.append(rest[:size])
+                rest = rest[size + 2:]
+        except ValueError:
+            break
+        commands.append(args)
+        buffer = rest
+    return commands, buffer
+
+
+class FakeRedis:
+    """
+    Local server answering a small subset of Redis commands, counting
+    the reads (round trips) and connections it handles.
+    """
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.expiry = {}
+        self.connections = 0
+        self.reads = 0
+        self.commands = []
+        self.handlers = {}
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        for writer in self.handlers.values():
+            writer.close()
+        await asyncio.gather(*self.handlers)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.handlers[asyncio.current_task()] = writer
+        authed = self.password is None
+        buffer = b''
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            self.reads += 1
+            commands, buffer = parse_commands(buffer + data)
+            if any(name.upper() == b'SLOW' for name, *_ in commands):
+                await asyncio.sleep(0.05)
+            replies = []
+            for name, *args in commands:
+                name = name.decode().upper()
+                self.commands.append(name)
+                if name == 'AUTH':
+                    authed = args[0].decode() == self.password
+                    replies.append(b'+OK\r\n' if authed else b'-ERR invalid password\r\n')
+                elif not authed:
+                    replies.append(b'-NOAUTH Authentication required.\r\n')
+                else:
+                    replies.append(self.execute(name, args))
+            writer.write(b''.join(replies))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                break
+        writer.close()
+
+    def execute(self, name, args):
+        if name == 'GET':
+            value = self.data.get(args[0])
+            if value is None:
+                return b'$-1\r\n'
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        if name == 'SET':
+            self.data[args[0]] = args[1]
+            if len(args) == 4 and args[2].upper() == b'EX':
+                self.expiry[args[0]] = int(args[3])
+            return b'+OK\r\n'
+        if name == 'DEL':
+            return b':%d\r\n' % (self.data.pop(args[0], None) is not None)
+        if name == 'PING':
+            return b'+PONG\r\n'
+        if name == 'SLOW':
+            return b'+SLOW\r\n'
+        if name == 'GARBLED':
+            return b':twelve\r\n'
+        if name == 'SELECT':
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+def test_encode_command():
+    assert encode_command('SET', b'k', 10) == b'*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$2\r\n10\r\n'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('data, expected', [
+    (b'+OK\r\n', 'OK'),
+    (b':42\r\n', 42),
+    (b'$5\r\nhe\r\no\r\n', b'he\r\no'),
+    (b'$-1\r\n', None),
+    (b'*2\r\n$1\r\na\r\n:1\r\n', [b'a', 1]),
+    (b'_\r\n', None),
+])
+async def test_read_reply(data, expected):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    assert await read_reply(reader) == expected
+
+
+@pytest.mark.asyncio
+async def test_read_reply_error():
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'-ERR bad\r\n')
+    reply = await read_reply(reader)
+    assert isinstance(reply, RedisError)
+    assert str(reply) == 'ERR bad'
+
+    reader.feed_eof()
+    with pytest.raises(ConnectionError):
+        await read_reply(reader)
+
+
+@pytest.mark.asyncio
+async def test_execute():
+    async with FakeRedis() as server:
+        client = RedisClient('127.0.0.1', server.port)
+        assert await client.execute('SET', 'a', 'x') == 'OK'
+        assert await client.execute('GET', 'a') == b'x'
+        assert await client.execute('GET', 'missing') is None
+        with pytest.raises(RedisError):
+            await client.execute('NOPE')
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_commands_pipelined():
+    async with FakeRedis() as server:
+        client = RedisClient('127.0.0.1', server.port)
+        await asyncio.gather(*(client.execute('SET', 'k%d' % i, i) for i in range(100)))
+        values = await asyncio.gather(*(client.execute('GET', 'k%d' % i) for i in range(100)))
+
+        assert values == [b'%d' % i for i in range(100)]
+        assert client.stats()['commands'] == 200
+        assert client.stats()['batches'] == 2
+        assert server.connections == 1
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_max_batch_and_pool_size():
+    async with FakeRedis() as server:
+        client = RedisClient('127.0.0.1', server.port, pool_size=2, max_batch=10)
+        await asyncio.gather(*(client.execute('PING') for i in range(50)))
+        assert client.batches == 5
+        assert server.connections <= 2
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_error_does_not_break_pipeline():
+    async with FakeRedis() as server:
+        client = RedisClient('127.0.0.1', server.port)
+        results = await asyncio.gather(client.execute('PING'),
+                                       client.execute('NOPE'),
+                                       client.execute('PING'),
+                                       return_exceptions=True)
+        assert results[0] == results[2] == 'PONG'
+        assert isinstance(results[1], RedisError)
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_auth():
+    async with FakeRedis(password='secret') as server:
+        client = RedisClient('127.0.0.1', server.port, password='secret', db=2)
+        assert await client.execute('PING') == 'PONG'
+        assert server.commands[:2] == ['AUTH', 'SELECT']
+        await client.close()
+
+        client = RedisClient('127.0.0.1', server.port, password='wrong')
+        with pytest.raises(RedisError):
+            await client.execute('PING')
+        assert client.errors == 1
+
+
+@pytest.mark.asyncio
+async def test_connection_refused(unused_tcp_port):
+    client = RedisClient('127.0.0.1', unused_tcp_port)
+    with pytest.raises(OSError):
+        await client.execute('PING')
+    assert client.errors == 1
+
+
+@pytest.mark.asyncio
+async def test_read_reply_malformed():
+    reader = asyncio.StreamReader()
+    reader.feed_data(b':twelve\r\n')
+    with pytest.raises(ConnectionError):
+        await read_reply(reader)
+
+
+@pytest.mark.asyncio
+async def test_malformed_reply_closes_connection():
+    async with FakeRedis() as server:
+        client = RedisClient('127.0.0.1', server.port, pool_size=1)
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(client.execute('GARBLED'), 1)
+        assert client.errors == 1
+        assert client.stats()['idle_connections'] == 0
+
+        assert await client.execute('PING') == 'PONG'
+        assert server.connections == 2
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_batch_closes_connection():
+    async with FakeRedis() as server:
+        client = RedisClient('127.0.0.1', server.port, pool_size=1)
+        slow = asyncio.ensure_future(client.execute('SLOW'))
+        await asyncio.sleep(0.01)
+        for task in client._tasks:
+            task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+        assert client.stats()['idle_connections'] == 0
+
+        assert await client.execute('PING') == 'PONG'
+        assert server.connections == 2
+        await client.close()
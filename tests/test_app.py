@@ -505,6 +505,47 @@ async def test_handle_header_expect(mock_transport):
     assert mock_transport.write.mock_calls[0] == mock.call(b'HTTP/1.1 100 Continue\r\n\r\n')
 
 
+def test_start_client_request_sync(app, req, res):
+    res.has_ended = False
+    m = mock.Mock()
+
+    @app.use
+    def sync_mw(req, res):
+        m()
+        res.has_ended = True
+
+    assert app.start_client_request(req, res) is None
+    assert m.called
+
+
+@pytest.mark.asyncio
+async def test_start_client_request_returns_pending(app, req, res):
+    res.has_ended = False
+    m0, m1, m2 = mock.Mock(), mock.Mock(), mock.Mock()
+
+    @app.use
+    def first(req, res):
+        m0()
+
+    @app.use
+    async def second(req, res):
+        m1()
+
+    @app.use
+    def third(req, res):
+        m2()
+        res.has_ended = True
+
+    pending = app.start_client_request(req, res)
+    assert m0.called
+    assert not m1.called
+    assert not m2.called
+
+    await pending
+    assert m1.called
+    assert m2.called
+
+
 @pytest.mark.asyncio
 async def test_middleware_stops_with_stop_iteration(app, req, res):
     async def do_something(req, res):
@@ -696,6 +737,26 @@ async def test_handle_server_error_in_error(app, req, res):
     assert not m2.called
 
 
+@pytest.mark.asyncio
+async def test_handle_server_error_after_chunks(app, req):
+    res = make_res()
+    handler = mock.Mock()
+    app.use(lambda rq, rs, er: handler(er))
+
+    @app.use
+    def streams(rq, rs):
+        rs.write_chunk('<html>')
+        raise Exception("boom")
+
+    await app.handle_client_request(req, res)
+    writes = [c[0][0] for c in res.stream.write.call_args_list]
+    assert sum(w.startswith(b'HTTP/1.1') for w in writes) == 1
+    assert b'0\r\n\r\n' not in writes
+    res.stream.abort.assert_called_once_with()
+    assert res.has_ended
+    handler.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_response_not_sent(app, req, res):
     req.method = 0b000001
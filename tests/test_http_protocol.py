@@ -26,7 +26,8 @@ def MockGrowlerHTTPProtocol(request):
 def mock_app(mock_req_factory, mock_res_factory):
     return mock.Mock(spec=growler.Application,
                      _request_class=mock_req_factory,
-                     _response_class=mock_res_factory)
+                     _response_class=mock_res_factory,
+                     enabled=mock.Mock(return_value=None))
 
 
 @pytest.fixture
@@ -151,6 +152,31 @@ async def test_begin_application(proto, mock_app, mock_req, mock_res, AsyncMock)
     mock_app.handle_client_request.assert_called_with(mock_req, mock_res)
 
 
+@pytest.mark.asyncio
+async def test_begin_application_inline(proto, mock_app, mock_req, mock_res):
+    mock_app.enabled.return_value = True
+    mock_app.start_client_request.return_value = None
+
+    proto.begin_application(mock_req, mock_res)
+    mock_app.start_client_request.assert_called_with(mock_req, mock_res)
+    assert not mock_app.handle_client_request.called
+
+
+@pytest.mark.asyncio
+async def test_begin_application_inline_schedules_pending(proto, mock_app, mock_req, mock_res):
+    m = mock.Mock()
+
+    async def pending():
+        m()
+
+    mock_app.enabled.return_value = True
+    mock_app.start_client_request.return_value = pending()
+
+    proto.begin_application(mock_req, mock_res)
+    await asyncio.sleep(0)
+    assert m.called
+
+
 @pytest.mark.asyncio
 async def test_body_storage_pair(proto):
     data = b'test data'
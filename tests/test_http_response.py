@@ -10,7 +10,11 @@ from pathlib import Path
 from unittest import mock
 from asyncio import BaseEventLoop
 from collections import OrderedDict
-from growler.http.response import Headers
+from growler.http.response import (
+    Headers,
+    PrebuiltResponse,
+    current_date_bytes,
+)
 
 from mock_classes import (
     request_uri,
@@ -101,6 +105,88 @@ def test_send_headers(res):
     res.send_headers()
 
 
+def test_send_prebuilt(res, mock_app):
+    mock_app.enabled.return_value = False
+    prebuilt = PrebuiltResponse('ok', headers={'Cache-Control': 'no-cache'})
+    res.send_prebuilt(prebuilt)
+
+    assert res.stream.write.call_count == 1
+    data = res.stream.write.call_args[0][0]
+    head, body = data.split(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    assert lines[0] == b'HTTP/1.1 200 OK'
+    assert b'Content-Length: 2' in lines
+    assert b'Content-Type: text/plain' in lines
+    assert b'Cache-Control: no-cache' in lines
+    assert b'Date: ' + current_date_bytes() in lines
+    assert not any(line.startswith(b'X-Powered-By') for line in lines)
+    assert body == b'ok'
+    assert res.has_ended
+    assert res.status_code == 200
+
+
+def test_send_prebuilt_powered_by(res, mock_app):
+    mock_app.enabled.return_value = True
+    res.send_prebuilt(PrebuiltResponse(b'', status=204))
+    data = res.stream.write.call_args[0][0]
+    assert data.startswith(b'HTTP/1.1 204 No Content\r\n')
+    assert b'\r\nX-Powered-By: Growler\r\n' in data
+    assert data.endswith(b'\r\n\r\n')
+
+
+def test_send_prebuilt_merges_headers(res, mock_app):
+    mock_app.enabled.return_value = False
+    res.events.on('headers', lambda: res.headers.setdefault('X-Listener', 'yes'))
+    res.headers['Set-Cookie'] = 'a=1'
+    res.headers['Cache-Control'] = 'private'
+    res.send_prebuilt(PrebuiltResponse('ok', headers={'Cache-Control': 'no-cache'}))
+
+    assert res.stream.write.call_count == 1
+    head, body = res.stream.write.call_args[0][0].split(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    assert lines[0] == b'HTTP/1.1 200 OK'
+    assert b'Set-Cookie: a=1' in lines
+    assert b'X-Listener: yes' in lines
+    assert b'Cache-Control: private' in lines
+    assert b'Cache-Control: no-cache' not in lines
+    assert b'Content-Type: text/plain' in lines
+    assert b'Content-Length: 2' in lines
+    assert body == b'ok'
+    assert res.has_ended
+
+
+def test_send_prebuilt_headers_listener(res, mock_app):
+    import gzip
+    from growler.middleware.compress import Compression
+    mock_app.enabled.return_value = False
+    compression = Compression(min_size=10)
+    res.events.on('headers', lambda: compression.on_headers(res, 'gzip'))
+    res.send_prebuilt(PrebuiltResponse('ok' * 100))
+
+    head, body = res.stream.write.call_args[0][0].split(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    assert b'Content-Encoding: gzip' in lines
+    assert b'Content-Length: %d' % len(body) in lines
+    assert gzip.decompress(body) == b'ok' * 100
+
+
+@pytest.mark.parametrize('value, content_type, body', [
+    ('ok', 'text/plain', b'ok'),
+    (b'ok', 'text/plain', b'ok'),
+    ({'a': 1}, 'application/json', b'{"a": 1}'),
+])
+def test_prebuilt_from_value(value, content_type, body):
+    prebuilt = PrebuiltResponse.from_value(value)
+    assert prebuilt.headers['Content-Type'] == content_type
+    assert prebuilt.body == body
+    assert PrebuiltResponse.from_value(prebuilt) is prebuilt
+
+
+def test_prebuilt_from_bad_value():
+    with pytest.raises(TypeError):
+        PrebuiltResponse.from_value(42)
+
+
 # def test_set_cookie(res):
 #     res.cookie("thing", "value")
 #     assert res.cookies["thing"] == "value"
@@ -366,3 +452,19 @@ def test_headers_add_header_tuple(headers):
 def test_headers_add_header_with_params(headers):
     headers.add_header('A', 'b', encoding='utf8', foo='bar')
     assert str(headers) == 'A: b; encoding="utf8" foo="bar"\r\n\r\n'
+
+
+def test_cookies_lazy(res):
+    assert 'Set-Cookie' not in res.headers
+    assert b'Set-Cookie' not in str(res.headers).encode()
+
+    res.cookies['a'] = '1'
+    assert 'Set-Cookie' in res.headers
+    res.cookies['b'] = '2'
+    res.cookies['b']['path'] = '/'
+    assert 'Set-Cookie: a=1\r\nSet-Cookie: b=2; Path=/\r\n' in str(res.headers)
+
+
+def test_cookies_empty_header_omitted(res):
+    res.cookies
+    assert 'Set-Cookie' not in str(res.headers)
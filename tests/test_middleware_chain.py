@@ -257,3 +257,148 @@ def test_chain_reversed(chain):
     rev = reversed(chain)
     assert next(rev).func is mw1
     assert next(rev).func is mw0
+
+
+def test_concurrent_middleware_grouped(chain):
+    from growler.routing import ConcurrentMiddleware
+
+    mw0 = lambda x, y: None
+    mw1 = lambda x, y: None
+    mw2 = lambda x, y: None
+    mw3 = lambda x, y: None
+    chain.add(0x1, '/', mw0)
+    chain.add(0x1, '/', mw1, provides='session')
+    chain.add(0x1, '/', mw2, needs='session')
+    chain.add(0x1, '/', mw3)
+
+    gen = chain(0x1, '/')
+    assert next(gen) is mw0
+    group = next(gen)
+    assert isinstance(group, ConcurrentMiddleware)
+    assert group.waves == [[mw1], [mw2]]
+    assert next(gen) is mw3
+
+
+def test_single_concurrent_middleware_not_grouped(chain):
+    mw0 = lambda x, y: None
+    chain.add(0x1, '/', mw0, provides='user')
+    assert list(chain(0x1, '/')) == [mw0]
+
+
+def test_concurrent_middleware_circular():
+    from growler.routing import ConcurrentMiddleware, _name_set
+
+    nodes = [mock.Mock(func=mock.Mock(), provides=_name_set('a'), needs=_name_set('b')),
+             mock.Mock(func=mock.Mock(), provides=_name_set('b'), needs=_name_set('a'))]
+    with pytest.raises(ValueError):
+        ConcurrentMiddleware(nodes)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_middleware_runs_together(chain):
+    import asyncio
+
+    events = []
+    res = mock.Mock(has_ended=False)
+
+    def make_mw(name, delay):
+        async def mw(req, res):
+            events.append(name + '-start')
+            await asyncio.sleep(delay)
+            events.append(name + '-end')
+        return mw
+
+    chain.add(0x1, '/', make_mw('session', 0.01), provides='session')
+    chain.add(0x1, '/', make_mw('flags', 0.0), provides='flags')
+    chain.add(0x1, '/', make_mw('user', 0.0), provides='user', needs='session')
+
+    group, = chain(0x1, '/')
+    await group(mock.Mock(), res)
+
+    assert events[:2] == ['session-start', 'flags-start']
+    assert events.index('session-end') < events.index('user-start')
+
+
+@pytest.mark.asyncio
+async def test_concurrent_middleware_stops_on_has_ended(chain):
+    res = mock.Mock(has_ended=False)
+    after = mock.Mock()
+
+    async def ender(req, res):
+        res.has_ended = True
+
+    chain.add(0x1, '/', ender, provides='a')
+    chain.add(0x1, '/', after, needs='a')
+
+    group, = chain(0x1, '/')
+    await group(mock.Mock(), res)
+    assert not after.called
+
+
+@pytest.mark.asyncio
+async def test_concurrent_middleware_raises(chain):
+    async def ok(req, res):
+        pass
+
+    async def bad(req, res):
+        raise ValueError("boom")
+
+    chain.add(0x1, '/', ok, provides='a')
+    chain.add(0x1, '/', bad, provides='b')
+
+    group, = chain(0x1, '/')
+    with pytest.raises(ValueError):
+        await group(mock.Mock(), mock.Mock(has_ended=False))
+
+
+def test_concurrent_middleware_sync_runs_inline(chain):
+    m0, m1 = mock.Mock(), mock.Mock()
+    chain.add(0x1, '/', lambda req, res: m0(), provides='a')
+    chain.add(0x1, '/', lambda req, res: m1(), needs='a')
+
+    group, = chain(0x1, '/')
+    assert group(mock.Mock(), mock.Mock(has_ended=False)) is None
+    assert m0.called and m1.called
+
+
+def test_concurrent_middleware_circular_raises_on_add(chain):
+    chain.add(0x1, '/', lambda req, res: None, provides='a', needs='b')
+    with pytest.raises(ValueError):
+        chain.add(0x1, '/', lambda req, res: None, provides='b', needs='a')
+    assert len(chain) == 1
+
+
+def test_concurrent_group_built_once(chain):
+    chain.add(0x1, '/', lambda req, res: None, provides='a')
+    chain.add(0x1, '/', lambda req, res: None, needs='a')
+
+    group, = chain(0x1, '/')
+    assert list(chain(0x1, '/')) == [group]
+
+
+def test_concurrent_group_selects_matching(chain):
+    mw0 = lambda req, res: None
+    mw1 = lambda req, res: None
+    mw2 = lambda req, res: None
+    chain.add(0x1, '/', mw0, provides='a')
+    chain.add(0x1, '/x', mw1, provides='b', needs='a')
+    chain.add(0x1, '/', mw2, needs='b')
+
+    group, = chain(0x1, '/')
+    assert group.waves == [[mw0], [mw2]]
+
+
+def test_concurrent_sync_wave_stops_on_has_ended(chain):
+    res = mock.Mock(has_ended=False)
+    after = mock.Mock()
+
+    def ender(req, res):
+        res.has_ended = True
+
+    chain.add(0x1, '/', ender, provides='a')
+    chain.add(0x1, '/', lambda req, res: after(), provides='b')
+
+    group, = chain(0x1, '/')
+    assert group.waves == [[ender, group.funcs[1]]]
+    assert group(mock.Mock(), res) is None
+    assert not after.called
@@ -38,7 +38,9 @@ def test_renderer_fixture(renderer):
     assert isinstance(renderer, Renderer)
 
 
-def test_req_call(renderer, req, res):
+def test_req_call(renderer, req, res, mock_engine):
     path = mock.Mock(spec="")
     obj = mock.MagicMock()
     renderer(path, obj)
+    assert mock_engine.render_source.called
+    assert res.send_html.called
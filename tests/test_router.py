@@ -321,3 +321,73 @@ def test_find_routable_attributes(router):
     for x, y in _find_routeable_attributes(obj, keys):
         assert y == 'GET'
         assert x == obj.get_something
+
+
+@pytest.fixture
+def vhosts():
+    return growler.VirtualHostRouter()
+
+
+def test_vhost_exact_lookup(vhosts):
+    app = mock.Mock()
+    vhosts.add('Example.COM', app)
+    assert vhosts.lookup('example.com') is app
+    assert vhosts.lookup('example.com:8080') is app
+    assert vhosts.lookup('other.com') is None
+
+
+def test_vhost_wildcard_lookup(vhosts):
+    parent, child = mock.Mock(), mock.Mock()
+    vhosts.add('*.example.com', parent)
+    vhosts.add('*.a.example.com', child)
+    vhosts.add('www.a.example.com', mock.sentinel.www)
+
+    assert vhosts.lookup('b.example.com') is parent
+    assert vhosts.lookup('x.a.example.com') is child
+    assert vhosts.lookup('www.a.example.com') is mock.sentinel.www
+    assert vhosts.lookup('example.com') is None
+
+
+def test_vhost_default():
+    default = mock.Mock()
+    vhosts = growler.VirtualHostRouter({'a.com': mock.Mock()}, default=default)
+    assert vhosts.lookup('b.com') is default
+
+
+def test_vhost_wraps_router(vhosts):
+    router = growler.Router()
+    app = vhosts.add('a.com', router)
+    assert isinstance(app, growler.Application)
+    assert app.middleware is router
+
+
+def test_vhost_call_dispatches(vhosts):
+    app = mock.Mock()
+    vhosts.add('a.com', app)
+    req, res = mock.Mock(headers={'HOST': 'a.com:80'}), mock.Mock()
+    assert vhosts(req, res) is app.start_client_request.return_value
+    app.start_client_request.assert_called_with(req, res)
+
+
+def test_vhost_call_unknown_host(vhosts):
+    req, res = mock.Mock(headers={'HOST': 'a.com'}), mock.Mock()
+    assert vhosts(req, res) is None
+
+
+def test_vhost_normalize_ipv6(vhosts):
+    assert vhosts.normalize_host('[::1]:8000') == '[::1]'
+
+
+def test_static_response_route(router):
+    router.get('/healthz', static_response='ok')
+    prebuilt = router.last().func
+    assert prebuilt.body == b'ok'
+
+    req, res = mock.Mock(), mock.Mock()
+    prebuilt(req, res)
+    res.send_prebuilt.assert_called_once_with(prebuilt)
+
+
+def test_static_response_with_middleware(router):
+    with pytest.raises(TypeError):
+        router.get('/healthz', lambda req, res: None, static_response='ok')